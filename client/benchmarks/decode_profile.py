@@ -0,0 +1,93 @@
+# Compares decoding a synthetic profile one record at a time against the bulk
+# columnar decoder used by Recorder._find_calls, and times building the call
+# tree from the decoded columns. Run it with the interpreter you care about,
+# e.g. ``pypy benchmarks/decode_profile.py [n_events]``, the default is 10M
+# events.
+
+from __future__ import print_function
+
+import array
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tracebin.calls import CallTreeBuilder
+from tracebin.events import (EventBuffer, EVENT, CALL_EVENT, RETURN_EVENT,
+    decode_segment)
+from tracebin.symbols import Symbol
+
+
+def make_profile(n_events):
+    # main() calls f() which calls g() and h(), over and over.
+    pattern = [
+        (CALL_EVENT, 1), (CALL_EVENT, 2), (RETURN_EVENT, 0), (CALL_EVENT, 3),
+        (RETURN_EVENT, 0), (RETURN_EVENT, 0),
+    ]
+    events = EventBuffer()
+    events.write(0.0, CALL_EVENT, 0)
+    timestamp = 0.0
+    for i in xrange((n_events - 2) // len(pattern)):
+        for event_id, symbol_id in pattern:
+            timestamp += 1e-7
+            events.write(timestamp, event_id, symbol_id)
+    events.write(timestamp, RETURN_EVENT, 0)
+    symbols = [Symbol(i, name, "x.py", i) for i, name in enumerate("mfgh")]
+    return events, symbols
+
+def segment_ends(events):
+    for segment in events.segments:
+        if segment is events.segments[-1]:
+            yield segment, events._offset
+        else:
+            yield segment, len(segment)
+
+def decode_per_record(events):
+    columns = []
+    for segment, end in segment_ends(events):
+        timestamps = array.array("d")
+        event_ids = array.array("I")
+        symbol_ids = array.array("I")
+        for offset in xrange(0, end, EVENT.size):
+            timestamp, event_id, symbol_id = EVENT.unpack_from(segment, offset)
+            timestamps.append(timestamp)
+            event_ids.append(event_id)
+            symbol_ids.append(symbol_id)
+        columns.append((timestamps, event_ids, symbol_ids))
+    return columns
+
+def decode_bulk(events):
+    return list(events.iter_columns())
+
+def build_tree(columns, symbols):
+    builder = CallTreeBuilder(symbols)
+    for timestamps, event_ids, symbol_ids in columns:
+        builder.feed(timestamps, event_ids, symbol_ids)
+    return builder.finish(float("inf"))
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+def main(argv):
+    n_events = int(argv[1]) if len(argv) > 1 else 10 * 1000 * 1000
+
+    print("Generating {:d} events".format(n_events))
+    events, symbols = make_profile(n_events)
+    print("{:d} events in {:d} segments".format(len(events), len(events.segments)))
+
+    per_record_time, per_record_columns = timed(decode_per_record, events)
+    del per_record_columns
+    bulk_time, columns = timed(decode_bulk, events)
+    tree_time, calls = timed(build_tree, columns, symbols)
+
+    print("{:>20} {:>10}".format("step", "seconds"))
+    print("{:>20} {:>10.3f}".format("decode per record", per_record_time))
+    print("{:>20} {:>10.3f}".format("decode bulk", bulk_time))
+    print("{:>20} {:>10.3f}".format("build tree", tree_time))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
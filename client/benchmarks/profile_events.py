@@ -0,0 +1,121 @@
+# Compares the cost of recording profile events with the EventBuffer against
+# the old mmap based writer it replaced. Run it with the interpreter you care
+# about, e.g. ``pypy benchmarks/profile_events.py``.
+
+from __future__ import print_function
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tracebin.events import EventBuffer, CALL_EVENT, RETURN_EVENT
+from tracebin.symbols import SymbolTable
+
+
+PROFILE_IDENTIFIER = 72
+
+
+class MmapWriter(object):
+    # This is what Recorder.on_profile used to do.
+    def __init__(self):
+        self.mmaps = []
+        self._new_mmap()
+
+    def _new_mmap(self):
+        self.current = mmap.mmap(-1, 4 * 1024 * 1024)
+        self.mmaps.append(self.current)
+
+    def on_profile(self, frame, event, arg):
+        timestamp = time.time()
+        if event == "call" or event == "c_call":
+            event_id = CALL_EVENT
+            if event == "call":
+                target = frame.f_code.co_name
+            elif event == "c_call":
+                target = arg.__name__
+            content = struct.pack("=dL", timestamp, len(target)) + target
+        elif event == "return" or event == "c_return" or event == "c_exception":
+            event_id = RETURN_EVENT
+            content = struct.pack("=d", timestamp)
+        else:
+            return
+
+        if self.current.tell() + len(content) + 2 > len(self.current):
+            self._new_mmap()
+        self.current.write_byte(chr(PROFILE_IDENTIFIER))
+        self.current.write_byte(chr(event_id))
+        self.current.write(content)
+
+
+class BufferWriter(object):
+    def __init__(self):
+        self.events = EventBuffer()
+        self.symbols = SymbolTable()
+
+    def on_profile(self, frame, event, arg):
+        timestamp = time.time()
+        if event == "call" or event == "c_call":
+            if event == "call":
+                symbol_id = self.symbols.lookup_code(frame.f_code)
+            elif event == "c_call":
+                symbol_id = self.symbols.lookup_builtin(arg)
+            self.events.write(timestamp, CALL_EVENT, symbol_id)
+        elif event == "return" or event == "c_return" or event == "c_exception":
+            self.events.write(timestamp, RETURN_EVENT, 0)
+
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+def workload():
+    fib(22)
+    for i in xrange(20000):
+        abs(i)
+
+def run(hook):
+    start = time.time()
+    sys.setprofile(hook)
+    try:
+        workload()
+    finally:
+        sys.setprofile(None)
+    return time.time() - start
+
+def count_events():
+    counter = [0]
+    def hook(frame, event, arg):
+        counter[0] += 1
+    run(hook)
+    return counter[0]
+
+def main(argv):
+    rounds = int(argv[1]) if len(argv) > 1 else 10
+    n_events = count_events()
+
+    results = {}
+    for name, writer_cls in [("mmap", MmapWriter), ("buffer", BufferWriter)]:
+        best = float("inf")
+        for i in xrange(rounds):
+            best = min(best, run(writer_cls().on_profile))
+        results[name] = best
+
+    best_baseline = min(run(None) for i in xrange(rounds))
+
+    print("{:d} events per run, best of {:d} runs".format(n_events, rounds))
+    print("{:>10} {:>12} {:>14}".format("writer", "seconds", "ns/event"))
+    print("{:>10} {:>12.4f} {:>14}".format("none", best_baseline, "-"))
+    for name in ["mmap", "buffer"]:
+        print("{:>10} {:>12.4f} {:>14.1f}".format(
+            name, results[name],
+            1e9 * (results[name] - best_baseline) / n_events
+        ))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
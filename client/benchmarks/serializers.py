@@ -0,0 +1,86 @@
+# Compares the speed and output size of the registered serializers on a
+# synthetic recording with a large call tree. Run it with the interpreter you
+# care about, e.g. ``pypy benchmarks/serializers.py [n_calls]``, the default is
+# 5M calls.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tracebin.calls import CallTree
+from tracebin.serializers import BaseSerializer
+from tracebin.symbols import Symbol
+
+
+class FakeRecorder(object):
+    def __init__(self, calls):
+        self.traces = []
+        self.aborts = []
+        self.calls = calls
+        self.symbols = calls.symbols
+        self.jit_events = None
+        self.options = {"build": {}, "jit": {}, "gc": {}}
+        self.runtime = 1.0
+        self.stdout = ""
+        self.stderr = ""
+
+    def iter_traces(self):
+        return iter(self.traces)
+
+    def visit(self, visitor):
+        return visitor.visit_recorder(self)
+
+
+def make_calls(n_calls):
+    # main() calls f() over and over, and f() calls g().
+    symbols = [Symbol(i, name, "x.py", i) for i, name in enumerate("mfg")]
+    tree = CallTree(symbols)
+    timestamp = 12345.678
+    tree.symbol_ids.append(0)
+    tree.start_times.append(timestamp)
+    tree.end_times.append(0.0)
+    tree.parents.append(-1)
+    tree.depths.append(0)
+    tree.sizes.append(n_calls)
+    for i in xrange(1, n_calls):
+        timestamp += 1.3e-7
+        tree.start_times.append(timestamp)
+        if i % 2:
+            tree.symbol_ids.append(1)
+            tree.end_times.append(timestamp + 1e-6)
+            tree.parents.append(0)
+            tree.depths.append(1)
+            tree.sizes.append(2 if i + 1 < n_calls else 1)
+        else:
+            tree.symbol_ids.append(2)
+            tree.end_times.append(timestamp + 5e-7)
+            tree.parents.append(i - 1)
+            tree.depths.append(2)
+            tree.sizes.append(1)
+    tree.end_times[0] = timestamp + 1e-6
+    return tree
+
+def main(argv):
+    n_calls = int(argv[1]) if len(argv) > 1 else 5 * 1000 * 1000
+    recorder = FakeRecorder(make_calls(n_calls))
+
+    print("{:d} calls".format(n_calls))
+    print("{:>10} {:>10} {:>10} {:>14}".format("format", "dump", "load", "bytes"))
+    for name, serializer_cls in sorted(BaseSerializer.ALL_SERIALIZERS.iteritems()):
+        start = time.time()
+        dump = serializer_cls(recorder).dump()
+        dump_time = time.time() - start
+
+        start = time.time()
+        serializer_cls.load(dump)
+        load_time = time.time() - start
+
+        print("{:>10} {:>10.3f} {:>10.3f} {:>14,d}".format(name, dump_time, load_time, len(dump)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,94 @@
+# Records loops from lots of functions in one module, then times splitting
+# them into sections and chunks with a shared CodeCache (what Recorder does),
+# and with the cache turned off, so every debug_merge_point disassembles its
+# code and reads its source again, then building them all with
+# materialize.build_traces in one process and in one per core. Needs PyPy,
+# ``pypy benchmarks/split_traces.py [n_loops]``, the default is 1000 loops.
+
+from __future__ import print_function
+
+import imp
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import tracebin
+from tracebin.codecache import CodeCache
+from tracebin.materialize import build_traces
+from tracebin.traces import PythonTrace
+
+
+def make_module(n_loops):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "loops.py")
+    with open(path, "w") as f:
+        for i in xrange(n_loops):
+            f.write(
+                "def loop_{i:d}(n):\n"
+                "    total = 0\n"
+                "    i = 0\n"
+                "    while i < n:\n"
+                "        total += i * {step:d}\n"
+                "        i += 1\n"
+                "    return total\n"
+                "\n".format(i=i, step=i % 7 + 1)
+            )
+    return directory, imp.load_source("loops", path)
+
+def record(module, n_loops):
+    with tracebin.record() as recorder:
+        for i in xrange(n_loops):
+            getattr(module, "loop_{:d}".format(i))(5000)
+    # The traces are only split when they're asked for, keep the raw ones.
+    return [data[1:] for data in recorder._pending_traces]
+
+def split(pending, code_cache):
+    return [
+        PythonTrace(greenkey, ops, asm, code_cache)
+        for greenkey, ops, asm, recorder_cache in pending
+    ]
+
+def build(pending, workers):
+    code_cache = CodeCache()
+    return list(build_traces(
+        [(PythonTrace,) + data[:3] + (code_cache,) for data in pending], workers
+    ))
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+def main(argv):
+    n_loops = int(argv[1]) if len(argv) > 1 else 1000
+
+    directory, module = make_module(n_loops)
+    try:
+        pending = record(module, n_loops)
+        print("{:d} loops recorded".format(len(pending)))
+
+        uncached_time, traces = timed(split, pending, CodeCache(size=0))
+        cache = CodeCache()
+        cached_time, traces = timed(split, pending, cache)
+        workers = multiprocessing.cpu_count()
+        serial_time, traces = timed(build, pending, 1)
+        parallel_time, traces = timed(build, pending, workers)
+    finally:
+        shutil.rmtree(directory)
+
+    print("{:>20} {:>10}".format("code cache", "seconds"))
+    print("{:>20} {:>10.3f}".format("off", uncached_time))
+    print("{:>20} {:>10.3f}".format("on", cached_time))
+    print("{:d} code objects cached".format(len(cache)))
+    print("{:>20} {:>10}".format("workers", "seconds"))
+    print("{:>20d} {:>10.3f}".format(1, serial_time))
+    print("{:>20d} {:>10.3f}".format(workers, parallel_time))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
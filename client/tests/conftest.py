@@ -8,7 +8,7 @@ from ConfigParser import ConfigParser
 
 import requests
 
-from tracebin.serializers import JSONSerializer
+from tracebin.serializers import JSONSerializer, BinarySerializer
 
 
 class TracebinServer(object):
@@ -78,4 +78,9 @@ def pytest_funcarg__server(request):
 
 def pytest_generate_tests(metafunc):
     if "serializer_cls" in metafunc.funcargnames:
-        metafunc.parametrize("serializer_cls", [JSONSerializer])
+        serializers = [JSONSerializer]
+        # The cmdline tests read the dump with capsys, as text, which mangles
+        # a binary one.
+        if metafunc.module.__name__.rpartition(".")[2] == "test_serialization":
+            serializers.append(BinarySerializer)
+        metafunc.parametrize("serializer_cls", serializers)
@@ -2,10 +2,13 @@ import subprocess
 import sys
 import textwrap
 import urlparse
+import zlib
 
 import py
 
 from tracebin import cmdline
+from tracebin.serializers import JSONSerializer
+from tracebin.spool import Spool
 
 
 class TestCommandLine(object):
@@ -56,12 +59,35 @@ class TestCommandLine(object):
         stdout, stderr = capsys.readouterr()
         assert not stderr
         data = serializer_cls.load(stdout)
-        assert data.viewkeys() == {"stdout", "stderr", "aborts", "runtime", "traces", "options", "calls", "command"}
+        assert data.viewkeys() == {"stdout", "stderr", "aborts", "runtime", "traces", "asm", "options", "calls", "jit_events", "command"}
         assert len(data["traces"]) == 1
         assert data["stdout"] == ""
         assert data["stderr"] == ""
         assert data["aborts"] == []
         assert data["calls"] is None
+        assert data["jit_events"] is None
+
+    def test_jit_events(self, tmpdir, capsys, monkeypatch, serializer_cls):
+        tmpdir.join("t.py").write(textwrap.dedent("""
+        def main():
+            for i in xrange(1500):
+                pass
+
+        if __name__ == "__main__":
+            main()
+        """))
+        # Already set, so --jit-events doesn't start over with its own.
+        monkeypatch.setenv("PYPYLOG", str(tmpdir.join("log")))
+        argv = [sys.executable, str(tmpdir.join("t.py")), "--action=dump", "--dump-format={}".format(serializer_cls.name)]
+
+        # Even with PYPYLOG set, it's only read when it's asked for.
+        assert cmdline.main(argv) == 0
+        stdout, stderr = capsys.readouterr()
+        assert serializer_cls.load(stdout)["jit_events"] is None
+
+        assert cmdline.main(argv + ["--jit-events"]) == 0
+        stdout, stderr = capsys.readouterr()
+        assert serializer_cls.load(stdout)["jit_events"] is not None
 
     def test_profile(self, tmpdir, capsys, serializer_cls):
         tmpdir.join("t.py").write(textwrap.dedent("""
@@ -84,4 +110,27 @@ class TestCommandLine(object):
 
         stdout, stderr = capsys.readouterr()
         data = serializer_cls.load(stdout)
-        assert data["calls"] is not None
\ No newline at end of file
+        assert data["calls"] is not None
+
+    def test_spool(self, tmpdir, capsys):
+        tmpdir.join("t.py").write(textwrap.dedent("""
+        def main():
+            for i in xrange(1500):
+                pass
+
+        if __name__ == "__main__":
+            main()
+        """))
+        spool_dir = tmpdir.join("spool")
+
+        res = cmdline.main(
+            [sys.executable, str(tmpdir.join("t.py")), "--action=spool", "--spool-dir={}".format(spool_dir), "--compression=zlib"]
+        )
+        assert res == 0
+
+        stdout, stderr = capsys.readouterr()
+        [line] = stdout.splitlines()
+        [path] = Spool(str(spool_dir))
+        assert line == path
+        data = JSONSerializer.load(zlib.decompress(open(path, "rb").read()))
+        assert len(data["traces"]) == 1
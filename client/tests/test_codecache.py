@@ -0,0 +1,42 @@
+import inspect
+
+from tracebin.codecache import CodeCache
+
+
+def f(n):
+    while n > 0:
+        n -= 1
+
+def g():
+    pass
+
+def h():
+    pass
+
+
+class TestCodeCache(object):
+    def test_lookup(self):
+        cache = CodeCache()
+        info = cache.lookup(f.__code__)
+        sourcelines, startline = inspect.getsourcelines(f)
+        assert info.sourcelines == sourcelines
+        assert info.startline == startline == f.__code__.co_firstlineno
+        assert set(info.linenos.itervalues()) <= {startline + 1, startline + 2}
+        assert cache.lookup(f.__code__) is info
+
+    def test_lru(self):
+        cache = CodeCache(size=2)
+        cache.lookup(f.__code__)
+        cache.lookup(g.__code__)
+        cache.lookup(f.__code__)
+        cache.lookup(h.__code__)
+        assert len(cache) == 2
+        assert f.__code__ in cache
+        assert g.__code__ not in cache
+        assert h.__code__ in cache
+
+    def test_disabled(self):
+        cache = CodeCache(size=0)
+        info = cache.lookup(f.__code__)
+        assert info.startline == f.__code__.co_firstlineno
+        assert len(cache) == 0
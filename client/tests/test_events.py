@@ -0,0 +1,80 @@
+import py
+
+from tracebin.events import (EventBuffer, SegmentConsumer, EVENT, CALL_EVENT,
+    RETURN_EVENT, decode_segment)
+
+
+class RecordingBuilder(object):
+    def __init__(self):
+        self.symbol_ids = []
+
+    def feed(self, timestamps, event_ids, symbol_ids):
+        self.symbol_ids.extend(symbol_ids)
+
+
+class FailingBuilder(object):
+    def feed(self, timestamps, event_ids, symbol_ids):
+        raise ValueError("feed")
+
+
+class TestEventBuffer(object):
+    def test_write(self):
+        events = EventBuffer()
+        events.write(1.5, CALL_EVENT, 3)
+        events.write(2.5, RETURN_EVENT, 0)
+
+        assert len(events) == 2
+        [(timestamps, event_ids, symbol_ids)] = events.iter_columns()
+        assert list(timestamps) == [1.5, 2.5]
+        assert list(event_ids) == [CALL_EVENT, RETURN_EVENT]
+        assert list(symbol_ids) == [3, 0]
+
+    def test_new_segment(self):
+        events = EventBuffer(segment_size=2 * EVENT.size)
+        for i in xrange(5):
+            events.write(float(i), CALL_EVENT, i)
+
+        assert len(events.segments) == 3
+        assert len(events) == 5
+        assert [
+            list(symbol_ids) for _, _, symbol_ids in events.iter_columns()
+        ] == [[0, 1], [2, 3], [4]]
+
+    def test_decode_segment(self):
+        segment = bytearray(4 * EVENT.size)
+        for i in xrange(3):
+            EVENT.pack_into(segment, i * EVENT.size, i * .5, i % 2, 2 ** 32 - 1 - i)
+
+        timestamps, event_ids, symbol_ids = decode_segment(segment, 3 * EVENT.size)
+        assert list(timestamps) == [0, .5, 1]
+        assert list(event_ids) == [0, 1, 0]
+        assert list(symbol_ids) == [2 ** 32 - 1, 2 ** 32 - 2, 2 ** 32 - 3]
+
+
+class TestSegmentConsumer(object):
+    def test_stream(self):
+        consumer = SegmentConsumer(RecordingBuilder(), max_segments=2)
+        consumer.start()
+        events = EventBuffer(segment_size=2 * EVENT.size, consumer=consumer)
+        for i in xrange(25):
+            events.write(float(i), CALL_EVENT, i)
+        events.flush()
+        consumer.close()
+
+        assert len(events) == 25
+        assert events.segments == []
+        assert consumer.builder.symbol_ids == range(25)
+        assert consumer._allocated_segments <= 2
+
+    def test_builder_fails(self):
+        consumer = SegmentConsumer(FailingBuilder(), max_segments=2)
+        consumer.start()
+        events = EventBuffer(segment_size=2 * EVENT.size, consumer=consumer)
+        # Far more segments than are ever allocated, which would hang if the
+        # consumer stopped recycling them.
+        for i in xrange(50):
+            events.write(float(i), CALL_EVENT, i)
+        events.flush()
+        with py.test.raises(ValueError):
+            consumer.close()
+        assert consumer._allocated_segments <= 2
@@ -8,6 +8,7 @@ import threading
 import py
 
 import tracebin
+from tracebin.materialize import build_traces
 
 
 class TestHook(object):
@@ -181,10 +182,9 @@ class TestHook(object):
         with tracebin.record(profile=True) as recorder:
             main()
 
-        assert len(recorder.calls) == 3
         # There are calls to high_res_time() before and after main, in order to
         # record the total execution time
-        [call1, call2, call3] = recorder.calls
+        [call1, call2, call3] = recorder.calls.roots()
 
         assert call1.func_name == "high_res_time"
         assert len(call1.subcalls) == 1
@@ -196,6 +196,78 @@ class TestHook(object):
         assert {c.func_name for c in call2.subcalls} == {"f"}
         assert call2.subcalls[1].subcalls[0].func_name == "g"
 
+    def test_profile_call_tree(self):
+        def g():
+            pass
+
+        def f():
+            g()
+            g()
+
+        def main():
+            f()
+            f()
+
+        with tracebin.record(profile=True) as recorder:
+            main()
+
+        [_, call, _] = recorder.calls.roots()
+        [f1, f2] = call.subcalls
+        assert f1.parent == call
+        assert f1.depth == call.depth + 1
+        assert [c.func_name for c in f2.subcalls] == ["g", "g"]
+
+        subtree = recorder.calls.subtree(call.index)
+        assert len(subtree) == 7
+        assert [c.func_name for c in subtree] == ["main", "f", "g", "g", "f", "g", "g"]
+        assert list(subtree.depths) == [0, 1, 2, 2, 1, 2, 2]
+        assert list(subtree.parents) == [-1, 0, 1, 1, 0, 4, 4]
+        [root] = subtree.roots()
+        assert root.start_time == call.start_time
+        assert root.end_time == call.end_time
+
+    def test_stream_profile(self):
+        def g():
+            pass
+
+        def f():
+            g()
+
+        def main():
+            for i in xrange(1500):
+                f()
+
+        with tracebin.record(profile=True, stream_profile=True) as recorder:
+            main()
+
+        [_, call, _] = recorder.calls.roots()
+        assert call.func_name == "main"
+        assert len(call.subcalls) == 1500
+        assert {c.func_name for c in call.subcalls} == {"f"}
+        assert call.subcalls[-1].subcalls[0].func_name == "g"
+        # The consumer's own loops don't show up as the user's traces.
+        assert {trace.root_function for trace in recorder.traces} == {"main"}
+
+    def test_sample_profile(self):
+        def busy(duration):
+            end = time.time() + duration
+            while time.time() < end:
+                pass
+
+        def f():
+            busy(.05)
+
+        def main():
+            f()
+            f()
+
+        with tracebin.record(sample=True, sample_interval=.001) as recorder:
+            main()
+
+        [call] = [c for c in recorder.calls.roots() if c.func_name == "main"]
+        assert [c.func_name for c in call.subcalls] == ["f", "f"]
+        assert .03 < call.subcalls[0].end_time - call.subcalls[0].start_time < .07
+
     def test_profile_exception(self):
         def f():
             raise ValueError
@@ -209,7 +281,7 @@ class TestHook(object):
         with tracebin.record(profile=True) as recorder:
             main()
 
-        [_, call, _] = recorder.calls
+        [_, call, _] = recorder.calls.roots()
 
         assert call.func_name == "main"
         [subcall] = call.subcalls
@@ -224,11 +296,43 @@ class TestHook(object):
             except TypeError:
                 pass
 
-        [_, call, _] = recorder.calls
+        [_, call, _] = recorder.calls.roots()
 
         assert call.func_name == "sqrt"
         assert call.subcalls == []
 
+    def test_profile_symbols(self):
+        def make_f():
+            def f():
+                pass
+            return f
+
+        f1 = make_f()
+        f2 = make_f()
+        def f():
+            pass
+
+        def main():
+            f1()
+            f2()
+            f()
+            [].append(1)
+            [].append(2)
+
+        with tracebin.record(profile=True) as recorder:
+            main()
+
+        [_, call, _] = recorder.calls.roots()
+        [f1_call, f2_call, f_call, append1_call, append2_call] = call.subcalls
+        assert f1_call.symbol is f2_call.symbol
+        assert f1_call.symbol is not f_call.symbol
+        assert f_call.func_name == f1_call.func_name == "f"
+        assert f1_call.symbol.lineno == make_f.__code__.co_firstlineno + 1
+        assert f_call.symbol.lineno == f.__code__.co_firstlineno
+        assert f_call.symbol.filename == __file__
+        assert append1_call.symbol is append2_call.symbol
+        assert append1_call.func_name == "append"
+
     def test_trace_profilehook(self):
         def profile(frame, event, arg):
             pass
@@ -256,4 +360,72 @@ class TestHook(object):
             """            pass\n""",
         ]
         op_profile_chunk = loop.chunks[10]
-        assert op_profile_chunk.get_op_names() == ["debug_merge_point", "debug_merge_point"]
\ No newline at end of file
+        assert op_profile_chunk.get_op_names() == ["debug_merge_point", "debug_merge_point"]
+
+    def test_iter_traces_filter(self):
+        def f(n):
+            while n > 0:
+                n -= 1
+        def g(n):
+            while n > 0:
+                n -= 1
+
+        with tracebin.record() as recorder:
+            f(1500)
+            g(1500)
+
+        [trace] = recorder.iter_traces(root_function="g")
+        assert trace.root_function == "g"
+        assert list(recorder.iter_traces(root_file="<nowhere>")) == []
+        # f was never built, g was and is kept.
+        assert len(recorder._pending_traces) == 1
+        assert recorder._traces == [trace]
+
+    def test_parallel_traces(self):
+        loops = []
+        for i in xrange(20):
+            exec "def f{0}(n):\n    while n > 0:\n        n -= 1\n".format(i) in globals()
+            loops.append(globals()["f{0}".format(i)])
+
+        with tracebin.record(workers=2) as recorder:
+            for loop in loops:
+                loop(1500)
+
+        def op_names(traces):
+            return [
+                [[chunk.get_op_names() for chunk in section.chunks] for section in trace.sections]
+                for trace in traces
+            ]
+        pending = list(recorder._pending_traces)
+        parallel = list(recorder.iter_traces())
+        assert [trace.root_function for trace in parallel] == ["f{0}".format(i) for i in xrange(20)]
+        assert op_names(parallel) == op_names(build_traces(pending, workers=1))
+
+    def test_traces_built_once(self):
+        def f(n):
+            while n > 0:
+                n -= 1
+
+        with tracebin.record() as recorder:
+            f(1500)
+
+        [trace] = recorder.iter_traces()
+        assert recorder.traces == [trace]
+        assert list(recorder.iter_traces()) == [trace]
+        assert recorder._pending_traces == []
+
+    def test_jit_events(self, tmpdir, monkeypatch):
+        with tracebin.record() as recorder:
+            pass
+        assert recorder.jit_events is None
+
+        # PyPy only logs to the PYPYLOG it was started with, this one stays
+        # empty.
+        monkeypatch.setenv("PYPYLOG", "gc:" + str(tmpdir.join("log")))
+        with tracebin.record() as recorder:
+            pass
+        # Only read when they're asked for, it can be a big file.
+        assert recorder.jit_events is None
+        with tracebin.record(jit_events=True) as recorder:
+            pass
+        assert len(recorder.jit_events) == 0
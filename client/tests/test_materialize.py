@@ -0,0 +1,35 @@
+import os
+
+from tracebin.materialize import build_traces, MIN_PARALLEL_TRACES
+
+
+class FakeTrace(object):
+    def __init__(self, n):
+        self.n = n
+        self.pid = os.getpid()
+
+
+class TestBuildTraces(object):
+    def test_serial(self):
+        pending = [(FakeTrace, i) for i in xrange(MIN_PARALLEL_TRACES)]
+        traces = list(build_traces(pending, workers=1))
+        assert [trace.n for trace in traces] == range(MIN_PARALLEL_TRACES)
+        assert {trace.pid for trace in traces} == {os.getpid()}
+
+    def test_parallel(self):
+        pending = [(FakeTrace, i) for i in xrange(MIN_PARALLEL_TRACES * 4)]
+        traces = list(build_traces(pending, workers=2))
+        assert [trace.n for trace in traces] == range(MIN_PARALLEL_TRACES * 4)
+        assert os.getpid() not in {trace.pid for trace in traces}
+
+    def test_few_traces(self):
+        pending = [(FakeTrace, i) for i in xrange(2)]
+        traces = list(build_traces(pending, workers=2))
+        assert [trace.n for trace in traces] == [0, 1]
+        assert {trace.pid for trace in traces} == {os.getpid()}
+
+    def test_stop_early(self):
+        pending = [(FakeTrace, i) for i in xrange(MIN_PARALLEL_TRACES * 4)]
+        traces = build_traces(pending, workers=2)
+        assert next(traces).n == 0
+        traces.close()
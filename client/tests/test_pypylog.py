@@ -0,0 +1,94 @@
+import io
+
+from tracebin.pypylog import PyPyLog, log_path, parse_events
+
+
+def events(log):
+    result = parse_events(io.BytesIO(log))
+    return [
+        (result.event_types[event_id], start_time, end_time)
+        for event_id, start_time, end_time in zip(result.event_ids, result.start_times, result.end_times)
+    ]
+
+
+class TestLogPath(object):
+    def test_file(self):
+        assert log_path("/tmp/log") == "/tmp/log"
+        assert log_path("jit-log-opt,gc:/tmp/log") == "/tmp/log"
+
+    def test_not_a_file(self):
+        assert log_path(None) is None
+        assert log_path("") is None
+        assert log_path("jit:-") is None
+
+
+class TestParseEvents(object):
+    def test_sections(self):
+        assert events(
+            "[10] {gc-minor\n"
+            "[20] gc-minor}\n"
+            "[30] {jit-tracing\n"
+            "[50] jit-tracing}\n"
+        ) == [("gc-minor", 16, 32), ("jit-tracing", 48, 80)]
+
+    def test_nested(self):
+        # The outer section's time is split around the inner one's.
+        assert events(
+            "[10] {tracebin-record\n"
+            "[20] {jit-tracing\n"
+            "[30] {jit-backend\n"
+            "[38] jit-backend}\n"
+            "[40] jit-tracing}\n"
+            "[50] {gc-collect\n"
+            "[60] gc-collect}\n"
+            "[70] tracebin-record}\n"
+        ) == [
+            ("running", 0x10, 0x20),
+            ("jit-tracing", 0x20, 0x30),
+            ("jit-backend", 0x30, 0x38),
+            ("jit-tracing", 0x38, 0x40),
+            ("running", 0x40, 0x50),
+            ("gc-major", 0x50, 0x60),
+            ("running", 0x60, 0x70),
+        ]
+
+    def test_skipped(self):
+        # Other sections count towards the section they're in, and what's
+        # logged inside sections is skipped.
+        assert events(
+            "[10] {jit-tracing\n"
+            "[11] {jit-log-noopt-loop\n"
+            "[p0, p1]\n"
+            "i3 = int_add(i1, 1)\n"
+            "[12] jit-log-noopt-loop}\n"
+            "[20] jit-tracing}\n"
+        ) == [("jit-tracing", 0x10, 0x20)]
+
+    def test_threads(self):
+        assert events(
+            "[2a:10] {gc-minor\n"
+            "[2a:20] gc-minor}\n"
+        ) == [("gc-minor", 0x10, 0x20)]
+
+    def test_unfinished(self):
+        assert events(
+            "[10] {jit-tracing\n"
+            "[20] {gc-minor\n"
+            "[28] {jit-log-opt-loop\n"
+        ) == [("jit-tracing", 0x10, 0x20), ("gc-minor", 0x20, 0x28)]
+
+
+class TestPyPyLog(object):
+    def test_read_events(self, tmpdir):
+        path = tmpdir.join("log")
+        path.write("[1] {gc-minor\n[2] gc-minor}\n")
+        log = PyPyLog(str(path))
+        path.write("[10] {gc-minor\n[20] gc-minor}\n[30] {jit-tracing\n", mode="a")
+        log.finish()
+        path.write("[40] jit-tracing}\n", mode="a")
+        # Only what was written in between, the jit-tracing section hadn't
+        # got anywhere yet.
+        events = log.read_events()
+        assert events.event_types == ["gc-minor"]
+        assert list(events.start_times) == [0x10]
+        assert list(events.end_times) == [0x20]
@@ -0,0 +1,76 @@
+from tracebin.resops import ResOpEncoder
+
+
+class FakeValue(object):
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return self.text
+
+
+class FakeOp(object):
+    def __init__(self, result, name, args, descr=None, fail_args=None):
+        self.result = None if result is None else FakeValue(result)
+        self.name = name
+        self._args = [FakeValue(arg) for arg in args]
+        self._descr = None if descr is None else FakeValue(descr)
+        self._fail_args = None if fail_args is None else [FakeValue(arg) for arg in fail_args]
+
+    def numargs(self):
+        return len(self._args)
+
+    def getarg(self, i):
+        return self._args[i]
+
+    def getdescr(self):
+        return self._descr
+
+    def getfailargs(self):
+        return self._fail_args
+
+
+class TestResOpEncoder(object):
+    def test_encode(self):
+        encoder = ResOpEncoder()
+        first = encoder.encode([
+            FakeOp("i3", "int_lt", ["i1", "i2"]),
+            FakeOp(None, "guard_true", ["i3"], "<Guard3>", ["p0"]),
+        ])
+        second = encoder.encode([
+            FakeOp("i4", "int_lt", ["i3", "i2"]),
+            FakeOp(None, "guard_true", ["i4"], "<Guard3>", ["p0"]),
+            FakeOp(None, "jump", ["i4", "i2"], "TargetToken(7)"),
+        ])
+        assert encoder.opnames == ["int_lt", "guard_true", "jump"]
+        assert encoder.descrs == ["<Guard3>", "TargetToken(7)"]
+        assert encoder.values == ["i3", "i1", "i2", "p0", "i4"]
+        assert first == {
+            "opcodes": [0, 1],
+            "results": [0, None],
+            "args": [[1, 2], [0]],
+            "descrs": [None, 0],
+            "fail_args": [None, [3]],
+        }
+        assert second == {
+            "opcodes": [0, 1, 2],
+            "results": [4, None, None],
+            "args": [[0, 2], [4], [4, 2]],
+            "descrs": [None, 0, 1],
+            "fail_args": [None, [3], None],
+        }
+
+    def test_brackets_and_commas(self):
+        # Which used to be taken apart from the op's repr.
+        encoder = ResOpEncoder()
+        ops = encoder.encode([
+            FakeOp(None, "debug_merge_point", ["0", "'<code object f, file 'x.py', line 1> #9 LOAD_FAST'"]),
+            FakeOp("p3", "call", ["ConstClass(f)", "p1"], "<Call(r, [i, p])>", ["p1", "i2]"]),
+        ])
+        assert encoder.values == [
+            "0", "'<code object f, file 'x.py', line 1> #9 LOAD_FAST'",
+            "p3", "ConstClass(f)", "p1", "i2]",
+        ]
+        assert encoder.descrs == ["<Call(r, [i, p])>"]
+        assert ops["args"] == [[0, 1], [3, 4]]
+        assert ops["fail_args"] == [None, [4, 5]]
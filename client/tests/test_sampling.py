@@ -0,0 +1,61 @@
+import weakref
+
+from tracebin.calls import CallTreeBuilder
+from tracebin.events import EventBuffer
+from tracebin.sampling import StackSampler
+from tracebin.symbols import SymbolTable
+
+
+class FakeFrame(object):
+    def __init__(self, f_back, f_code):
+        self.f_back = f_back
+        self.f_code = f_code
+
+
+class TestStackSampler(object):
+    def test_sample(self):
+        def main():
+            pass
+        def f():
+            pass
+        def g():
+            pass
+
+        base = FakeFrame(None, main.__code__)
+        events = EventBuffer()
+        symbols = SymbolTable()
+        sampler = StackSampler(events, symbols, None, base)
+
+        main_frame = FakeFrame(base, main.__code__)
+        f_frame = FakeFrame(main_frame, f.__code__)
+        sampler.sample(1.0, f_frame)
+        sampler.sample(2.0, FakeFrame(f_frame, g.__code__))
+        sampler.sample(3.0, FakeFrame(main_frame, f.__code__))
+        sampler.sample(4.0, main_frame)
+
+        builder = CallTreeBuilder(symbols)
+        for columns in events.iter_columns():
+            builder.feed(*columns)
+        tree = builder.finish(5.0)
+
+        [main_call] = tree.roots()
+        assert main_call.func_name == "main"
+        assert (main_call.start_time, main_call.end_time) == (1.0, 5.0)
+        [f1_call, f2_call] = main_call.subcalls
+        assert (f1_call.start_time, f1_call.end_time) == (1.0, 3.0)
+        assert (f2_call.start_time, f2_call.end_time) == (3.0, 4.0)
+        [g_call] = f1_call.subcalls
+        assert g_call.func_name == "g"
+        assert (g_call.start_time, g_call.end_time) == (2.0, 3.0)
+
+    def test_frames_not_kept(self):
+        def main():
+            pass
+
+        base = FakeFrame(None, main.__code__)
+        sampler = StackSampler(EventBuffer(), SymbolTable(), None, base)
+        frame = FakeFrame(base, main.__code__)
+        ref = weakref.ref(frame)
+        sampler.sample(1.0, frame)
+        del frame
+        assert ref() is None
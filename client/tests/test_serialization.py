@@ -1,4 +1,8 @@
+import base64
+import hashlib
+import io
 import sys
+import zlib
 
 import py
 
@@ -12,7 +16,8 @@ class TestSerialization(object):
 
         serializer = serializer_cls(recorder)
         data = serializer.get_data()
-        assert data.viewkeys() == {"traces", "aborts", "runtime", "stdout", "stderr", "options", "calls"}
+        assert data.viewkeys() == {"traces", "aborts", "asm", "runtime", "stdout", "stderr", "options", "calls", "jit_events"}
+        assert data["jit_events"] is None
         assert data["calls"] is None
         dump = serializer.dump()
         assert data == serializer_cls.load(dump)
@@ -23,7 +28,25 @@ class TestSerialization(object):
                 pass
 
         serializer = serializer_cls(recorder)
-        serializer.dump()
+        data = serializer.load(serializer.dump())
+        [trace] = data["traces"]
+        [block] = data["asm"]
+        assert trace["asm_hash"] == block["hash"] == hashlib.sha1(recorder.traces[0].asm).hexdigest()
+        assert trace["asm_size"] == block["size"] == len(recorder.traces[0].asm) > 0
+        assert zlib.decompress(base64.b64decode(block["data"])) == recorder.traces[0].asm
+
+    def test_asm_deduplicated(self, serializer_cls):
+        with tracebin.record() as recorder:
+            for i in xrange(1500):
+                pass
+        # The same loop twice.
+        recorder._pending_traces.append(recorder._pending_traces[0])
+
+        serializer = serializer_cls(recorder)
+        data = serializer.load(serializer.dump())
+        assert len(data["traces"]) == 2
+        assert data["traces"][0]["asm_hash"] == data["traces"][1]["asm_hash"]
+        assert len(data["asm"]) == 1
 
     def test_abort(self, serializer_cls):
         with tracebin.record() as recorder:
@@ -48,5 +71,39 @@ class TestSerialization(object):
         dump = serializer.dump()
         data = serializer.load(dump)
 
-        assert len(data["calls"]) == 3
-        assert len(data["calls"][1]["subcalls"]) == 3
\ No newline at end of file
+        calls = data["calls"]
+        assert len(calls["symbol_ids"]) == len(calls["start_times"]) == len(calls["end_times"]) == len(calls["parents"]) == len(calls["depths"])
+        roots = [i for i, parent in enumerate(calls["parents"]) if parent == -1]
+        assert len(roots) == 3
+        main_index = roots[1]
+        main_symbol = calls["symbols"][calls["symbol_ids"][main_index]]
+        assert main_symbol == {
+            "name": "main",
+            "filename": __file__,
+            "lineno": main.__code__.co_firstlineno,
+        }
+        subcalls = [i for i, parent in enumerate(calls["parents"]) if parent == main_index]
+        assert len(subcalls) == 3
+        assert {calls["depths"][i] for i in subcalls} == {1}
+        assert len({calls["symbol_ids"][i] for i in subcalls}) == 1
+
+    def test_dump_to(self, serializer_cls):
+        def f():
+            pass
+        def main():
+            for i in xrange(1500):
+                f()
+            sys.exc_info()
+
+        with tracebin.record(profile=True) as recorder:
+            main()
+
+        serializer = serializer_cls(recorder)
+        f = io.BytesIO()
+        serializer.dump_to(f, extra_data={"command": "pypy x.py"})
+        data = serializer_cls.load(f.getvalue())
+
+        assert data == serializer_cls.load(serializer.dump(extra_data={"command": "pypy x.py"}))
+        assert data["command"] == "pypy x.py"
+        assert len(data["traces"]) == len(recorder.traces)
+        assert len(data["calls"]["start_times"]) == len(recorder.calls)
@@ -0,0 +1,125 @@
+import BaseHTTPServer
+import gzip
+import threading
+import zlib
+from cStringIO import StringIO
+
+from tracebin.spool import Spool, SpoolDrainer
+
+
+class StandInServer(object):
+    # Stands in for the tracebin server, answers uploads with the statuses in
+    # ``statuses`` (and then 302s) and keeps the bodies it got.
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.uploads = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-length"]))
+                with server.lock:
+                    status = server.statuses.pop(0) if server.statuses else 302
+                    if status == 302:
+                        server.uploads.append((self.headers["Content-encoding"], body))
+                        location = "/trace/{:d}/".format(len(server.uploads))
+                self.send_response(status)
+                if status == 302:
+                    self.send_header("Location", location)
+                self.send_header("Content-length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = BaseHTTPServer.HTTPServer(("localhost", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://localhost:{:d}/trace/new/".format(self.httpd.server_port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestSpool(object):
+    def test_add(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        path = spool.add(["{", "}"], codec="zlib")
+
+        assert list(spool) == [path]
+        assert Spool.codec(path) == "zlib"
+        assert zlib.decompress(open(path, "rb").read()) == "{}"
+        assert tmpdir.join("tmp").listdir() == []
+
+    def test_order(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        paths = [spool.add(["{}"]) for i in xrange(3)]
+        assert list(spool) == paths
+
+
+class TestSpoolDrainer(object):
+    def test_drain(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        paths = [spool.add(['{"i": %d}' % i]) for i in xrange(5)]
+        with StandInServer() as server:
+            results = SpoolDrainer(spool, server.url, concurrency=2).drain()
+
+        assert sorted(results) == paths
+        assert sorted(results.itervalues()) == [
+            "/trace/{:d}/".format(i) for i in xrange(1, 6)
+        ]
+        assert list(spool) == []
+        bodies = sorted(
+            gzip.GzipFile(fileobj=StringIO(body)).read()
+            for encoding, body in server.uploads
+        )
+        assert bodies == ['{"i": %d}' % i for i in xrange(5)]
+        assert {encoding for encoding, body in server.uploads} == {"gzip"}
+
+    def test_retry(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        path = spool.add(["{}"], codec="zlib")
+        with StandInServer(statuses=[503, 500]) as server:
+            results = SpoolDrainer(spool, server.url, backoff=0).drain()
+
+        assert results == {path: "/trace/1/"}
+        assert server.uploads == [("deflate", zlib.compress("{}", 6))]
+        assert list(spool) == []
+
+    def test_retries_exhausted(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        path = spool.add(["{}"])
+        with StandInServer(statuses=[503] * 3) as server:
+            results = SpoolDrainer(spool, server.url, retries=2, backoff=0).drain()
+
+        assert results == {path: None}
+        assert list(spool) == [path]
+
+    def test_rejected(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        path = spool.add(["{}"])
+        with StandInServer(statuses=[400]) as server:
+            results = SpoolDrainer(spool, server.url, backoff=0).drain()
+
+        assert results == {path: None}
+        assert list(spool) == []
+        assert tmpdir.join("failed").listdir() == [tmpdir.join("failed", path.rsplit("/", 1)[1])]
+
+    def test_server_down(self, tmpdir):
+        spool = Spool(str(tmpdir))
+        path = spool.add(["{}"])
+        with StandInServer() as server:
+            url = server.url
+        results = SpoolDrainer(spool, url, retries=1, backoff=0).drain()
+
+        assert results == {path: None}
+        assert list(spool) == [path]
@@ -0,0 +1,53 @@
+import gzip
+import zlib
+from cStringIO import StringIO
+
+from tracebin import upload
+
+
+class FakeResponse(object):
+    def __init__(self, headers):
+        self.headers = headers
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.requests = []
+
+    def post(self, url, data, headers, allow_redirects):
+        self.requests.append((url, "".join(data), headers))
+        return FakeResponse({"Location": "http://localhost/trace/1/"})
+
+
+class TestCompression(object):
+    def test_zlib(self):
+        chunks = ["abc" * 1000, "", "def" * 50000]
+        data = "".join(upload.compress_chunks(chunks, codec="zlib"))
+        assert zlib.decompress(data) == "".join(chunks)
+
+    def test_gzip(self):
+        chunks = ["abc" * 1000, "", "def" * 50000]
+        data = "".join(upload.compress_chunks(chunks, codec="gzip"))
+        assert gzip.GzipFile(fileobj=StringIO(data)).read() == "".join(chunks)
+
+    def test_empty(self):
+        data = "".join(upload.compress_chunks([], codec="zlib"))
+        assert zlib.decompress(data) == ""
+
+
+class TestUpload(object):
+    def test_upload(self):
+        session = FakeSession()
+        location = upload.upload("http://localhost/trace/new/", iter(["{}"]), session=session)
+        assert location == "http://localhost/trace/1/"
+
+        [(url, data, headers)] = session.requests
+        assert url == "http://localhost/trace/new/"
+        assert headers == {
+            "Content-type": "application/json",
+            "Content-encoding": "gzip",
+        }
+        assert gzip.GzipFile(fileobj=StringIO(data)).read() == "{}"
@@ -1,13 +1,151 @@
+import array
+from itertools import izip
+
+from tracebin.events import CALL_EVENT, RETURN_EVENT
+
+
+class CallTree(object):
+    # Calls are stored column-wise, in the order they were called (pre-order),
+    # so a call's subtree is always the contiguous range
+    # [index, index + sizes[index]). Parents are indices into the same arrays,
+    # -1 for calls at the top of the stack.
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.symbol_ids = array.array("I")
+        self.start_times = array.array("d")
+        self.end_times = array.array("d")
+        self.parents = array.array("i")
+        self.depths = array.array("I")
+        self.sizes = array.array("I")
+
+    def __len__(self):
+        return len(self.start_times)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield PythonCall(self, index)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return PythonCall(self, index)
+
+    def roots(self):
+        return list(self._siblings(0, len(self)))
+
+    def _siblings(self, start, end):
+        index = start
+        while index < end:
+            yield PythonCall(self, index)
+            index += self.sizes[index]
+
+    def subtree(self, index):
+        end = index + self.sizes[index]
+        base_depth = self.depths[index]
+        tree = CallTree(self.symbols)
+        tree.symbol_ids = self.symbol_ids[index:end]
+        tree.start_times = self.start_times[index:end]
+        tree.end_times = self.end_times[index:end]
+        tree.parents = array.array("i", [-1] + [
+            parent - index for parent in self.parents[index + 1:end]
+        ])
+        tree.depths = array.array("I", [
+            depth - base_depth for depth in self.depths[index:end]
+        ])
+        tree.sizes = self.sizes[index:end]
+        return tree
+
+    def visit(self, visitor):
+        return visitor.visit_call_tree(self)
+
+
 class BaseCall(object):
-    def __init__(self, start_time, end_time, subcalls):
-        self.start_time = start_time
-        self.end_time = end_time
-        self.subcalls = subcalls
+    # A view of a single call in a CallTree, these are only created on demand.
+    __slots__ = ["tree", "index"]
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            type(self) is type(other) and
+            self.tree is other.tree and
+            self.index == other.index
+        )
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    @property
+    def start_time(self):
+        return self.tree.start_times[self.index]
+
+    @property
+    def end_time(self):
+        return self.tree.end_times[self.index]
+
+    @property
+    def depth(self):
+        return self.tree.depths[self.index]
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        if parent == -1:
+            return None
+        return type(self)(self.tree, parent)
+
+    @property
+    def subcalls(self):
+        return list(self.tree._siblings(self.index + 1, self.index + self.tree.sizes[self.index]))
 
 class PythonCall(BaseCall):
-    def __init__(self, func_name, start_time, end_time, subcalls):
-        super(PythonCall, self).__init__(start_time, end_time, subcalls)
-        self.func_name = func_name
+    __slots__ = []
 
-    def visit(self, visitor):
-        return visitor.visit_python_call(self)
\ No newline at end of file
+    @property
+    def symbol(self):
+        return self.tree.symbols[self.tree.symbol_ids[self.index]]
+
+    @property
+    def func_name(self):
+        return self.symbol.name
+
+
+class CallTreeBuilder(object):
+    def __init__(self, symbols):
+        self.tree = CallTree(symbols)
+        self._stack = []
+
+    def feed(self, timestamps, event_ids, symbol_ids):
+        tree = self.tree
+        stack = self._stack
+        index = len(tree)
+        for timestamp, event_id, symbol_id in izip(timestamps, event_ids, symbol_ids):
+            if event_id == CALL_EVENT:
+                tree.symbol_ids.append(symbol_id)
+                tree.start_times.append(timestamp)
+                # Filled in when the call returns.
+                tree.end_times.append(0.0)
+                tree.sizes.append(0)
+                tree.parents.append(stack[-1] if stack else -1)
+                tree.depths.append(len(stack))
+                stack.append(index)
+                index += 1
+            elif event_id == RETURN_EVENT:
+                if not stack:
+                    # The function where the profile hook was enabled (and
+                    # everything up the stack from there) will have returns
+                    # recorded, but no call, so we ignore them.
+                    continue
+                call_index = stack.pop()
+                tree.end_times[call_index] = timestamp
+                tree.sizes[call_index] = index - call_index
+
+    def finish(self, end_time):
+        tree = self.tree
+        while self._stack:
+            call_index = self._stack.pop()
+            tree.end_times[call_index] = end_time
+            tree.sizes[call_index] = len(tree) - call_index
+        return tree
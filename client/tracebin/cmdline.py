@@ -1,17 +1,19 @@
 from __future__ import print_function
 
 import argparse
+import os
 import runpy
 import sys
-import zlib
-from ConfigParser import ConfigParser
+import tempfile
 
 import logbook
 
-import requests
-
+from tracebin.config import load_config, upload_url
 from tracebin.recorder import record
+from tracebin.sampling import DEFAULT_INTERVAL
 from tracebin.serializers import BaseSerializer
+from tracebin.spool import Spool
+from tracebin.upload import upload, CODECS
 from tracebin.utils import get_current_command
 
 
@@ -20,15 +22,37 @@ def main(argv):
     parser.add_argument("file")
     parser.add_argument("--config", type=argparse.FileType("r"))
     parser.add_argument(
-        "--action", choices={"upload", "dump"}, default="upload",
+        "--action", choices={"upload", "dump", "spool"}, default="upload",
     )
     parser.add_argument(
         "--profile", action="store_true",
     )
+    parser.add_argument(
+        "--stream-profile", action="store_true",
+    )
+    parser.add_argument(
+        "--sample", action="store_true",
+    )
+    parser.add_argument(
+        "--sample-interval", type=float, default=DEFAULT_INTERVAL,
+    )
+    parser.add_argument(
+        "--jit-events", action="store_true",
+    )
 
     parser.add_argument(
         "--dump-format", choices=BaseSerializer.ALL_SERIALIZERS.viewkeys(),
     )
+    parser.add_argument(
+        "--compression", choices=CODECS.viewkeys(),
+    )
+    parser.add_argument(
+        "--compression-level", type=int, choices=range(1, 10),
+    )
+    parser.add_argument("--spool-dir")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+    )
 
     parser.add_argument(
         "-v", "--verbose", action="store_true",
@@ -39,53 +63,67 @@ def main(argv):
 
     logger = logbook.Logger(level=logbook.INFO if args.verbose else logbook.WARNING)
 
+    if args.action != "spool" and args.spool_dir:
+        parser.error("--spool-dir can only be used with --action=spool")
     if args.action != "dump" and args.dump_format:
         parser.error()
+    if args.sample and args.profile:
+        parser.error("--sample and --profile can't be used together")
 
-    config = ConfigParser()
+    if args.jit_events and "PYPYLOG" not in os.environ:
+        # PyPy only looks at PYPYLOG when it starts, so start over with it
+        # set. Without a filter, only the sections' timestamps are logged.
+        fd, path = tempfile.mkstemp(prefix="tracebin-", suffix=".pypylog")
+        os.close(fd)
+        env = dict(os.environ, PYPYLOG=path, TRACEBIN_PYPYLOG=path)
+        os.execve(sys.executable, [sys.executable, "-m", "tracebin"] + argv[1:], env)
 
-    # Setup some defaults, eventually there should be some sort of better
-    # abstraction for this.
-    config.add_section("server")
-    config.set("server", "host", "localhost")
-    config.set("server", "port", "8000")
+    config = load_config(args.config)
 
-    if args.config:
-        with args.config:
-            config.readfp(args.config)
+    if args.compression is not None:
+        config.set("upload", "compression", args.compression)
+    if args.compression_level is not None:
+        config.set("upload", "compression_level", str(args.compression_level))
 
     command = get_current_command()
 
     logger.info("Starting running")
-    with record(logger=logger, profile=args.profile) as recorder:
+    profile = args.profile or (args.stream_profile and not args.sample)
+    with record(logger=logger, profile=profile, stream_profile=args.stream_profile,
+        sample=args.sample, sample_interval=args.sample_interval, workers=args.jobs,
+        jit_events=args.jit_events) as recorder:
         runpy.run_path(args.file, run_name="__main__")
     logger.info("User program finished")
+    # If it's the log we started over for, the recorder's done with it.
+    pypylog = os.environ.get("TRACEBIN_PYPYLOG")
+    if pypylog is not None and pypylog == os.environ.get("PYPYLOG"):
+        os.remove(pypylog)
 
     serializer_cls = BaseSerializer.ALL_SERIALIZERS[args.dump_format if args.dump_format else "json"]
     serializer = serializer_cls(recorder)
 
-    logger.info("Starting serialization")
-    dump = serializer.dump(extra_data={"command": command})
-    logger.info("Serialization finished")
     if args.action == "dump":
-        print(dump)
+        logger.info("Starting serialization")
+        serializer.dump_to(sys.stdout, extra_data={"command": command})
+        logger.info("Serialization finished")
     elif args.action == "upload":
-        url = "http://{}:{}/trace/new/".format(config.get("server", "host"), config.getint("server", "port"))
         logger.info("Starting upload")
-
-        # level 9 is the slowest, but compresses best.
-        data = zlib.compress(dump, level=9)
-
-        response = requests.post(url,
-            data=dump,
-            headers={
-                "Content-type": "application/json",
-                "Content-encoding": "gzip",
-            },
-            allow_redirects=False,
+        location = upload(upload_url(config), serializer.iter_dump(extra_data={"command": command}),
+            codec=config.get("upload", "compression"),
+            level=config.getint("upload", "compression_level"),
         )
         logger.info("Upload finished")
-        response.raise_for_status()
-        print(response.headers["Location"])
+        print(location)
+    elif args.action == "spool":
+        # Returns as soon as the recording is on disk, ``python -m
+        # tracebin.spool`` uploads it later.
+        spool = Spool(args.spool_dir or config.get("spool", "directory"))
+        logger.info("Starting spooling")
+        path = spool.add(serializer.iter_dump(extra_data={"command": command}),
+            codec=config.get("upload", "compression"),
+            level=config.getint("upload", "compression_level"),
+        )
+        logger.info("Spooling finished")
+        print(path)
 
     return 0
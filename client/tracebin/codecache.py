@@ -0,0 +1,48 @@
+import inspect
+from collections import OrderedDict, namedtuple
+
+import disassembler
+
+
+DEFAULT_SIZE = 1024
+
+CodeInfo = namedtuple("CodeInfo", ["sourcelines", "startline", "linenos"])
+
+
+class CodeCache(object):
+    # What splitting traces needs to know about a code object: its source, and
+    # the line each bytecode is on. Disassembling, and reading the source
+    # (inspect tokenizes the whole file each time), are slow, and the same code
+    # turns up in lots of traces, so a recorder shares one of these between
+    # all of them. It holds at most ``size`` code objects, the least recently
+    # used are dropped first.
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self._infos = OrderedDict()
+
+    def __len__(self):
+        return len(self._infos)
+
+    def __contains__(self, code):
+        return code in self._infos
+
+    def lookup(self, code):
+        try:
+            info = self._infos.pop(code)
+        except KeyError:
+            info = self._load(code)
+            if self.size <= 0:
+                return info
+            if len(self._infos) >= self.size:
+                self._infos.popitem(last=False)
+        self._infos[code] = info
+        return info
+
+    @staticmethod
+    def _load(code):
+        sourcelines, startline = inspect.getsourcelines(code)
+        linenos = dict(
+            (bytecode_no, op.lineno)
+            for bytecode_no, op in disassembler.dis(code).map.iteritems()
+        )
+        return CodeInfo(sourcelines, startline, linenos)
@@ -0,0 +1,27 @@
+import os
+from ConfigParser import ConfigParser
+
+from tracebin.upload import DEFAULT_CODEC, DEFAULT_LEVEL
+
+
+def load_config(fileobj=None):
+    config = ConfigParser()
+
+    # Setup some defaults, eventually there should be some sort of better
+    # abstraction for this.
+    config.add_section("server")
+    config.set("server", "host", "localhost")
+    config.set("server", "port", "8000")
+    config.add_section("upload")
+    config.set("upload", "compression", DEFAULT_CODEC)
+    config.set("upload", "compression_level", str(DEFAULT_LEVEL))
+    config.add_section("spool")
+    config.set("spool", "directory", os.path.expanduser(os.path.join("~", ".tracebin", "spool")))
+
+    if fileobj is not None:
+        with fileobj:
+            config.readfp(fileobj)
+    return config
+
+def upload_url(config):
+    return "http://{}:{}/trace/new/".format(config.get("server", "host"), config.getint("server", "port"))
@@ -0,0 +1,148 @@
+import Queue
+import array
+import struct
+import sys
+import threading
+
+
+CALL_EVENT = 0
+RETURN_EVENT = 1
+
+# Every profile event is a fixed width record of (timestamp, event id,
+# symbol id). Fixed width records mean recording an event is a single
+# pack_into at a known offset, with no length prefixes, no string copies and
+# no per-event bounds arithmetic beyond "is this segment full". The record is
+# 16 bytes so the timestamps stay 8-byte aligned within a segment.
+#
+# Overhead budget: Recorder.on_profile may do one clock read, one SymbolTable
+# lookup to find the interned symbol id, and one EventBuffer.write per event.
+# It must not allocate anything proportional to the function name, and it must
+# not touch more than one segment. benchmarks/profile_events.py measures the
+# per-event cost against the old mmap based writer, any change to this file
+# should keep it at or below the old cost.
+EVENT = struct.Struct("=dII")
+
+# 4MB segments, the same size as the mmaps we used to use.
+SEGMENT_SIZE = 4 * 1024 * 1024
+
+assert array.array("I").itemsize == 4
+
+
+def decode_segment(segment, end):
+    # Decodes a segment in bulk into parallel arrays of (timestamps, event ids,
+    # symbol ids), rather than unpacking it one record at a time. The same
+    # bytes are read once as doubles and once as 32-bit ints, and then each
+    # column is picked out with a strided slice.
+    data = buffer(segment, 0, end)[:]
+    doubles = array.array("d")
+    doubles.fromstring(data)
+    ints = array.array("I")
+    ints.fromstring(data)
+    return doubles[0::2], ints[2::4], ints[3::4]
+
+
+class EventBuffer(object):
+    def __init__(self, segment_size=SEGMENT_SIZE, consumer=None):
+        self.segment_size = segment_size - segment_size % EVENT.size
+        # Without a consumer every segment is kept until someone calls
+        # iter_columns(), with one full segments are handed off as soon as
+        # they fill up and only the current one is kept.
+        self.consumer = consumer
+        self.segments = []
+        self._full_segments = 0
+        self._current_segment = None
+        self._new_segment()
+
+    def _new_segment(self):
+        if self._current_segment is not None:
+            self._full_segments += 1
+            if self.consumer is not None:
+                self.consumer.put_segment(self._current_segment, self._offset)
+        if self.consumer is not None:
+            self._current_segment = self.consumer.get_segment(self.segment_size)
+        else:
+            self._current_segment = bytearray(self.segment_size)
+            self.segments.append(self._current_segment)
+        self._offset = 0
+
+    def __len__(self):
+        return (
+            self._full_segments * (self.segment_size // EVENT.size) +
+            self._offset // EVENT.size
+        )
+
+    def iter_columns(self):
+        assert self.consumer is None
+        for segment in self.segments:
+            if segment is self._current_segment:
+                end = self._offset
+            else:
+                end = len(segment)
+            yield decode_segment(segment, end)
+
+    def flush(self):
+        # Hands the partially filled current segment to the consumer.
+        assert self.consumer is not None
+        self.consumer.put_segment(self._current_segment, self._offset)
+        self._current_segment = None
+
+    def write(self, timestamp, event_id, symbol_id):
+        if self._offset == self.segment_size:
+            self._new_segment()
+        EVENT.pack_into(self._current_segment, self._offset, timestamp, event_id, symbol_id)
+        self._offset += EVENT.size
+
+
+class SegmentConsumer(object):
+    # Decodes segments on a background thread as they fill up and feeds them
+    # to a builder (anything with a feed(timestamps, event_ids, symbol_ids)
+    # method), then recycles them. At most max_segments segments are ever
+    # allocated, if the consumer falls behind the profiled thread waits for it
+    # instead of allocating more, so memory stays bounded no matter how long
+    # the program runs. If the builder fails, the rest of the segments are
+    # just recycled, so the profiled thread never waits on a dead consumer,
+    # and close() raises the error.
+    def __init__(self, builder, max_segments=4):
+        self.builder = builder
+        self.max_segments = max_segments
+        self.thread = threading.Thread(target=self._run, name="tracebin-profile")
+        self.thread.daemon = True
+        self._full = Queue.Queue()
+        self._free = Queue.Queue()
+        self._allocated_segments = 0
+        self._exc_info = None
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self._full.put(None)
+        self.thread.join()
+        if self._exc_info is not None:
+            exc_info, self._exc_info = self._exc_info, None
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def get_segment(self, segment_size):
+        try:
+            return self._free.get_nowait()
+        except Queue.Empty:
+            if self._allocated_segments < self.max_segments:
+                self._allocated_segments += 1
+                return bytearray(segment_size)
+            return self._free.get()
+
+    def put_segment(self, segment, end):
+        self._full.put((segment, end))
+
+    def _run(self):
+        while True:
+            item = self._full.get()
+            if item is None:
+                break
+            segment, end = item
+            if self._exc_info is None:
+                try:
+                    self.builder.feed(*decode_segment(segment, end))
+                except Exception:
+                    self._exc_info = sys.exc_info()
+            self._free.put(segment)
@@ -0,0 +1,45 @@
+import multiprocessing
+import os
+
+
+# Starting processes isn't worth it for fewer traces than this.
+MIN_PARALLEL_TRACES = 16
+
+# The pending traces a pool is building. Its workers are forked with this set,
+# so they're sent indexes into it, rather than the resops themselves, which
+# can't be pickled.
+_pending = None
+
+
+def _build(index):
+    data = _pending[index]
+    cls, args = data[0], data[1:]
+    return cls(*args)
+
+
+def build_traces(pending, workers=1):
+    # Yields the traces for a list of pending (cls, *args) tuples, in order,
+    # as they're built. With more than one worker they're built in forked
+    # processes and sent back pickled, a few ahead of whoever is consuming
+    # them. That forks whatever process is recording, so it's only done when
+    # asked for.
+    if workers <= 1 or len(pending) < MIN_PARALLEL_TRACES or not hasattr(os, "fork"):
+        for data in pending:
+            cls, args = data[0], data[1:]
+            yield cls(*args)
+        return
+
+    global _pending
+    _pending = pending
+    try:
+        pool = multiprocessing.Pool(min(workers, len(pending)))
+    finally:
+        _pending = None
+    try:
+        chunksize = max(1, len(pending) // (workers * 4))
+        for trace in pool.imap(_build, xrange(len(pending)), chunksize):
+            yield trace
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
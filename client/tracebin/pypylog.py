@@ -0,0 +1,150 @@
+import array
+import os
+import re
+
+
+# PyPy's sections we keep, and what they're called in the timeline. The
+# recorder wraps the recording in a tracebin-record section, the time in it
+# which isn't in any of the others is the program itself running.
+EVENT_TYPES = {
+    "tracebin-record": "running",
+    "jit-tracing": "jit-tracing",
+    "jit-backend": "jit-backend",
+    "gc-minor": "gc-minor",
+    "gc-collect": "gc-major",
+    "gc-collect-step": "gc-major",
+}
+RECORD_SECTION = "tracebin-record"
+
+# "[timestamp] {section" and "[timestamp] section}", newer PyPys put the
+# thread in front of the timestamp.
+_SECTION_RE = re.compile(r"^\[(?:[0-9a-f]+:)?([0-9a-f]+)\] (\{)?([\w-]+)(\})?$")
+
+
+def log_path(pypylog):
+    # The file a PYPYLOG=[filters:]path setting logs to, None if it's not
+    # logging to a file we can read back.
+    if not pypylog:
+        return None
+    path = pypylog.rpartition(":")[2]
+    if not path or path == "-":
+        return None
+    return path
+
+
+class JitEvents(object):
+    # The time spent in each kind of section, as columns. Sections inside
+    # other sections are cut out of them, so no two events overlap and each
+    # bit of time is counted once, towards the innermost section it's in.
+    # Times are in PyPy's timestamp ticks, not seconds.
+    def __init__(self):
+        self.event_types = []
+        self._event_type_ids = {}
+        self.event_ids = array.array("B")
+        self.start_times = array.array("l")
+        self.end_times = array.array("l")
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    def add(self, event_type, start_time, end_time):
+        if end_time <= start_time:
+            return
+        if event_type not in self._event_type_ids:
+            self._event_type_ids[event_type] = len(self.event_types)
+            self.event_types.append(event_type)
+        self.event_ids.append(self._event_type_ids[event_type])
+        self.start_times.append(start_time)
+        self.end_times.append(end_time)
+
+    def visit(self, visitor):
+        return visitor.visit_jit_events(self)
+
+
+def parse_events(lines, event_types=EVENT_TYPES):
+    # Reads the sections from a PYPYLOG a line at a time, so it doesn't
+    # matter how big it is. Everything in between them (the logged ops, etc.)
+    # is skipped.
+    events = JitEvents()
+    # [event type, start of the part not in a nested section] for each open
+    # section we keep, innermost last.
+    stack = []
+    names = []
+    timestamp = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.startswith("[") or not (line.endswith("}") or "] {" in line):
+            continue
+        match = _SECTION_RE.match(line)
+        if match is None:
+            continue
+        timestamp, start, name, stop = match.groups()
+        timestamp = int(timestamp, 16)
+        if name not in event_types or not (start or stop):
+            continue
+        if start:
+            if stack:
+                events.add(stack[-1][0], stack[-1][1], timestamp)
+            stack.append([event_types[name], timestamp])
+            names.append(name)
+        elif name in names:
+            # Sections always nest, unless the log's been cut short somewhere.
+            while names:
+                event_type, start_time = stack.pop()
+                events.add(event_type, start_time, timestamp)
+                if names.pop() == name:
+                    break
+            if stack:
+                stack[-1][1] = timestamp
+    # Whatever's still open (e.g. the log hadn't all been written out yet)
+    # ends with the last timestamp.
+    if stack:
+        events.add(stack[-1][0], stack[-1][1], timestamp)
+    return events
+
+
+def _iter_lines(f, length, block_size=1024 * 1024):
+    # The lines in the next ``length`` bytes of ``f``, without their
+    # newlines.
+    rest = ""
+    while length > 0:
+        block = f.read(min(block_size, length))
+        if not block:
+            break
+        length -= len(block)
+        lines = (rest + block).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+class PyPyLog(object):
+    # The part of a PYPYLOG file that's written while recording, from where
+    # it ends when it's created until where it ends when finish() is called.
+    def __init__(self, path):
+        self.path = path
+        self.start = self._size()
+        self.end = None
+
+    @classmethod
+    def from_environ(cls, environ=os.environ):
+        path = log_path(environ.get("PYPYLOG"))
+        if path is None:
+            return None
+        return cls(path)
+
+    def _size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def finish(self):
+        self.end = self._size()
+
+    def read_events(self, event_types=EVENT_TYPES):
+        if self.end == self.start:
+            # Including when PyPy isn't actually logging to it.
+            return JitEvents()
+        with open(self.path, "rb") as f:
+            f.seek(self.start)
+            return parse_events(_iter_lines(f, self.end - self.start), event_types)
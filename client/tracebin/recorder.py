@@ -1,41 +1,59 @@
+import __pypy__
 import ctypes
 import io
 import inspect
-import mmap
 import pypyjit
-import struct
 import sys
+import threading
 from collections import defaultdict
 from contextlib import contextmanager
 
 from logbook import Logger
 
 from tracebin.aborts import PythonAbort
-from tracebin.calls import PythonCall
+from tracebin.calls import CallTreeBuilder
+from tracebin.codecache import CodeCache
+from tracebin.events import (EventBuffer, SegmentConsumer, CALL_EVENT,
+    RETURN_EVENT)
+from tracebin.materialize import build_traces
+from tracebin.pypylog import PyPyLog, RECORD_SECTION
+from tracebin.sampling import StackSampler, DEFAULT_INTERVAL
+from tracebin.symbols import SymbolTable
 from tracebin.traces import PythonTrace
-from tracebin.utils import read_unpack, high_res_time
+from tracebin.utils import high_res_time
 
 
-PROFILE_IDENTIFIER = 72
+# Older PyPys don't have it, their log is only written out as it fills up
+# their buffer, or at exit.
+_debug_flush = getattr(__pypy__, "debug_flush", lambda: None)
 
-CALL_EVENT = 0
-RETURN_EVENT = 1
 
 @contextmanager
 def record(**kwargs):
-    recorder = Recorder(kwargs.pop("logger", None))
+    recorder = Recorder(kwargs.pop("logger", None), workers=kwargs.pop("workers", 1))
     with recorder.record(**kwargs):
         yield recorder
 
 class Recorder(object):
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, workers=1):
         if logger is None:
             logger = Logger("tracebin.Recorder")
         self.logger = logger
+        # How many processes build the traces once recording's finished, see
+        # materialize.build_traces. More than one forks the recording process.
+        self.workers = workers
         self._traces = []
         self._pending_traces = []
         self.aborts = []
         self.calls = None
+        self.symbols = None
+        # Set if they're asked for and PYPYLOG's logging to a file, see
+        # pypylog.JitEvents.
+        self.jit_events = None
+        self._pypylog = None
+        self.code_cache = CodeCache()
+        self._profile_consumer = None
+        self._sampler = None
         self.options = {
             "build": {},
             "jit": {},
@@ -43,14 +61,18 @@ class Recorder(object):
         }
 
     @contextmanager
-    def record(self, profile=False):
-        self.enable(profile=profile)
+    def record(self, profile=False, stream_profile=False, sample=False, sample_interval=DEFAULT_INTERVAL,
+        jit_events=False):
+        self.enable(profile=profile, stream_profile=stream_profile, sample=sample, sample_interval=sample_interval,
+            jit_events=jit_events)
         try:
             yield
         finally:
             self.disable(profile)
 
-    def enable(self, profile):
+    def enable(self, profile, stream_profile=False, sample=False, sample_interval=DEFAULT_INTERVAL,
+        jit_events=False):
+        assert not (profile and sample)
         pypyjit.set_compile_hook(self.on_compile)
         pypyjit.set_abort_hook(self.on_abort)
         self._backup_stdout = sys.stdout
@@ -62,17 +84,38 @@ class Recorder(object):
         self.options["build"]["gcrootfinder"] = sys.pypy_translation_info["translation.gcrootfinder"]
         self.options["build"]["pypy_version"] = sys._mercurial[2]
 
+        if profile or sample:
+            self.symbols = SymbolTable()
+            if stream_profile:
+                self._profile_consumer = SegmentConsumer(CallTreeBuilder(self.symbols))
+                self._profile_consumer.start()
+            self._events = EventBuffer(consumer=self._profile_consumer)
         if profile:
-            self._profile_mmaps = []
-            self._new_mmap()
             sys.setprofile(self.on_profile)
+        elif sample:
+            self._sampler = StackSampler(
+                self._events, self.symbols, threading.current_thread().ident,
+                inspect.currentframe(), interval=sample_interval,
+            )
+            self._sampler.start()
+
+        if jit_events:
+            # So whatever was logged before this is on disk, and skipped.
+            _debug_flush()
+            self._pypylog = PyPyLog.from_environ()
+            if self._pypylog is not None:
+                __pypy__.debug_start(RECORD_SECTION)
 
         self._start_time = high_res_time()
 
     def disable(self, profile):
+        if self._sampler is not None:
+            self._sampler.stop()
         self._end_time = high_res_time()
         self.runtime = self._end_time - self._start_time
         del self._start_time
+        if self._pypylog is not None:
+            __pypy__.debug_stop(RECORD_SECTION)
 
         if profile:
             sys.setprofile(None)
@@ -87,82 +130,88 @@ class Recorder(object):
         del self._backup_stdout
         del self._backup_stderr
 
-        if profile:
+        if self._pypylog is not None:
+            _debug_flush()
+            self._pypylog.finish()
+            self.jit_events = self._pypylog.read_events()
+            self._pypylog = None
+
+        if profile or self._sampler is not None:
             self._find_calls()
         del self._end_time
 
     @property
     def traces(self):
-        for data in self._pending_traces:
-            cls, args = data[0], data[1:]
-            self._traces.append(cls(*args))
-        del self._pending_traces[:]
+        for trace in self.iter_traces():
+            pass
         return self._traces
 
-    def _new_mmap(self):
-        self._current_profile_mmap = mmap.mmap(-1, 4 * 1024 * 1024)
-        self._profile_mmaps.append(self._current_profile_mmap)
+    def iter_traces(self, root_file=None, root_function=None):
+        # Only the traces whose root matches are built. They're kept once
+        # they're built, so each trace is only built once, however it's asked
+        # for.
+        for trace in list(self._traces):
+            if ((root_file is None or trace.root_file == root_file) and
+                (root_function is None or trace.root_function == root_function)):
+                yield trace
+        pending = [
+            data for data in self._pending_traces
+            if (root_file is None or data[1][0].co_filename == root_file) and
+                (root_function is None or data[1][0].co_name == root_function)
+        ]
+        built = 0
+        try:
+            for trace in build_traces(pending, self.workers):
+                self._traces.append(trace)
+                built += 1
+                yield trace
+        finally:
+            if built:
+                done = set(map(id, pending[:built]))
+                self._pending_traces[:] = [
+                    data for data in self._pending_traces if id(data) not in done
+                ]
 
     def _find_calls(self):
-        calls = []
-        stack = []
-        for m in self._profile_mmaps:
-            m.seek(0)
-            while True:
-                b = m.read(struct.calcsize("=B"))
-                if not b:
-                    break
-                marker, = struct.unpack("=B", b)
-                if marker == 0:
-                    m.close()
-                    break
-                elif marker != PROFILE_IDENTIFIER:
-                    raise Exception
-
-                event_id, timestamp = read_unpack("=Bd", m)
-                if event_id == CALL_EVENT:
-                    func_name_len, = read_unpack("=L", m)
-                    func_name = m.read(func_name_len)
-                    stack.append((func_name, timestamp, []))
-                elif event_id == RETURN_EVENT:
-                    try:
-                        prev_func_name, prev_timestamp, subcalls = stack.pop()
-                    except IndexError:
-                        # The function where the profile hook was enabled
-                        # (and everything up the stack from there) will
-                        # have returns recorded, but no call, so we ignore
-                        # them.
-                        if not stack:
-                            continue
-                    call = PythonCall(prev_func_name, prev_timestamp, timestamp, subcalls)
-                    if stack:
-                        stack[-1][2].append(call)
-                    else:
-                        calls.append(call)
-
-        while stack:
-            prev_func_name, prev_timestamp, subcalls = stack.pop()
-            call = PythonCall(prev_func_name, prev_timestamp, self._end_time, subcalls)
-            if stack:
-                stack[-1][2].append(call)
-            else:
-                calls.append(call)
-
-        self.calls = calls
+        if self._profile_consumer is not None:
+            self._events.flush()
+            self._profile_consumer.close()
+            builder = self._profile_consumer.builder
+        else:
+            builder = CallTreeBuilder(self.symbols)
+            for timestamps, event_ids, symbol_ids in self._events.iter_columns():
+                builder.feed(timestamps, event_ids, symbol_ids)
+        self.calls = builder.finish(self._end_time)
+        del self._events
+        self._profile_consumer = None
+        self._sampler = None
+
+    def _is_profile_thread(self):
+        # The streaming profile consumer and the sampler run while we're
+        # recording, but their loops aren't part of the user's program.
+        current_thread = threading.current_thread()
+        return any(
+            worker is not None and current_thread is worker.thread
+            for worker in [self._profile_consumer, self._sampler]
+        )
 
     def on_compile(self, jitdriver_name, kind, greenkey, ops, asm_ptr, asm_len):
+        if self._is_profile_thread():
+            return
         if kind != "loop":
             self.logger.warning("[compile] Unhandled compiled kind: %s" % kind)
             return
 
         if jitdriver_name == "pypyjit":
             self._pending_traces.append(
-                (PythonTrace, greenkey, ops, ctypes.string_at(asm_ptr, asm_len))
+                (PythonTrace, greenkey, ops, ctypes.string_at(asm_ptr, asm_len), self.code_cache)
             )
         else:
             self.logger.warning("[compile] Unhandled jitdriver: %s" % jitdriver_name)
 
     def on_abort(self, jitdriver_name, greenkey, reason):
+        if self._is_profile_thread():
+            return
         if jitdriver_name == "pypyjit":
             frame = inspect.currentframe().f_back
             self.aborts.append(
@@ -174,26 +223,17 @@ class Recorder(object):
     def on_profile(self, frame, event, arg):
         timestamp = high_res_time()
         if event == "call" or event == "c_call":
-            event_id = CALL_EVENT
             if event == "call":
-                target = frame.f_code.co_name
+                symbol_id = self.symbols.lookup_code(frame.f_code)
             elif event == "c_call":
-                target = arg.__name__
-            content = struct.pack("=dL", timestamp, len(target)) + target
+                symbol_id = self.symbols.lookup_builtin(arg)
+            self._events.write(timestamp, CALL_EVENT, symbol_id)
         elif event == "return" or event == "c_return" or event == "c_exception":
-            event_id = RETURN_EVENT
-            content = struct.pack("=d", timestamp)
-        elif event == "exception" or event == "c_exception":
+            self._events.write(timestamp, RETURN_EVENT, 0)
+        elif event == "exception":
             return
         else:
             self.logger.warning("[profile] Unknown event: %s" % event)
-            return
-
-        if self._current_profile_mmap.tell() + len(content) + 2 > len(self._current_profile_mmap):
-            self._new_mmap()
-        self._current_profile_mmap.write_byte(chr(PROFILE_IDENTIFIER))
-        self._current_profile_mmap.write_byte(chr(event_id))
-        self._current_profile_mmap.write(content)
 
     def visit(self, visitor):
         return visitor.visit_recorder(self)
@@ -0,0 +1,51 @@
+class ResOpEncoder(object):
+    # Encodes resops a column per field instead of as their reprs. Op names,
+    # descrs and values (the boxes and constants in args and results, most
+    # of which turn up over and over) are numbered, in tables shared by all of
+    # a trace's chunks, so the columns are all numbers. The fields are read
+    # off the resops themselves, so nothing in a descr's or a constant's repr
+    # can get them mixed up.
+    def __init__(self):
+        self.opnames = []
+        self.descrs = []
+        self.values = []
+        self._opname_ids = {}
+        self._descr_ids = {}
+        self._value_ids = {}
+
+    def encode(self, ops):
+        columns = {
+            "opcodes": [],
+            "results": [],
+            "args": [],
+            "descrs": [],
+            "fail_args": [],
+        }
+        for op in ops:
+            columns["opcodes"].append(self._number(self.opnames, self._opname_ids, op.name))
+            result = op.result
+            columns["results"].append(None if result is None else self._number_value(result))
+            columns["args"].append([
+                self._number_value(op.getarg(i)) for i in xrange(op.numargs())
+            ])
+            descr = op.getdescr()
+            columns["descrs"].append(
+                None if descr is None else
+                self._number(self.descrs, self._descr_ids, repr(descr))
+            )
+            # Only guards have them.
+            fail_args = op.getfailargs()
+            columns["fail_args"].append(
+                None if fail_args is None else
+                [self._number_value(value) for value in fail_args]
+            )
+        return columns
+
+    def _number(self, table, ids, value):
+        if value not in ids:
+            ids[value] = len(table)
+            table.append(value)
+        return ids[value]
+
+    def _number_value(self, value):
+        return self._number(self.values, self._value_ids, repr(value))
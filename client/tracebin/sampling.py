@@ -0,0 +1,80 @@
+import sys
+import threading
+
+from tracebin.events import CALL_EVENT, RETURN_EVENT
+from tracebin.utils import high_res_time
+
+
+# 5ms is coarse enough that the sampler costs next to nothing, and leaves the
+# JIT alone, unlike sys.setprofile.
+DEFAULT_INTERVAL = .005
+
+
+class StackSampler(object):
+    # Periodically looks at a thread's stack from a watcher thread, and turns
+    # the difference between consecutive samples into the same call and return
+    # events sys.setprofile would have produced. Frames which are in both
+    # samples are assumed to have run for the whole interval, a frame which
+    # shows up is assumed to have been called at the time of the sample, and
+    # one that goes away to have returned then, so durations are only accurate
+    # to within an interval and calls shorter than that are mostly missed.
+    # Frames are only kept as (id, code) keys, holding on to the frames
+    # themselves would keep their locals alive between samples.
+    def __init__(self, events, symbols, thread_ident, base_frame, interval=DEFAULT_INTERVAL):
+        self.events = events
+        self.symbols = symbols
+        self.thread_ident = thread_ident
+        self.interval = interval
+        self.thread = threading.Thread(target=self._run, name="tracebin-sampler")
+        self.thread.daemon = True
+        self._stopped = threading.Event()
+        # Frames which were already running when sampling started (e.g. the
+        # one with the ``with record()`` block in it) aren't calls we record,
+        # the same as with sys.setprofile.
+        self._base_stack = self._get_stack(base_frame)
+        self._stack = []
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            if frame is None:
+                break
+            self.sample(high_res_time(), frame)
+            del frame
+
+    @staticmethod
+    def _get_stack(frame):
+        stack = []
+        while frame is not None:
+            stack.append((id(frame), frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def sample(self, timestamp, frame):
+        stack = self._get_stack(frame)
+        start = 0
+        for base_frame, frame in zip(self._base_stack, stack):
+            if base_frame != frame:
+                break
+            start += 1
+        stack = stack[start:]
+
+        common = 0
+        for prev_frame, frame in zip(self._stack, stack):
+            if prev_frame != frame:
+                break
+            common += 1
+
+        for i in xrange(len(self._stack) - common):
+            self.events.write(timestamp, RETURN_EVENT, 0)
+        for frame_id, code in stack[common:]:
+            self.events.write(timestamp, CALL_EVENT, self.symbols.lookup_code(code))
+        self._stack = stack
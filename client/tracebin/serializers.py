@@ -1,4 +1,10 @@
+import array
+import base64
 import json
+import struct
+import sys
+import types
+import zlib
 
 from tracebin.utils import dict_merge
 
@@ -8,6 +14,8 @@ class BaseSerializer(object):
 
     def __init__(self, obj):
         self.obj = obj
+        # {hash: asm} for the traces visited so far, see visit_recorder.
+        self._asm_blocks = {}
 
     @classmethod
     def register(cls, subcls):
@@ -15,32 +23,80 @@ class BaseSerializer(object):
         cls.ALL_SERIALIZERS[subcls.name] = subcls
         return subcls
 
+    def get_items(self, extra_data=None):
+        # A list of (key, value) pairs. The values which can get big (traces
+        # and aborts) are generators, so a serializer can write them out one
+        # at a time instead of holding the whole recording in memory.
+        items = self.visit(self.obj)
+        if extra_data is not None:
+            keys = {key for key, _ in items}
+            items = [
+                (key, value)
+                for key, value in extra_data.iteritems()
+                if key not in keys
+            ] + items
+        return items
+
     def get_data(self, extra_data=None):
-        data = self.visit(self.obj)
+        data = {}
+        for key, value in self.get_items():
+            if isinstance(value, types.GeneratorType):
+                value = list(value)
+            data[key] = value
         if extra_data is not None:
             data = dict_merge(extra_data, data)
         return data
 
+    def dump(self, **kwargs):
+        return "".join(self.iter_dump(**kwargs))
+
+    def dump_to(self, fileobj, **kwargs):
+        for chunk in self.iter_dump(**kwargs):
+            fileobj.write(chunk)
+
     def visit(self, obj):
         return obj.visit(self)
 
     def visit_recorder(self, recorder):
+        return [
+            ("options", {k: v.copy() for k, v in recorder.options.iteritems()}),
+            ("runtime", recorder.runtime),
+            ("stdout", recorder.stdout),
+            ("stderr", recorder.stderr),
+            ("aborts", (self.visit(abort) for abort in recorder.aborts)),
+            ("traces", (self.visit(trace) for trace in recorder.iter_traces())),
+            # After the traces, which only have the hash of their machine code,
+            # each distinct block of it, once they've all been visited.
+            ("asm", self._iter_asm_blocks()),
+            ("calls", None if recorder.calls is None else self.visit(recorder.calls)),
+            ("jit_events", None if recorder.jit_events is None else self.visit(recorder.jit_events)),
+        ]
+
+    def _iter_asm_blocks(self):
+        for asm_hash, asm in self._asm_blocks.iteritems():
+            yield self.visit_asm_block(asm_hash, asm)
+        self._asm_blocks.clear()
+
+    def visit_asm_block(self, asm_hash, asm):
         return {
-            "traces": [self.visit(trace) for trace in recorder.traces],
-            "aborts": [self.visit(abort) for abort in recorder.aborts],
-            "calls": None if recorder.calls is None else [self.visit(call) for call in recorder.calls],
-            "options": {k: v.copy() for k, v in recorder.options.iteritems()},
-            "runtime": recorder.runtime,
-            "stdout": recorder.stdout,
-            "stderr": recorder.stderr,
+            "hash": asm_hash,
+            "size": len(asm),
+            "data": base64.b64encode(zlib.compress(asm)),
         }
 
     def visit_python_trace(self, trace):
+        asm_hash = trace.asm_hash
+        self._asm_blocks[asm_hash] = trace.asm
         return {
             "type": "python",
             "root_file": trace.root_file,
             "root_function": trace.root_function,
+            "asm_hash": asm_hash,
+            "asm_size": len(trace.asm),
             "sections": [self.visit(section) for section in trace.sections],
+            "opnames": trace.resops.opnames,
+            "descrs": trace.resops.descrs,
+            "values": trace.resops.values,
         }
 
     def visit_trace_section(self, section):
@@ -52,7 +108,7 @@ class BaseSerializer(object):
     def visit_resop_chunk(self, chunk):
         return {
             "type": "resop",
-            "ops": u"\n".join(repr(op) for op in chunk.ops)
+            "ops": chunk.ops,
         }
 
     def visit_python_chunk(self, chunk):
@@ -70,13 +126,31 @@ class BaseSerializer(object):
             "reason": abort.reason,
         }
 
-    def visit_python_call(self, call):
+    def visit_symbol(self, symbol):
         return {
-            "type": "python",
-            "name": call.func_name,
-            "start_time": call.start_time,
-            "end_time": call.end_time,
-            "subcalls": [self.visit(subcall) for subcall in call.subcalls],
+            "name": symbol.name,
+            "filename": symbol.filename,
+            "lineno": symbol.lineno,
+        }
+
+    def visit_jit_events(self, events):
+        return {
+            "event_types": events.event_types,
+            "event_ids": events.event_ids,
+            "start_times": events.start_times,
+            "end_times": events.end_times,
+        }
+
+    def visit_call_tree(self, tree):
+        # The columns are left as arrays, it's up to each serializer to write
+        # them out efficiently.
+        return {
+            "symbols": [self.visit(symbol) for symbol in tree.symbols],
+            "symbol_ids": tree.symbol_ids,
+            "start_times": tree.start_times,
+            "end_times": tree.end_times,
+            "parents": tree.parents,
+            "depths": tree.depths,
         }
 
 
@@ -84,9 +158,197 @@ class BaseSerializer(object):
 class JSONSerializer(BaseSerializer):
     name = "json"
 
-    def dump(self, **kwargs):
-        return json.dumps(self.get_data(**kwargs))
+    # Arrays are converted to lists and encoded this many items at a time.
+    ARRAY_CHUNK_SIZE = 64 * 1024
+
+    def iter_dump(self, **kwargs):
+        return self._iter_object(self.get_items(**kwargs))
+
+    def _iter_object(self, items):
+        yield "{"
+        for i, (key, value) in enumerate(items):
+            if i:
+                yield ", "
+            yield json.dumps(key)
+            yield ": "
+            for chunk in self._iter_value(value):
+                yield chunk
+        yield "}"
+
+    def _iter_value(self, value):
+        if isinstance(value, types.GeneratorType):
+            yield "["
+            for i, item in enumerate(value):
+                if i:
+                    yield ", "
+                yield json.dumps(item)
+            yield "]"
+        elif isinstance(value, array.array):
+            yield "["
+            for start in xrange(0, len(value), self.ARRAY_CHUNK_SIZE):
+                if start:
+                    yield ", "
+                yield json.dumps(value[start:start + self.ARRAY_CHUNK_SIZE].tolist())[1:-1]
+            yield "]"
+        elif isinstance(value, dict):
+            for chunk in self._iter_object(value.iteritems()):
+                yield chunk
+        else:
+            yield json.dumps(value)
 
     @classmethod
     def load(cls, data):
-        return json.loads(data)
\ No newline at end of file
+        return json.loads(data)
+
+
+def _shuffle(data, itemsize):
+    # Groups the first byte of every item together, then the second, etc. For
+    # columns of similar numbers (like timestamps) most of those groups are
+    # very repetitive, which makes them compress much better.
+    return "".join([data[i::itemsize] for i in xrange(itemsize)])
+
+def _unshuffle(data, itemsize):
+    n = len(data) // itemsize
+    result = bytearray(len(data))
+    for i in xrange(itemsize):
+        result[i::itemsize] = data[i * n:(i + 1) * n]
+    return str(result)
+
+
+@BaseSerializer.register
+class BinarySerializer(BaseSerializer):
+    name = "binary"
+
+    MAGIC = "TRACEBIN"
+    VERSION = 1
+    SECTION_HEADER = struct.Struct("<4sQ")
+    # Each trace and each abort gets its own section, and each call column is
+    # split into blocks of this many items, so nothing big has to be held in
+    # memory to work out a section's length.
+    CALL_BLOCK_SIZE = 64 * 1024
+    CALL_COLUMNS = [
+        ("symbol_ids", "I"),
+        ("start_times", "d"),
+        ("end_times", "d"),
+        ("parents", "i"),
+        ("depths", "I"),
+    ]
+
+    def iter_dump(self, **kwargs):
+        yield self.MAGIC + chr(self.VERSION)
+        # Whatever doesn't have its own section (e.g. the extra_data).
+        meta = {}
+        for key, value in self.get_items(**kwargs):
+            if key == "options":
+                yield self._section("opts", json.dumps(value))
+            elif key == "traces":
+                for trace in value:
+                    yield self._section("trce", json.dumps(trace))
+            elif key == "aborts":
+                for abort in value:
+                    yield self._section("abrt", json.dumps(abort))
+            elif key == "asm":
+                for asm_hash, compressed in value:
+                    yield self._section("asmb", asm_hash + compressed)
+            elif key == "stdout":
+                yield self._section("stdo", self._encode_text(value))
+            elif key == "stderr":
+                yield self._section("stde", self._encode_text(value))
+            elif key == "calls":
+                if value is not None:
+                    for chunk in self._iter_calls(value):
+                        yield chunk
+            elif key == "jit_events":
+                if value is not None:
+                    yield self._section("jevt", json.dumps(dict(
+                        (k, v.tolist() if isinstance(v, array.array) else v)
+                        for k, v in value.iteritems()
+                    )))
+            else:
+                meta[key] = value
+        yield self._section("meta", json.dumps(meta))
+        yield self._section("end\x00", "")
+
+    def visit_asm_block(self, asm_hash, asm):
+        # Written as is, rather than base64 encoded in JSON.
+        return asm_hash, zlib.compress(asm)
+
+    def _section(self, name, payload):
+        return self.SECTION_HEADER.pack(name, len(payload)) + payload
+
+    def _encode_text(self, text):
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        return text
+
+    def _iter_calls(self, calls):
+        yield self._section("csym", json.dumps(calls["symbols"]))
+        for column, (name, typecode) in enumerate(self.CALL_COLUMNS):
+            values = calls[name]
+            for start in xrange(0, len(values), self.CALL_BLOCK_SIZE):
+                block = values[start:start + self.CALL_BLOCK_SIZE]
+                if not isinstance(block, array.array) or block.typecode != typecode:
+                    block = array.array(typecode, block)
+                if sys.byteorder != "little":
+                    block.byteswap()
+                # Level 1 gets most of the benefit of the shuffling, at a
+                # fraction of the CPU time.
+                yield self._section("ccol", chr(column) + zlib.compress(
+                    _shuffle(block.tostring(), block.itemsize), 1
+                ))
+
+    @classmethod
+    def load(cls, data):
+        if data[:len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError("Not a tracebin recording")
+        version = ord(data[len(cls.MAGIC)])
+        if version != cls.VERSION:
+            raise ValueError("Unknown tracebin recording version: {:d}".format(version))
+
+        result = {"traces": [], "aborts": [], "asm": [], "calls": None, "jit_events": None}
+        symbols = None
+        columns = [array.array(typecode) for _, typecode in cls.CALL_COLUMNS]
+        offset = len(cls.MAGIC) + 1
+        while True:
+            name, length = cls.SECTION_HEADER.unpack_from(data, offset)
+            offset += cls.SECTION_HEADER.size
+            payload = data[offset:offset + length]
+            offset += length
+            if name == "end\x00":
+                break
+            elif name == "meta":
+                result.update(json.loads(payload))
+            elif name == "opts":
+                result["options"] = json.loads(payload)
+            elif name == "trce":
+                result["traces"].append(json.loads(payload))
+            elif name == "abrt":
+                result["aborts"].append(json.loads(payload))
+            elif name == "asmb":
+                # SHA-1 hex digests are 40 characters.
+                asm_hash, compressed = payload[:40], payload[40:]
+                result["asm"].append({
+                    "hash": asm_hash,
+                    "size": len(zlib.decompress(compressed)),
+                    "data": base64.b64encode(compressed),
+                })
+            elif name == "stdo":
+                result["stdout"] = payload.decode("utf-8")
+            elif name == "stde":
+                result["stderr"] = payload.decode("utf-8")
+            elif name == "jevt":
+                result["jit_events"] = json.loads(payload)
+            elif name == "csym":
+                symbols = json.loads(payload)
+            elif name == "ccol":
+                values = columns[ord(payload[0])]
+                values.fromstring(_unshuffle(zlib.decompress(payload[1:]), values.itemsize))
+            # Unknown sections are from newer versions, and are skipped.
+
+        if symbols is not None:
+            result["calls"] = calls = {"symbols": symbols}
+            for (name, _), values in zip(cls.CALL_COLUMNS, columns):
+                if sys.byteorder != "little":
+                    values.byteswap()
+                calls[name] = values.tolist()
+        return result
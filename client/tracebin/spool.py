@@ -0,0 +1,182 @@
+from __future__ import print_function
+
+import argparse
+import errno
+import os
+import Queue
+import sys
+import threading
+import time
+import uuid
+
+import logbook
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracebin.config import load_config, upload_url
+from tracebin.upload import compress_chunks, post, CODECS, DEFAULT_CODEC, DEFAULT_LEVEL
+
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RETRIES = 5
+# Seconds before the first retry, doubled for each one after that.
+DEFAULT_BACKOFF = 1.0
+
+
+class Spool(object):
+    # Recordings are compressed and written to ``tmp/``, then renamed into the
+    # spool directory, so a reader never sees a partially written one. The
+    # extension is the codec they were compressed with. Recordings the server
+    # rejects are moved to ``failed/``.
+    def __init__(self, directory):
+        self.directory = directory
+        self.tmp_dir = os.path.join(directory, "tmp")
+        self.failed_dir = os.path.join(directory, "failed")
+        for path in [self.directory, self.tmp_dir, self.failed_dir]:
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __iter__(self):
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if self.codec(path) in CODECS and os.path.isfile(path):
+                yield path
+
+    @staticmethod
+    def codec(path):
+        return os.path.splitext(path)[1][1:]
+
+    def add(self, chunks, codec=DEFAULT_CODEC, level=DEFAULT_LEVEL):
+        # Names sort in the order recordings were added.
+        name = "{:.6f}-{}.{}".format(time.time(), uuid.uuid4().hex, codec)
+        tmp_path = os.path.join(self.tmp_dir, name)
+        with open(tmp_path, "wb") as f:
+            for data in compress_chunks(chunks, codec, level):
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        path = os.path.join(self.directory, name)
+        os.rename(tmp_path, path)
+        return path
+
+    def remove(self, path):
+        os.remove(path)
+
+    def fail(self, path):
+        os.rename(path, os.path.join(self.failed_dir, os.path.basename(path)))
+
+
+class SpoolDrainer(object):
+    def __init__(self, spool, url, concurrency=DEFAULT_CONCURRENCY,
+        retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, logger=None):
+        self.spool = spool
+        self.url = url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logger or logbook.Logger()
+        # One connection per worker, reused for every upload it does.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def drain(self):
+        # Uploads everything currently in the spool, returns a dict of path to
+        # the uploaded trace's URL, or None for recordings which failed.
+        queue = Queue.Queue()
+        for path in self.spool:
+            queue.put(path)
+        results = {}
+        threads = [
+            threading.Thread(target=self._work, args=(queue, results))
+            for i in xrange(min(self.concurrency, queue.qsize()))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _work(self, queue, results):
+        while True:
+            try:
+                path = queue.get_nowait()
+            except Queue.Empty:
+                return
+            results[path] = self._upload(path)
+
+    def _upload(self, path):
+        for attempt in xrange(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with open(path, "rb") as f:
+                    location = post(self.url, f, self.spool.codec(path), session=self.session)
+            except requests.HTTPError as e:
+                if e.response.status_code < 500:
+                    # Retrying won't help, keep it around for inspection.
+                    self.logger.error("Upload of {} rejected: {}".format(path, e))
+                    self.spool.fail(path)
+                    return None
+                self.logger.warning("Upload of {} failed: {}".format(path, e))
+            except requests.RequestException as e:
+                self.logger.warning("Upload of {} failed: {}".format(path, e))
+            else:
+                self.spool.remove(path)
+                return location
+        # Left in the spool for the next drain.
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="tracebin spool uploader")
+    parser.add_argument("--config", type=argparse.FileType("r"))
+    parser.add_argument("--spool-dir")
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--retries", type=int, default=DEFAULT_RETRIES,
+    )
+    parser.add_argument(
+        "--backoff", type=float, default=DEFAULT_BACKOFF,
+    )
+    parser.add_argument(
+        "--watch", type=float, metavar="INTERVAL",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+    )
+
+    args = parser.parse_args(argv[1:])
+
+    logger = logbook.Logger(level=logbook.INFO if args.verbose else logbook.WARNING)
+
+    config = load_config(args.config)
+    spool = Spool(args.spool_dir or config.get("spool", "directory"))
+    drainer = SpoolDrainer(spool, upload_url(config),
+        concurrency=args.concurrency,
+        retries=args.retries,
+        backoff=args.backoff,
+        logger=logger,
+    )
+
+    failed = False
+    while True:
+        for path, location in sorted(drainer.drain().iteritems()):
+            if location is None:
+                failed = True
+            else:
+                print(location)
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
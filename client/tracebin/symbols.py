@@ -0,0 +1,60 @@
+import types
+
+
+class Symbol(object):
+    def __init__(self, id, name, filename, lineno):
+        self.id = id
+        self.name = name
+        self.filename = filename
+        self.lineno = lineno
+
+    def visit(self, visitor):
+        return visitor.visit_symbol(self)
+
+
+class SymbolTable(object):
+    def __init__(self):
+        self._ids = {}
+        self.symbols = []
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __getitem__(self, id):
+        return self.symbols[id]
+
+    @staticmethod
+    def builtin_key(func):
+        # Bound builtin methods (e.g. [].append) are a new object for every
+        # instance, and keep the instance alive, so they're keyed by their type
+        # instead.
+        owner = getattr(func, "__self__", None)
+        if owner is None or isinstance(owner, types.ModuleType):
+            return func
+        return (type(owner), func.__name__)
+
+    def lookup_code(self, code):
+        try:
+            return self._ids[code]
+        except KeyError:
+            return self._add(code, code.co_name, code.co_filename, code.co_firstlineno)
+
+    def lookup_builtin(self, func):
+        key = self.builtin_key(func)
+        try:
+            return self._ids[key]
+        except KeyError:
+            owner = getattr(func, "__self__", None)
+            if owner is None or isinstance(owner, types.ModuleType):
+                filename = func.__module__
+            else:
+                filename = "{}.{}".format(type(owner).__module__, type(owner).__name__)
+            return self._add(key, func.__name__, filename, None)
+
+    def _add(self, key, name, filename, lineno):
+        symbol_id = self._ids[key] = len(self.symbols)
+        self.symbols.append(Symbol(symbol_id, name, filename, lineno))
+        return symbol_id
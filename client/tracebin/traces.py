@@ -1,17 +1,24 @@
-import inspect
+import hashlib
 
-import disassembler
+from tracebin.codecache import CodeCache
+from tracebin.resops import ResOpEncoder
 
 
 class BaseTrace(object):
     def __init__(self, ops, asm):
         super(BaseTrace, self).__init__()
         self.asm = asm
+        self.resops = ResOpEncoder()
         self.sections = [
             TraceSection(label, self.split_section(ops))
             for label, ops in self.split_trace(ops)
         ]
 
+    @property
+    def asm_hash(self):
+        # Worked out when it's asked for, i.e. when the trace's serialized.
+        return hashlib.sha1(self.asm).hexdigest()
+
     @classmethod
     def split_trace(cls, ops):
         sections = []
@@ -25,19 +32,27 @@ class BaseTrace(object):
         return sections
 
 class PythonTrace(BaseTrace):
-    def __init__(self, greenkey, ops, asm):
+    def __init__(self, greenkey, ops, asm, code_cache=None):
+        if code_cache is None:
+            code_cache = CodeCache()
+        self.code_cache = code_cache
         super(PythonTrace, self).__init__(ops, asm)
         self.root_file = greenkey[0].co_filename
         self.root_function = greenkey[0].co_name
 
-    @classmethod
-    def split_section(cls, ops):
+    def __getstate__(self):
+        # The code cache is only needed while splitting, and holds code
+        # objects, which can't be pickled.
+        state = self.__dict__.copy()
+        del state["code_cache"]
+        return state
+
+    def split_section(self, ops):
         chunks = []
-        cls._split_section(ops, i=0, call_id=0, chunks=chunks, dis_cache={})
+        self._split_section(ops, i=0, call_id=0, chunks=chunks)
         return chunks
 
-    @classmethod
-    def _split_section(cls, ops, i, call_id, chunks, dis_cache):
+    def _split_section(self, ops, i, call_id, chunks):
         start_idx = i
         current_line = None
 
@@ -46,39 +61,36 @@ class PythonTrace(BaseTrace):
             if op.name == "debug_merge_point":
                 if op.call_id > call_id:
                     chunks.append(
-                        ResOpChunk(ops[start_idx:i])
+                        ResOpChunk(ops[start_idx:i], self.resops)
                     )
-                    i = start_idx = cls._split_section(ops, i, op.call_id, chunks, dis_cache)
+                    i = start_idx = self._split_section(ops, i, op.call_id, chunks)
                 elif op.call_id < call_id:
                     chunks.append(
-                        ResOpChunk(ops[start_idx:i])
+                        ResOpChunk(ops[start_idx:i], self.resops)
                     )
                     return i
                 else:
-                    if op.pycode not in dis_cache:
-                        dis_cache[op.pycode] = disassembler.dis(op.pycode)
-                    code = dis_cache[op.pycode]
-                    py_op = code.map[op.bytecode_no]
-                    sourcecode, startline = inspect.getsourcelines(code.co)
+                    sourcecode, startline, line_map = self.code_cache.lookup(op.pycode)
+                    lineno = line_map[op.bytecode_no]
 
-                    if current_line is None or py_op.lineno > current_line:
+                    if current_line is None or lineno > current_line:
                         if start_idx != i:
                             chunks.append(
-                                ResOpChunk(ops[start_idx:i])
+                                ResOpChunk(ops[start_idx:i], self.resops)
                             )
-                        lines_end = py_op.lineno - startline
+                        lines_end = lineno - startline
                         if current_line is None:
                             source = sourcecode[:lines_end + 1]
-                            linenos = range(startline, py_op.lineno + 1)
+                            linenos = range(startline, lineno + 1)
                         else:
                             source = [sourcecode[lines_end]]
-                            linenos = [py_op.lineno]
+                            linenos = [lineno]
                         chunks.append(PythonChunk(source, linenos))
-                        current_line = py_op.lineno
+                        current_line = lineno
                         start_idx = i
             i += 1
         if start_idx < len(ops):
-            chunks.append(ResOpChunk(ops[start_idx:]))
+            chunks.append(ResOpChunk(ops[start_idx:], self.resops))
         return i
 
     def visit(self, visitor):
@@ -97,11 +109,14 @@ class BaseChunk(object):
     pass
 
 class ResOpChunk(BaseChunk):
-    def __init__(self, ops):
-        self.ops = ops
+    def __init__(self, ops, encoder):
+        # The ops are kept encoded, see resops.ResOpEncoder, which unlike the
+        # resops themselves can be pickled.
+        self.encoder = encoder
+        self.ops = encoder.encode(ops)
 
     def get_op_names(self):
-        return [op.name for op in self.ops]
+        return [self.encoder.opnames[opcode] for opcode in self.ops["opcodes"]]
 
     def visit(self, visitor):
         return visitor.visit_resop_chunk(self)
@@ -0,0 +1,59 @@
+import zlib
+
+import requests
+
+
+# codec: (Content-encoding, wbits)
+CODECS = {
+    "zlib": ("deflate", zlib.MAX_WBITS),
+    "gzip": ("gzip", 16 + zlib.MAX_WBITS),
+}
+DEFAULT_CODEC = "gzip"
+# Level 9 barely compresses serialized recordings any better than 6, and takes
+# much longer.
+DEFAULT_LEVEL = 6
+
+# The serializers produce lots of tiny strings, they're batched up to this size
+# before being handed to the compressor.
+CHUNK_SIZE = 64 * 1024
+
+
+def compress_chunks(chunks, codec=DEFAULT_CODEC, level=DEFAULT_LEVEL):
+    _, wbits = CODECS[codec]
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= CHUNK_SIZE:
+            data = compressor.compress("".join(pending))
+            del pending[:]
+            pending_size = 0
+            if data:
+                yield data
+    data = compressor.compress("".join(pending)) + compressor.flush()
+    if data:
+        yield data
+
+def post(url, data, codec=DEFAULT_CODEC, content_type="application/json",
+    session=requests):
+    # ``data`` is already compressed, with ``codec``. requests sends a
+    # generator or file body without reading it all into memory, generators
+    # with chunked transfer encoding.
+    content_encoding, _ = CODECS[codec]
+    response = session.post(url,
+        data=data,
+        headers={
+            "Content-type": content_type,
+            "Content-encoding": content_encoding,
+        },
+        allow_redirects=False,
+    )
+    response.raise_for_status()
+    return response.headers["Location"]
+
+def upload(url, chunks, content_type="application/json", codec=DEFAULT_CODEC,
+    level=DEFAULT_LEVEL, session=requests):
+    return post(url, compress_chunks(chunks, codec, level), codec,
+        content_type=content_type, session=session)
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+# Like LocMemCache, caches with the same LOCATION share their entries.
+_caches = {}
+_sizes = {}
+_locks = {}
+# LRUFileBasedCache's, by directory.
+_dir_stats = {}
+
+
+class LRUMemoryCache(BaseCache):
+    # An in-memory cache which evicts the least recently used entries once
+    # there are more than MAX_ENTRIES of them, or their pickled values add up
+    # to more than MAX_SIZE bytes (if it's set, in OPTIONS).
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        self._max_size = params.get("OPTIONS", {}).get("MAX_SIZE")
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._size = _sizes.setdefault(name, [0])
+        self._lock = _locks.setdefault(name, threading.Lock())
+
+    def add(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            pickled = self._get(key)
+        if pickled is None:
+            return default
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._size[0] = 0
+
+    def _get(self, key):
+        try:
+            expires, pickled = self._cache.pop(key)
+        except KeyError:
+            return None
+        if expires <= time.time():
+            self._size[0] -= len(pickled)
+            return None
+        # Move it to the most recently used end.
+        self._cache[key] = expires, pickled
+        return pickled
+
+    def _set(self, key, value, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._delete(key)
+        self._cache[key] = time.time() + timeout, pickled
+        self._size[0] += len(pickled)
+        while self._cache and (len(self._cache) > self._max_entries or
+            (self._max_size is not None and self._size[0] > self._max_size)):
+            expires, pickled = self._cache.popitem(last=False)[1]
+            self._size[0] -= len(pickled)
+
+    def _delete(self, key):
+        try:
+            expires, pickled = self._cache.pop(key)
+        except KeyError:
+            return
+        self._size[0] -= len(pickled)
+
+
+class LRUFileBasedCache(FileBasedCache):
+    # FileBasedCache, but reading an entry marks it as used by touching its
+    # file, and culling removes the least recently used files until there are
+    # fewer than MAX_ENTRIES, and they add up to at most MAX_SIZE bytes (if
+    # it's set, in OPTIONS). The number of files and their size are kept as
+    # they're written and deleted, so the directory's only walked when it
+    # needs culling. Other processes' writes aren't counted, each walk catches
+    # up with them.
+    def __init__(self, dir, params):
+        FileBasedCache.__init__(self, dir, params)
+        self._max_size = params.get("OPTIONS", {}).get("MAX_SIZE")
+        # [number of files, total size], None until the first walk.
+        self._stats = _dir_stats.setdefault(self._dir, [None, None])
+
+    def get(self, key, default=None, version=None):
+        value = FileBasedCache.get(self, key, default, version=version)
+        if value is not default:
+            try:
+                os.utime(self._key_to_file(self.make_key(key, version=version)), None)
+            except OSError:
+                pass
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        path = self._key_to_file(self.make_key(key, version=version))
+        old_size = _file_size(path)
+        FileBasedCache.set(self, key, value, timeout, version=version)
+        new_size = _file_size(path)
+        if self._stats[0] is not None:
+            self._stats[0] += (new_size is not None) - (old_size is not None)
+            self._stats[1] += (new_size or 0) - (old_size or 0)
+
+    def clear(self):
+        FileBasedCache.clear(self)
+        self._stats[:] = [0, 0]
+
+    def _delete(self, path):
+        size = _file_size(path)
+        FileBasedCache._delete(self, path)
+        if size is not None and self._stats[0] is not None:
+            self._stats[0] -= 1
+            self._stats[1] -= size
+
+    def _over(self, fraction):
+        # If there are more entries than ``fraction`` of the limits allow.
+        n_files, total_size = self._stats
+        return (n_files >= self._max_entries * fraction or
+            (self._max_size is not None and total_size > self._max_size * fraction))
+
+    def _cull(self):
+        if self._stats[0] is not None and not self._over(1):
+            return
+        files = []
+        for root, dirs, names in os.walk(self._dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        self._stats[:] = [len(files), sum(size for mtime, size, path in files)]
+        if not self._over(1):
+            return
+        # This is called before an entry is written, so make room for it, and
+        # then some, like FileBasedCache removes 1/CULL_FREQUENCY of the
+        # entries, so the directory isn't walked again on the very next set.
+        if self._cull_frequency:
+            fraction = 1 - 1.0 / self._cull_frequency
+        else:
+            fraction = 0
+        for mtime, size, path in files:
+            if not self._over(fraction):
+                break
+            try:
+                self._delete(path)
+            except OSError:
+                pass
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
@@ -83,3 +83,31 @@ INSTALLED_APPS = [
 
     "tracebin_server.traces",
 ]
+
+# Uploads are saved here until they've been processed.
+UPLOAD_ROOT = os.path.join(PROJECT_ROOT, "uploads")
+# Traces' machine code, see traces.models.AssemblerBlob.
+ASM_ROOT = os.path.join(PROJECT_ROOT, "asm")
+# Process uploads in a pool of threads in the web process, rather than in the
+# request. ``manage.py process_uploads`` picks up any that are left over.
+INGEST_ASYNC = True
+INGEST_WORKERS = 2
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Rendered pages and JSON for processed logs, see traces.caching. For a
+    # cache shared between processes use tracebin_server.cache.LRUFileBasedCache,
+    # with a directory as the LOCATION.
+    "traces": {
+        "BACKEND": "tracebin_server.cache.LRUMemoryCache",
+        "LOCATION": "traces",
+        "TIMEOUT": 7 * 24 * 60 * 60,
+        "OPTIONS": {
+            "MAX_ENTRIES": 10000,
+            "MAX_SIZE": 128 * 1024 * 1024,
+        },
+    },
+}
+TRACE_CACHE = "traces"
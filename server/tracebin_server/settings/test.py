@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from tracebin_server.settings.base import *
 
@@ -11,3 +12,7 @@ DATABASES = {
         "NAME": ":memory:",
     },
 }
+
+UPLOAD_ROOT = tempfile.mkdtemp()
+ASM_ROOT = tempfile.mkdtemp()
+INGEST_ASYNC = False
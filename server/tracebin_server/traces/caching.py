@@ -0,0 +1,64 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from .models import Log
+
+
+def cache_log_page(view):
+    # Logs don't change once they've been processed, so their pages are
+    # cached by log and query string, and served with an ETag and
+    # Last-Modified so clients can revalidate. Cache hits don't touch the
+    # database.
+    @wraps(view)
+    def inner(request, id, **kwargs):
+        cache = get_cache(settings.TRACE_CACHE)
+        key = _cache_key(view, id, kwargs, request)
+        cached = cache.get(key)
+        if cached is not None:
+            if _not_modified(request, cached):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(cached["content"], content_type=cached["content_type"])
+        else:
+            try:
+                status, created_at = Log.objects.filter(id=id).values_list("status", "created_at").get()
+            except Log.DoesNotExist:
+                return view(request, id, **kwargs)
+            # The status has to be checked first, the log could finish
+            # processing while the view runs.
+            response = view(request, id, **kwargs)
+            if status != Log.DONE or response.status_code != 200:
+                return response
+            cached = {
+                "content": response.content,
+                "content_type": response["Content-type"],
+                "etag": hashlib.md5("{}:{}".format(key, created_at.isoformat())).hexdigest(),
+                "last_modified": int(time.mktime(created_at.timetuple())),
+            }
+            cache.set(key, cached)
+            if _not_modified(request, cached):
+                response = HttpResponseNotModified()
+        response["ETag"] = quote_etag(cached["etag"])
+        response["Last-Modified"] = http_date(cached["last_modified"])
+        return response
+    return inner
+
+def _cache_key(view, id, kwargs, request):
+    params = sorted(kwargs.items()) + sorted(request.GET.lists())
+    return "trace:{}:{}:{}".format(
+        view.__name__, id, hashlib.md5(repr(params)).hexdigest()
+    )
+
+def _not_modified(request, cached):
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return "*" in etags or cached["etag"] in etags
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return if_modified_since is not None and cached["last_modified"] <= if_modified_since
@@ -0,0 +1,610 @@
+import array
+import base64
+import hashlib
+import json
+import logging
+import os
+import traceback
+import zlib
+from cStringIO import StringIO
+from itertools import islice, izip
+
+from django.conf import settings
+from django.db import connections, transaction, DEFAULT_DB_ALIAS, IntegrityError
+
+from .models import (Log, UploadJob, RuntimeEnviroment, AssemblerBlob,
+    BaseTrace, PythonTrace, TraceSection, TraceChunk, ResOpChunk, ResOpDescr,
+    ResOpValue, ResOp, ResOpArg, PythonChunk, Function, Call, FunctionSummary, TimelineNode,
+    TimelineEvent)
+from .summary import FunctionSummaryBuilder
+from .timeline import TimelineBuilder, format_color
+
+
+logger = logging.getLogger(__name__)
+
+# Content-encoding: wbits for zlib.decompressobj, 32 + MAX_WBITS detects either
+# a zlib or gzip header, older clients sent zlib data labeled as gzip.
+UPLOAD_ENCODINGS = {
+    "gzip": 32 + zlib.MAX_WBITS,
+    "deflate": 32 + zlib.MAX_WBITS,
+}
+UPLOAD_READ_SIZE = 64 * 1024
+
+
+def _table_chain(model):
+    # The tables a model's rows are stored in, base model first, for
+    # multi-table inheritance.
+    chain = [model]
+    while chain[0]._meta.parents:
+        [parent] = chain[0]._meta.parents
+        chain.insert(0, parent)
+    return chain
+
+def _copy_value(value):
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    elif isinstance(value, float):
+        value = repr(value)
+    else:
+        value = str(value)
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class BulkInserter(object):
+    # Collects rows and writes them a table at a time, with multi-row INSERTs
+    # or COPY on PostgreSQL, instead of an INSERT per row (two for models with
+    # a parent model). Rows which other rows point at need their ids before
+    # they're written, so ids are allocated up front with allocate_ids(), rows
+    # added without one get theirs when they're written.
+    #
+    # Everything written to a table inside the transaction has to go through
+    # the same inserter, on SQLite ids are allocated from MAX(id).
+    BATCH_SIZE = 1000
+    # SQLite allows at most 999 parameters in a statement, and 500 SELECTs in
+    # a compound SELECT, which is how Django does multi-row inserts there.
+    SQLITE_MAX_VARIABLES = 999
+    SQLITE_MAX_COMPOUND_SELECT = 500
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, use_copy=None):
+        self.connection = connections[using]
+        if use_copy is None:
+            use_copy = self.connection.vendor == "postgresql"
+        self.use_copy = use_copy
+        self._pending = []
+        self._pending_by_model = {}
+        self._next_ids = {}
+
+    def allocate_ids(self, model, n):
+        model = _table_chain(model)[0]
+        if not n:
+            return []
+        opts = model._meta
+        cursor = self.connection.cursor()
+        if self.connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [opts.db_table, opts.pk.column, n]
+            )
+            return [row[0] for row in cursor.fetchall()]
+        if model not in self._next_ids:
+            qn = self.connection.ops.quote_name
+            cursor.execute("SELECT MAX({}) FROM {}".format(qn(opts.pk.column), qn(opts.db_table)))
+            self._next_ids[model] = (cursor.fetchone()[0] or 0) + 1
+        start = self._next_ids[model]
+        self._next_ids[model] += n
+        return range(start, start + n)
+
+    def set_id(self, obj, id):
+        for model in _table_chain(type(obj)):
+            setattr(obj, model._meta.pk.attname, id)
+
+    def add(self, obj):
+        model = type(obj)
+        if model not in self._pending_by_model:
+            self._pending_by_model[model] = []
+            self._pending.append((model, self._pending_by_model[model]))
+        self._pending_by_model[model].append(obj)
+
+    def flush(self):
+        # Rows are written in the order their models were first added, so
+        # add rows before the rows which point at them.
+        for model, objs in self._pending:
+            missing = [obj for obj in objs if obj.pk is None]
+            for obj, id in zip(missing, self.allocate_ids(model, len(missing))):
+                self.set_id(obj, id)
+            for table_model in _table_chain(model):
+                fields = table_model._meta.local_fields
+                self._write(table_model, fields, [
+                    [
+                        field.get_db_prep_save(field.pre_save(obj, True), connection=self.connection)
+                        for field in fields
+                    ]
+                    for obj in objs
+                ])
+        self._pending = []
+        self._pending_by_model = {}
+
+    def write_rows(self, model, field_names, rows, use_copy=None):
+        # Writes rows of already prepared values straight away, without
+        # creating model instances, for tables with lots of rows. ``model``
+        # can't have a parent model. Rows which might clash with a unique
+        # constraint should be written with use_copy=False, so it's Django's
+        # IntegrityError that's raised.
+        assert not model._meta.parents
+        self._write(model, [model._meta.get_field(name) for name in field_names], rows, use_copy)
+
+    def _write(self, model, fields, rows, use_copy=None):
+        if use_copy is None:
+            use_copy = self.use_copy
+        if use_copy:
+            self._copy(model._meta.db_table, [field.column for field in fields], rows)
+            return
+
+        if self.connection.vendor == "sqlite":
+            batch_size = min(self.SQLITE_MAX_COMPOUND_SELECT, self.SQLITE_MAX_VARIABLES // len(fields))
+        else:
+            batch_size = self.BATCH_SIZE
+        qn = self.connection.ops.quote_name
+        cursor = self.connection.cursor()
+        for i in xrange(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            sql = "INSERT INTO {} ({}) {}".format(
+                qn(model._meta.db_table),
+                ", ".join(qn(field.column) for field in fields),
+                self.connection.ops.bulk_insert_sql(fields, len(batch)),
+            )
+            cursor.execute(sql, [value for row in batch for value in row])
+
+    def _copy(self, table, columns, rows):
+        f = StringIO()
+        for row in rows:
+            f.write("\t".join([_copy_value(value) for value in row]))
+            f.write("\n")
+        f.seek(0)
+        self.connection.cursor().copy_from(f, table, columns=columns)
+
+
+def enqueue_upload(chunks, encoding):
+    # Saves the upload as it was sent, and creates the Log it'll be processed
+    # into, so there's somewhere to point the client at straight away.
+    if not os.path.isdir(settings.UPLOAD_ROOT):
+        os.makedirs(settings.UPLOAD_ROOT)
+    # They're all public=True until we have authentication for the client.
+    log = Log.objects.create(public=True, status=Log.PROCESSING, runtime=0)
+    job = UploadJob(log=log, payload="{:d}.upload".format(log.id), encoding=encoding or "")
+    with open(job.payload_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    job.save()
+    return job
+
+def read_payload(path, encoding):
+    with open(path, "rb") as f:
+        chunks = iter(lambda: f.read(UPLOAD_READ_SIZE), "")
+        if not encoding:
+            return "".join(chunks)
+        decompressor = zlib.decompressobj(UPLOAD_ENCODINGS[encoding])
+        data = [decompressor.decompress(chunk) for chunk in chunks]
+        data.append(decompressor.flush())
+        return "".join(data)
+
+def process_upload(job_id):
+    # Returns False if another worker already has the job.
+    claimed = UploadJob.objects.filter(
+        id=job_id, status=UploadJob.PENDING
+    ).update(status=UploadJob.RUNNING)
+    if not claimed:
+        return False
+    job = UploadJob.objects.select_related("log").get(id=job_id)
+    try:
+        data = json.loads(read_payload(job.payload_path, job.encoding))
+        with transaction.commit_on_success():
+            ingest_log(job.log, data)
+            UploadJob.objects.filter(id=job.id).update(status=UploadJob.DONE)
+    except Exception:
+        logger.exception("Processing upload for log {:d} failed".format(job.log_id))
+        UploadJob.objects.filter(id=job.id).update(
+            status=UploadJob.FAILED, error=traceback.format_exc()
+        )
+        Log.objects.filter(id=job.log_id).update(status=Log.FAILED)
+    else:
+        os.remove(job.payload_path)
+    return True
+
+def ingest_log(log, data, inserter=None):
+    if inserter is None:
+        inserter = BulkInserter()
+    calls = data.get("calls")
+    timeline = _timeline_builder(calls)
+    log.command = data.get("command", u"")
+    log.stdout = data.get("stdout", u"")
+    log.stderr = data.get("stderr", u"")
+    log.runtime = data.get("runtime")
+    log.status = Log.DONE
+    log.timeline_levels = timeline.levels
+    log.save(force_update=True)
+    for key, value in data.get("options", {}).iteritems():
+        if key == "jit":
+            kind = RuntimeEnviroment.JIT_OPTION
+        elif key == "gc":
+            kind = RuntimeEnviroment.GC_OPTION
+        elif key == "build":
+            kind = RuntimeEnviroment.BUILD_OPTION
+
+        for key, value in value.iteritems():
+            inserter.add(RuntimeEnviroment(log=log, kind=kind, key=key, value=value))
+
+    traces = data.get("traces", [])
+    trace_ids = inserter.allocate_ids(BaseTrace, len(traces))
+    section_ids = iter(inserter.allocate_ids(TraceSection,
+        sum(len(trace["sections"]) for trace in traces)
+    ))
+    # ResOps point at their chunks, so those need their ids up front.
+    chunk_ids = iter(inserter.allocate_ids(TraceChunk, sum(
+        len(section["chunks"]) for trace in traces for section in trace["sections"]
+    )))
+    descr_ids = _write_resop_texts(inserter, log, traces, ResOpDescr, "descrs")
+    value_ids = _write_resop_texts(inserter, log, traces, ResOpValue, "values")
+    asm_ids = _write_asm_blobs(inserter, data.get("asm", []))
+    resops = []
+    for trace_id, trace in zip(trace_ids, traces):
+        kwargs = {
+            "log": log,
+            "asm_id": asm_ids.get(trace.get("asm_hash")),
+            "asm_size": trace.get("asm_size"),
+        }
+        if trace["type"] == "python":
+            kwargs["root_file"] = trace["root_file"]
+            kwargs["root_function"] = trace["root_function"]
+            cls = PythonTrace
+
+        trace_obj = cls(**kwargs)
+        inserter.set_id(trace_obj, trace_id)
+        inserter.add(trace_obj)
+        for i, section in enumerate(trace["sections"]):
+            if section["label"] == "Entry":
+                label = TraceSection.ENTRY
+            elif section["label"] == "Preamble":
+                label = TraceSection.PREAMBLE
+            elif section["label"] == "Loop body":
+                label = TraceSection.LOOP_BODY
+
+            section_obj = TraceSection(id=next(section_ids), trace_id=trace_id, ordering=i, label=label)
+            inserter.add(section_obj)
+            for i, chunk in enumerate(section["chunks"]):
+                kwargs = {
+                    "section_id": section_obj.id,
+                    "ordering": i,
+                }
+                if chunk["type"] == "resop":
+                    cls = ResOpChunk
+                    if isinstance(chunk["ops"], dict):
+                        kwargs["raw_source"] = ""
+                        kwargs["op_count"] = len(chunk["ops"]["opcodes"])
+                    else:
+                        # Older clients send the ops' reprs.
+                        kwargs["raw_source"] = chunk["ops"]
+                elif chunk["type"] == "python":
+                    cls = PythonChunk
+                    kwargs["raw_source"] = chunk["source"]
+                    assert sorted(chunk["linenos"]) == chunk["linenos"]
+                    kwargs["start_line"] = chunk["linenos"][0]
+                    kwargs["end_line"] = chunk["linenos"][-1] + 1
+                chunk_obj = cls(**kwargs)
+                inserter.set_id(chunk_obj, next(chunk_ids))
+                inserter.add(chunk_obj)
+                if chunk["type"] == "resop" and isinstance(chunk["ops"], dict):
+                    _add_resops(resops, trace_id, chunk_obj.id, trace, descr_ids, value_ids, chunk["ops"])
+
+    if isinstance(calls, dict):
+        functions = [
+            Function(
+                log=log,
+                name=symbol["name"],
+                filename=symbol["filename"],
+                lineno=symbol["lineno"],
+            )
+            for symbol in calls["symbols"]
+        ]
+        for function, function_id in zip(functions, inserter.allocate_ids(Function, len(functions))):
+            inserter.set_id(function, function_id)
+            inserter.add(function)
+    inserter.flush()
+    _write_resops(inserter, resops)
+
+    summaries = FunctionSummaryBuilder()
+    if isinstance(calls, dict):
+        _add_call_tree(inserter, log, timeline, summaries, functions, calls)
+    elif calls is not None:
+        # Older clients send a nested list of calls, without a symbol table.
+        _add_calls(inserter, log, timeline, summaries, calls)
+    _write_timeline(inserter, log, timeline)
+    _write_function_summaries(inserter, log, summaries)
+    if data.get("jit_events") is not None:
+        _write_jit_events(inserter, log, data["jit_events"])
+    return log
+
+def _timeline_builder(calls):
+    if isinstance(calls, dict):
+        n_calls = len(calls["parents"])
+        if n_calls:
+            return TimelineBuilder(n_calls, max(calls["depths"]) + 1,
+                min(calls["start_times"]), max(calls["end_times"])
+            )
+    elif calls:
+        n_calls = n_depths = 0
+        start_time = float("inf")
+        end_time = float("-inf")
+        for call, depth, parent in _flatten_calls(calls):
+            n_calls += 1
+            n_depths = max(n_depths, depth + 1)
+            start_time = min(start_time, call["start_time"])
+            end_time = max(end_time, call["end_time"])
+        return TimelineBuilder(n_calls, n_depths, start_time, end_time)
+    return TimelineBuilder(0, 0, 0, 0)
+
+def _add_call_tree(inserter, log, timeline, summaries, functions, calls):
+    stats = _subtree_stats(izip(calls["start_times"], calls["end_times"], calls["parents"]))
+    _write_calls(inserter, log, timeline, summaries, stats, (
+        (functions[symbol_id].id, functions[symbol_id].name, start_time, end_time, depth, parent)
+        for symbol_id, start_time, end_time, depth, parent in izip(
+            calls["symbol_ids"], calls["start_times"], calls["end_times"],
+            calls["depths"], calls["parents"]
+        )
+    ))
+
+def _add_calls(inserter, log, timeline, summaries, calls):
+    stats = _subtree_stats(
+        (call["start_time"], call["end_time"], parent)
+        for call, depth, parent in _flatten_calls(calls)
+    )
+    _write_calls(inserter, log, timeline, summaries, stats, (
+        (None, call["name"], call["start_time"], call["end_time"], depth, parent)
+        for call, depth, parent in _flatten_calls(calls)
+    ))
+
+def _flatten_calls(calls):
+    # Yields (call, depth, parent index) in the order the calls were made,
+    # like the columnar format, without recursing, trees can be deeper than
+    # Python's recursion limit.
+    stack = [(iter(calls), -1)]
+    index = 0
+    while stack:
+        subcalls, parent = stack[-1]
+        call = next(subcalls, None)
+        if call is None:
+            stack.pop()
+            continue
+        yield call, len(stack) - 1, parent
+        if call["subcalls"]:
+            stack.append((iter(call["subcalls"]), index))
+        index += 1
+
+def _subtree_stats(calls):
+    # ``calls`` are (start time, end time, parent index) in call order, so
+    # going backwards every call is done before its parent. Returns the
+    # exclusive time, subtree size and subtree depth of each call.
+    parents = array.array("l")
+    times = array.array("d")
+    for start_time, end_time, parent in calls:
+        parents.append(parent)
+        times.append(end_time - start_time)
+    n_calls = len(parents)
+    exclusive_times = array.array("d", times)
+    subtree_sizes = array.array("l", [1]) * n_calls
+    subtree_depths = array.array("l", [0]) * n_calls
+    for i in reversed(xrange(n_calls)):
+        parent = parents[i]
+        if parent != -1:
+            exclusive_times[parent] -= times[i]
+            subtree_sizes[parent] += subtree_sizes[i]
+            if subtree_depths[i] >= subtree_depths[parent]:
+                subtree_depths[parent] = subtree_depths[i] + 1
+    return exclusive_times, subtree_sizes, subtree_depths
+
+ASM_LOOKUP_BATCH_SIZE = 500
+ASM_BLOB_FIELDS = ["id", "hash", "size"]
+
+def _write_asm_blobs(inserter, blocks):
+    # Saves the blocks of machine code which aren't already stored, for any
+    # log. Returns {hash: AssemblerBlob id}.
+    blocks = dict((block["hash"], block) for block in blocks)
+    hashes = blocks.keys()
+    asm_ids = {}
+    for start in xrange(0, len(hashes), ASM_LOOKUP_BATCH_SIZE):
+        asm_ids.update(AssemblerBlob.objects.filter(
+            hash__in=hashes[start:start + ASM_LOOKUP_BATCH_SIZE]
+        ).values_list("hash", "id"))
+    new_blobs = []
+    for asm_hash in hashes:
+        if asm_hash in asm_ids:
+            continue
+        compressed = base64.b64decode(blocks[asm_hash]["data"])
+        asm = zlib.decompress(compressed)
+        # It's shared with other logs, so make sure it's what it says it is.
+        if hashlib.sha1(asm).hexdigest() != asm_hash:
+            raise ValueError("Machine code doesn't match its hash: {}".format(asm_hash))
+        blob = AssemblerBlob(hash=asm_hash, size=len(asm))
+        _write_file(blob.path, compressed)
+        new_blobs.append(blob)
+    ids = inserter.allocate_ids(AssemblerBlob, len(new_blobs))
+    rows = [(id, blob.hash, blob.size) for id, blob in izip(ids, new_blobs)]
+    using = inserter.connection.alias
+    sid = transaction.savepoint(using=using)
+    try:
+        inserter.write_rows(AssemblerBlob, ASM_BLOB_FIELDS, rows, use_copy=False)
+    except IntegrityError:
+        # Another upload stored some of the same blocks after we looked, so
+        # they're written one at a time, and theirs are used where they clash.
+        transaction.savepoint_rollback(sid, using=using)
+        for row in rows:
+            sid = transaction.savepoint(using=using)
+            try:
+                inserter.write_rows(AssemblerBlob, ASM_BLOB_FIELDS, [row], use_copy=False)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid, using=using)
+                asm_ids[row[1]] = AssemblerBlob.objects.get(hash=row[1]).id
+            else:
+                transaction.savepoint_commit(sid, using=using)
+                asm_ids[row[1]] = row[0]
+    else:
+        transaction.savepoint_commit(sid, using=using)
+        asm_ids.update((asm_hash, id) for id, asm_hash, size in rows)
+    return asm_ids
+
+def _write_file(path, data):
+    # Written under another name first, so nothing ever sees half a file.
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = "{}.{:d}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+def _write_resop_texts(inserter, log, traces, model, key):
+    # Each trace numbers its descrs and values itself, they're written once
+    # per log. Returns {text: id}.
+    texts = []
+    seen = set()
+    for trace in traces:
+        for text in trace.get(key, []):
+            if text not in seen:
+                seen.add(text)
+                texts.append(text)
+    ids = inserter.allocate_ids(model, len(texts))
+    inserter.write_rows(model, ["id", "log", "text"], [
+        (id, log.id, text) for id, text in izip(ids, texts)
+    ])
+    return dict(izip(texts, ids))
+
+def _add_resops(resops, trace_id, chunk_id, trace, descr_ids, value_ids, ops):
+    # ``ops`` are columns, see the client's tracebin.resops.ResOpEncoder.
+    # Each op is its row, then the value ids of its args and fail args.
+    opnames = trace["opnames"]
+    descr_ids = [descr_ids[text] for text in trace["descrs"]]
+    value_ids = [value_ids[text] for text in trace["values"]]
+    for i, (opcode, result, args, descr, fail_args) in enumerate(izip(
+        ops["opcodes"], ops["results"], ops["args"], ops["descrs"], ops["fail_args"]
+    )):
+        resops.append((
+            (
+                chunk_id, trace_id, i, opnames[opcode],
+                None if result is None else value_ids[result],
+                None if descr is None else descr_ids[descr],
+                fail_args is not None,
+            ),
+            [value_ids[arg] for arg in args],
+            [value_ids[arg] for arg in fail_args or []],
+        ))
+
+RESOP_FIELDS = [
+    "id", "chunk", "trace", "ordering", "name", "result", "descr",
+    "has_fail_args",
+]
+RESOP_ARG_FIELDS = ["id", "op", "ordering", "value", "is_fail_arg"]
+RESOP_BATCH_SIZE = 100000
+
+def _write_resops(inserter, resops):
+    for start in xrange(0, len(resops), RESOP_BATCH_SIZE):
+        batch = resops[start:start + RESOP_BATCH_SIZE]
+        ids = inserter.allocate_ids(ResOp, len(batch))
+        inserter.write_rows(ResOp, RESOP_FIELDS, [
+            (id,) + row for id, (row, args, fail_args) in izip(ids, batch)
+        ])
+        arg_rows = []
+        for id, (row, args, fail_args) in izip(ids, batch):
+            for i, value_id in enumerate(args):
+                arg_rows.append((id, i, value_id, False))
+            for i, value_id in enumerate(fail_args, len(args)):
+                arg_rows.append((id, i, value_id, True))
+        arg_ids = inserter.allocate_ids(ResOpArg, len(arg_rows))
+        inserter.write_rows(ResOpArg, RESOP_ARG_FIELDS, [
+            (id,) + row for id, row in izip(arg_ids, arg_rows)
+        ])
+
+CALL_FIELDS = [
+    "id", "log", "function", "name", "start_time", "end_time", "call_depth",
+    "parent", "exclusive_time", "subtree_size", "subtree_depth",
+]
+CALL_BATCH_SIZE = 100000
+
+def _write_calls(inserter, log, timeline, summaries, stats, calls):
+    # ``calls`` are (function id, name, start time, end time, depth, parent
+    # index) in call order, so a call's parent, and its id, always come
+    # before it. Ids are allocated a batch at a time, and each batch is
+    # written with parent ids already filled in.
+    exclusive_times, subtree_sizes, subtree_depths = stats
+    call_ids = array.array("l")
+    calls = iter(calls)
+    while True:
+        batch = list(islice(calls, CALL_BATCH_SIZE))
+        if not batch:
+            break
+        offset = len(call_ids)
+        ids = inserter.allocate_ids(Call, len(batch))
+        call_ids.extend(ids)
+        rows = []
+        for i, (id, (function_id, name, start_time, end_time, depth, parent)) in enumerate(izip(ids, batch), offset):
+            timeline.add(depth, start_time, end_time, name, id)
+            summaries.add(function_id, name, start_time, end_time, exclusive_times[i])
+            rows.append((
+                id, log.id, function_id, name, start_time, end_time, depth,
+                None if parent == -1 else call_ids[parent],
+                exclusive_times[i], subtree_sizes[i], subtree_depths[i],
+            ))
+        inserter.write_rows(Call, CALL_FIELDS, rows)
+
+TIMELINE_NODE_FIELDS = [
+    "id", "log", "level", "depth", "start_time", "end_time", "names", "color",
+    "call",
+]
+
+def _write_timeline(inserter, log, timeline):
+    nodes = timeline.finish()
+    while True:
+        batch = list(islice(nodes, CALL_BATCH_SIZE))
+        if not batch:
+            break
+        ids = inserter.allocate_ids(TimelineNode, len(batch))
+        inserter.write_rows(TimelineNode, TIMELINE_NODE_FIELDS, [
+            (id, log.id, level, depth, node.start_time, node.end_time, ", ".join(sorted(node.name)), format_color(node.color), node.call_id)
+            for id, (level, depth, node) in izip(ids, batch)
+        ])
+
+FUNCTION_SUMMARY_FIELDS = [
+    "id", "log", "function", "name", "call_count", "total_time", "exclusive_time",
+    "min_time", "max_time", "median_time", "p90_time", "p99_time",
+]
+
+TIMELINE_EVENT_FIELDS = ["id", "log", "event_type", "start_time", "end_time"]
+
+def _write_jit_events(inserter, log, events):
+    # ``events`` are columns, see the client's tracebin.pypylog.JitEvents.
+    # Their times are ticks since the machine started, they're stored from
+    # the first event instead, or Log.section_times' sums would overflow.
+    event_types = events["event_types"]
+    start = min(events["start_times"]) if events["start_times"] else 0
+    events = izip(events["event_ids"], events["start_times"], events["end_times"])
+    while True:
+        batch = list(islice(events, CALL_BATCH_SIZE))
+        if not batch:
+            break
+        ids = inserter.allocate_ids(TimelineEvent, len(batch))
+        inserter.write_rows(TimelineEvent, TIMELINE_EVENT_FIELDS, [
+            (id, log.id, event_types[event_id], start_time - start, end_time - start)
+            for id, (event_id, start_time, end_time) in izip(ids, batch)
+        ])
+
+def _write_function_summaries(inserter, log, summaries):
+    rows = list(summaries.finish())
+    ids = inserter.allocate_ids(FunctionSummary, len(rows))
+    inserter.write_rows(FunctionSummary, FUNCTION_SUMMARY_FIELDS, [
+        (id, log.id) + tuple(times)
+        for id, times in izip(ids, rows)
+    ])
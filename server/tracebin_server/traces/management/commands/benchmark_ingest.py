@@ -0,0 +1,154 @@
+import time
+from collections import defaultdict
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+
+from tracebin_server.traces.ingest import BulkInserter, ingest_log
+from tracebin_server.traces.models import Log
+
+
+def make_calls(n_calls):
+    # main() calls f() over and over, which calls g().
+    parents = [-1]
+    depths = [0]
+    symbol_ids = [0]
+    for i in xrange(1, n_calls):
+        if i % 2:
+            parents.append(0)
+            depths.append(1)
+            symbol_ids.append(1)
+        else:
+            parents.append(i - 1)
+            depths.append(2)
+            symbol_ids.append(2)
+    return {
+        "symbols": [
+            {"name": name, "filename": "bench.py", "lineno": i}
+            for i, name in enumerate(["main", "f", "g"])
+        ],
+        "symbol_ids": symbol_ids,
+        "start_times": [float(i) for i in xrange(n_calls)],
+        "end_times": [float(i + 1) for i in xrange(n_calls)],
+        "parents": parents,
+        "depths": depths,
+    }
+
+def make_log_data(n_traces, n_calls):
+    return {
+        "command": "pypy bench.py",
+        "stdout": "",
+        "stderr": "",
+        "runtime": 10.0,
+        "options": {
+            "jit": {"trace_limit": "6000", "threshold": "1039"},
+            "gc": {"PYPY_GC_NURSERY": "4MB"},
+        },
+        "traces": [
+            {
+                "type": "python",
+                "root_file": "bench.py",
+                "root_function": "f{:d}".format(i),
+                "opnames": ["int_lt", "guard_true", "int_add", "jump"],
+                "descrs": ["<Guard3>", "TargetToken(7)"],
+                "values": ["i1", "i2", "i3", "i4", "p0", "1"],
+                "sections": [
+                    {
+                        "label": label,
+                        "chunks": [
+                            {
+                                "type": "python",
+                                "linenos": [10, 11],
+                                "source": "    while i < n:\n        i += 1\n",
+                            },
+                            {
+                                "type": "resop",
+                                "ops": {
+                                    "opcodes": [0, 1],
+                                    "results": [2, None],
+                                    "args": [[0, 1], [2]],
+                                    "descrs": [None, 0],
+                                    "fail_args": [None, [4, 0]],
+                                },
+                            },
+                            {
+                                "type": "python",
+                                "linenos": [12],
+                                "source": "        total += i\n",
+                            },
+                            {
+                                "type": "resop",
+                                "ops": {
+                                    "opcodes": [2, 3],
+                                    "results": [3, None],
+                                    "args": [[0, 5], [3, 1]],
+                                    "descrs": [None, 1],
+                                    "fail_args": [None, None],
+                                },
+                            },
+                        ],
+                    }
+                    for label in ["Entry", "Preamble", "Loop body"]
+                ],
+            }
+            for i in xrange(n_traces)
+        ],
+        "calls": make_calls(n_calls) if n_calls else None,
+    }
+
+
+class RowInserter(BulkInserter):
+    # An INSERT per row (two for models with a parent model), the way uploads
+    # were written before BulkInserter, for --baseline.
+    def _write(self, model, fields, rows, use_copy=None):
+        qn = self.connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            qn(model._meta.db_table),
+            ", ".join(qn(field.column) for field in fields),
+            ", ".join(["%s"] * len(fields)),
+        )
+        cursor = self.connection.cursor()
+        for row in rows:
+            cursor.execute(sql, list(row))
+
+
+class Command(NoArgsCommand):
+    help = "Times ingesting a synthetic log with lots of traces and calls, then rolls it back."
+    option_list = NoArgsCommand.option_list + (
+        make_option("--traces", type="int", dest="traces", default=5000),
+        make_option("--calls", type="int", dest="calls", default=0),
+        make_option("--baseline", action="store_true", dest="baseline", default=False,
+            help="Also time writing the same log a row at a time."),
+    )
+
+    def handle_noargs(self, **options):
+        data = make_log_data(options["traces"], options["calls"])
+        self.stdout.write("{:d} traces and {:d} calls\n".format(options["traces"], options["calls"]))
+        if options["baseline"]:
+            self.report("row at a time", data, RowInserter)
+        self.report("bulk", data, BulkInserter)
+
+    def report(self, label, data, inserter_cls):
+        # Record the queries, even with DEBUG off.
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            with transaction.commit_manually():
+                try:
+                    start = time.time()
+                    ingest_log(Log.objects.create(runtime=0), data, inserter_cls())
+                    elapsed = time.time() - start
+                finally:
+                    transaction.rollback()
+        finally:
+            settings.DEBUG = old_debug
+
+        counts = defaultdict(int)
+        for query in connection.queries:
+            counts[query["sql"].split(None, 1)[0].upper()] += 1
+        self.stdout.write("{}: ingested in {:.3f}s\n".format(label, elapsed))
+        for kind, count in sorted(counts.iteritems()):
+            self.stdout.write("{:>10} {:d}\n".format(kind, count))
@@ -0,0 +1,76 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+
+from tracebin_server.traces.ingest import ingest_log
+from tracebin_server.traces.models import Log
+from tracebin_server.traces.views import trace_timeline_call_data, trace_call_data
+
+from .benchmark_ingest import make_log_data
+
+
+# (start_percent, end_percent) windows on the timeline, zooming in.
+WINDOWS = [(0, 1), (.25, .75), (.5, .51), (.5, .5001), (.5, .500001)]
+
+
+class Command(NoArgsCommand):
+    help = "Times the timeline and call data views on a synthetic log, then rolls it back."
+    option_list = NoArgsCommand.option_list + (
+        make_option("--calls", type="int", dest="calls", default=1000000),
+        make_option("--repeat", type="int", dest="repeat", default=3),
+    )
+
+    def handle_noargs(self, **options):
+        data = make_log_data(0, options["calls"])
+        factory = RequestFactory()
+
+        with transaction.commit_manually():
+            try:
+                log = Log.objects.create(runtime=0)
+                start = time.time()
+                ingest_log(log, data)
+                self.stdout.write("{:d} calls ingested in {:.3f}s\n".format(
+                    options["calls"], time.time() - start
+                ))
+
+                for start_percent, end_percent in WINDOWS:
+                    request = factory.get("/", {
+                        "start_percent": start_percent, "end_percent": end_percent,
+                    })
+                    self.report(
+                        "timeline {:g}-{:g}".format(start_percent, end_percent),
+                        options["repeat"], trace_timeline_call_data, request, log.id,
+                    )
+
+                for name in ["main", "f", "g"]:
+                    call_id = log.calls.filter(name=name).values_list("id", flat=True)[0]
+                    request = factory.get("/", {"call_id": call_id})
+                    self.report(
+                        "call {}".format(name),
+                        options["repeat"], trace_call_data, request, log.id,
+                    )
+            finally:
+                transaction.rollback()
+
+    def report(self, label, repeat, view, request, log_id):
+        # Record the queries, even with DEBUG off.
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            timings = []
+            for i in xrange(repeat):
+                # Otherwise every repeat's just a hit in the page cache.
+                get_cache(settings.TRACE_CACHE).clear()
+                connection.queries = []
+                start = time.time()
+                view(request, log_id)
+                timings.append(time.time() - start)
+            queries = len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+        self.stdout.write("{:<30} {:>3d} queries {:>9.3f}s\n".format(label, queries, min(timings)))
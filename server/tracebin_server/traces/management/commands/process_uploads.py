@@ -0,0 +1,29 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+
+from tracebin_server.traces.models import UploadJob
+from tracebin_server.traces.workers import IngestPool
+
+
+class Command(NoArgsCommand):
+    help = "Processes uploads which are waiting, e.g. after the web server was restarted."
+    option_list = NoArgsCommand.option_list + (
+        make_option("--workers", type="int", dest="workers", default=settings.INGEST_WORKERS),
+        make_option("--watch", type="float", dest="watch", metavar="INTERVAL"),
+    )
+
+    def handle_noargs(self, **options):
+        pool = IngestPool(options["workers"])
+        while True:
+            job_ids = list(UploadJob.objects.filter(
+                status=UploadJob.PENDING
+            ).order_by("id").values_list("id", flat=True))
+            for job_id in job_ids:
+                pool.submit(job_id)
+            pool.join()
+            if options["watch"] is None:
+                break
+            time.sleep(options["watch"])
@@ -1,29 +1,125 @@
+from itertools import islice, izip
+
+from django.db import connections, models
 from django.db.models import Manager
 from django.db.models.query import QuerySet
 
 
+class InheritanceTypeField(models.CharField):
+    # The model a row was saved as, for InheritanceManager. It's filled in
+    # when a row is saved, or written by ingest.BulkInserter.
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_length", 100)
+        kwargs.setdefault("editable", False)
+        super(InheritanceTypeField, self).__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = model_instance._meta.module_name
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class InheritanceQuerySet(QuerySet):
-    @property
-    def _child_rels(self):
-        return [
-            rel
-            for rel in self.model._meta.get_all_related_objects()
-            if rel.field.rel.parent_link
-        ]
+    # Yields instances of the model each row was saved as. The base rows are
+    # read first, then, for each chunk of them, the subclass rows with one
+    # query per subclass present, rather than joining every subclass table.
+    # Only direct subclasses are supported.
+    CHUNK_SIZE = 500
+
+    _children_cache = {}
+
+    @classmethod
+    def _children(cls, model):
+        # {module name: (subclass, the attnames of its local fields)}
+        if model not in cls._children_cache:
+            children = {}
+            for rel in model._meta.get_all_related_objects():
+                if rel.field.rel.parent_link:
+                    children[rel.model._meta.module_name] = (
+                        rel.model, [field.attname for field in rel.model._meta.local_fields]
+                    )
+            cls._children_cache[model] = children
+        return cls._children_cache[model]
+
+    @classmethod
+    def _type_field(cls, model):
+        for field in model._meta.fields:
+            if isinstance(field, InheritanceTypeField):
+                return field
 
     def iterator(self):
-        for obj in super(InheritanceQuerySet, self).iterator():
-            for rel in self._child_rels:
-                if getattr(obj, rel.get_cache_name(), None) is not None:
-                    yield getattr(obj, rel.var_name)
-                    break
-            else:
-                yield obj
+        children = self._children(self.model)
+        type_attname = self._type_field(self.model).attname
+        objs = super(InheritanceQuerySet, self).iterator()
+        while True:
+            chunk = list(islice(objs, self.CHUNK_SIZE))
+            if not chunk:
+                break
+            by_type = {}
+            for obj in chunk:
+                if getattr(obj, type_attname) in children:
+                    by_type.setdefault(getattr(obj, type_attname), []).append(obj)
+            child_objs = {}
+            for module_name, objs_of_type in by_type.iteritems():
+                child_model, local_attnames = children[module_name]
+                # Filtering on the parent link through the ORM looks up each
+                # value through the related model, which is slow.
+                qn = connections[self.db].ops.quote_name
+                rows = child_model._base_manager.using(self.db).extra(where=[
+                    "{}.{} IN ({})".format(
+                        qn(child_model._meta.db_table), qn(child_model._meta.pk.column),
+                        ", ".join(["%s"] * len(objs_of_type)),
+                    )
+                ], params=[obj.pk for obj in objs_of_type]).values_list(*local_attnames)
+                pk_index = local_attnames.index(child_model._meta.pk.attname)
+                local_values = dict((row[pk_index], row) for row in rows)
+                attnames = [field.attname for field in child_model._meta.fields]
+                for obj in objs_of_type:
+                    values = obj.__dict__.copy()
+                    values.update(izip(local_attnames, local_values[obj.pk]))
+                    child = child_model(*[values[attname] for attname in attnames])
+                    child._state.db = obj._state.db
+                    child._state.adding = False
+                    # So the parent link doesn't fetch the row again, as the
+                    # subclass.
+                    setattr(child, child_model._meta.parents[self.model].get_cache_name(), obj)
+                    child_objs[obj.pk] = child
+            for obj in chunk:
+                yield child_objs.get(obj.pk, obj)
 
 
 class InheritanceManager(Manager):
     use_for_related_fields = True
 
     def get_query_set(self):
-        qs = InheritanceQuerySet(self.model, using=self._db)
-        return qs.select_related(*[rel.var_name for rel in qs._child_rels])
+        return InheritanceQuerySet(self.model, using=self._db)
+
+
+class IntervalQuerySet(QuerySet):
+    def overlapping(self, key, start_time, end_time):
+        # Rows with ``INTERVAL_KEY`` equal to ``key`` whose [start_time,
+        # end_time] overlaps the given one. On PostgreSQL that's a GiST lookup
+        # on the box made from both, see the sql/ directory.
+        connection = connections[self.db]
+        if connection.vendor != "postgresql":
+            return self.filter(end_time__gte=start_time, start_time__lte=end_time)
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        key_sql = self.model.INTERVAL_KEY.format(table=table)
+        return self.extra(
+            where=[
+                "box(point({table}.{start}, {key}), point({table}.{end}, {key})) && "
+                "box(point(%s, %s), point(%s, %s))".format(
+                    table=table, key=key_sql, start=qn("start_time"), end=qn("end_time"),
+                )
+            ],
+            params=[start_time, key, end_time, key],
+        )
+
+
+class IntervalManager(Manager):
+    def get_query_set(self):
+        return IntervalQuerySet(self.model, using=self._db)
+
+    def overlapping(self, *args, **kwargs):
+        return self.get_query_set().overlapping(*args, **kwargs)
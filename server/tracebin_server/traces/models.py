@@ -1,15 +1,32 @@
+import os
+import zlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.utils.functional import cached_property
 
-from .managers import InheritanceManager
+from .managers import InheritanceManager, InheritanceTypeField, IntervalManager
 
 
 class Log(models.Model):
+    PROCESSING, DONE, FAILED = 1, 2, 3
+    STATUS_CHOICES = [
+        (PROCESSING, "processing"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    ]
+
     # Anonymous users are None.
     uploader = models.ForeignKey(User, null=True)
     public = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Uploads are processed in the background, until then there's nothing
+    # but the Log itself.
+    status = models.IntegerField(choices=STATUS_CHOICES, default=DONE)
+    # How many levels of TimelineNodes there are, see timeline.TimelineBuilder.
+    timeline_levels = models.PositiveIntegerField(default=0)
 
     command = models.CharField(max_length=255)
     stdout = models.TextField()
@@ -55,6 +72,30 @@ class Log(models.Model):
         ]
 
 
+class UploadJob(models.Model):
+    PENDING, RUNNING, DONE, FAILED = 1, 2, 3, 4
+    STATUS_CHOICES = [
+        (PENDING, "pending"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    ]
+
+    log = models.OneToOneField(Log, related_name="upload_job")
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    # The upload as it was sent, relative to settings.UPLOAD_ROOT, it's removed
+    # once it's been processed.
+    payload = models.CharField(max_length=255)
+    # The Content-encoding it was sent with, if any.
+    encoding = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    error = models.TextField(blank=True)
+
+    @property
+    def payload_path(self):
+        return os.path.join(settings.UPLOAD_ROOT, self.payload)
+
+
 class RuntimeEnviroment(models.Model):
     BUILD_OPTION, GC_OPTION, JIT_OPTION = 1, 2, 3
     KIND_CHOICES = [
@@ -92,11 +133,39 @@ class StatCounter(models.Model):
     label = models.CharField(max_length=255)
     count = models.IntegerField()
 
+class AssemblerBlob(models.Model):
+    # A block of machine code, stored once however many traces (from however
+    # many logs) have it, compressed, in a file under settings.ASM_ROOT named
+    # by its SHA-1.
+    hash = models.CharField(max_length=40, unique=True)
+    size = models.PositiveIntegerField()
+
+    @property
+    def path(self):
+        return os.path.join(settings.ASM_ROOT, self.hash[:2], self.hash)
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return zlib.decompress(f.read())
+
 class BaseTrace(models.Model):
     log = models.ForeignKey(Log, related_name="traces")
+    type = InheritanceTypeField()
+    # Logs from older clients don't have the machine code.
+    asm = models.ForeignKey(AssemblerBlob, null=True, related_name="+")
+    # The asm's size, so it can be summed up without any joins.
+    asm_size = models.PositiveIntegerField(null=True)
 
     objects = InheritanceManager()
 
+    def op_counts(self):
+        # [(op name, count)], most common first. Only counts the ops of
+        # ResOpChunks from clients which send them already taken apart.
+        return list(
+            self.resops.values_list("name").annotate(count=models.Count("id"))
+            .order_by("-count", "name")
+        )
+
 class PythonTrace(BaseTrace):
     is_python = True
     description = "Python loops"
@@ -138,11 +207,10 @@ class TraceSection(models.Model):
 class TraceChunk(models.Model):
     section = models.ForeignKey(TraceSection, related_name="chunks")
     ordering = models.IntegerField()
-    # Consider breaking raw_source up into individaul lines, especailly for
-    # ResOps (where we might want to make the op, args, result, and descr into
-    # seperate thigns so we can display them better, and do statistics without
-    # needing to parse them)
+    # ResOpChunks from clients which send ops already taken apart have their
+    # ops as ResOps instead, and this is empty.
     raw_source = models.TextField()
+    type = InheritanceTypeField()
 
     objects = InheritanceManager()
 
@@ -166,15 +234,147 @@ class PythonChunk(TraceChunk):
 class ResOpChunk(TraceChunk):
     is_resop = True
 
+    # How many ResOps there are, none for chunks with raw_source.
+    op_count = models.PositiveIntegerField(default=0)
+
+class ResOpDescr(models.Model):
+    # Shared by all the ResOps in a log with the same descr.
+    log = models.ForeignKey(Log, related_name="resop_descrs")
+    text = models.TextField()
+
+class ResOpValue(models.Model):
+    # A box or constant, shared by all the ResOps in a log which use it.
+    log = models.ForeignKey(Log, related_name="resop_values")
+    text = models.TextField()
+
+class ResOp(models.Model):
+    chunk = models.ForeignKey(ResOpChunk, related_name="resops")
+    # The chunk's, so counting a trace's ops doesn't need any joins.
+    trace = models.ForeignKey(BaseTrace, related_name="resops")
+    ordering = models.PositiveIntegerField()
+    name = models.CharField(max_length=100)
+    result = models.ForeignKey(ResOpValue, null=True, related_name="+")
+    descr = models.ForeignKey(ResOpDescr, null=True, related_name="+")
+    # Only guards have them, though they can be empty.
+    has_fail_args = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["ordering"]
+
+    def get_args(self):
+        # ([args], [fail args]) as their values' texts. The compiled view
+        # fetches them for a whole page of ResOps at once.
+        if not hasattr(self, "_args"):
+            self._args = ([], [])
+            for arg in self.args.select_related("value"):
+                self._args[arg.is_fail_arg].append(arg.value.text)
+        return self._args
+
+    def __unicode__(self):
+        args, fail_args = self.get_args()
+        if self.descr_id is not None:
+            args = args + [u"descr=" + self.descr.text]
+        text = u"{}({})".format(self.name, u", ".join(args))
+        if self.result_id is not None:
+            text = u"{} = {}".format(self.result.text, text)
+        if self.has_fail_args:
+            text = u"{} [{}]".format(text, u", ".join(fail_args))
+        return text
+
+class ResOpArg(models.Model):
+    op = models.ForeignKey(ResOp, related_name="args")
+    ordering = models.PositiveIntegerField()
+    value = models.ForeignKey(ResOpValue, related_name="+")
+    is_fail_arg = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["ordering"]
+
 class AssemblerChunk(TraceChunk):
     pass
 
 
+class Function(models.Model):
+    log = models.ForeignKey(Log, related_name="functions")
+
+    name = models.CharField(max_length=255)
+    # For builtins this is the module (or type) they come from, and there's no
+    # lineno.
+    filename = models.CharField(max_length=255)
+    lineno = models.PositiveIntegerField(null=True)
+
+
 class Call(models.Model):
     log = models.ForeignKey(Log, related_name="calls")
+    # Logs uploaded without a symbol table only have the name.
+    function = models.ForeignKey(Function, null=True, related_name="calls")
 
     name = models.CharField(max_length=255)
     start_time = models.FloatField()
     end_time = models.FloatField()
     call_depth = models.PositiveIntegerField()
     parent = models.ForeignKey("self", null=True, related_name="subcalls")
+    # Worked out by ingest_log, calls added some other way don't have them.
+    # The time not spent in subcalls.
+    exclusive_time = models.FloatField(null=True)
+    # The number of calls in the subtree, including this one, and how many
+    # levels there are below this one.
+    subtree_size = models.PositiveIntegerField(null=True)
+    subtree_depth = models.PositiveIntegerField(null=True)
+
+    # See IntervalQuerySet.overlapping, and sql/call.postgresql_psycopg2.sql
+    # for the index.
+    INTERVAL_KEY = "{table}.log_id"
+
+    objects = IntervalManager()
+
+    def same_function_calls(self):
+        if self.function_id is not None:
+            return self.log.calls.filter(function=self.function_id)
+        return self.log.calls.filter(name=self.name)
+
+    def function_summary(self):
+        if self.function_id is not None:
+            return FunctionSummary.objects.get(log=self.log_id, function=self.function_id)
+        return FunctionSummary.objects.get(log=self.log_id, function=None, name=self.name)
+
+
+class FunctionSummary(models.Model):
+    # The calls to one function in a log, summed up at ingest, see
+    # summary.FunctionSummaryBuilder. Logs without a symbol table have one per
+    # name instead.
+    log = models.ForeignKey(Log, related_name="function_summaries")
+    function = models.ForeignKey(Function, null=True, related_name="+")
+    name = models.CharField(max_length=255)
+
+    call_count = models.PositiveIntegerField()
+    total_time = models.FloatField()
+    exclusive_time = models.FloatField()
+    min_time = models.FloatField()
+    max_time = models.FloatField()
+    median_time = models.FloatField()
+    p90_time = models.FloatField()
+    p99_time = models.FloatField()
+
+
+class TimelineNode(models.Model):
+    # The calls at one depth merged together for showing the timeline at one
+    # zoom level, see timeline.TimelineBuilder.
+    log = models.ForeignKey(Log, related_name="timeline_nodes")
+    level = models.PositiveIntegerField()
+    depth = models.PositiveIntegerField()
+    start_time = models.FloatField()
+    end_time = models.FloatField()
+    # Comma separated, merged nodes only have some of their names.
+    names = models.TextField()
+    color = models.CharField(max_length=7)
+    # Set if this is a single call.
+    call = models.ForeignKey(Call, null=True, related_name="+")
+
+    INTERVAL_KEY = "{table}.log_id * 32 + {table}.level"
+
+    objects = IntervalManager()
+
+    @staticmethod
+    def interval_key(log_id, level):
+        return log_id * 32 + level
@@ -0,0 +1,5 @@
+-- Calls as boxes with their time span on x and their log on y, so a window
+-- on the timeline is a single GiST lookup, see IntervalQuerySet.overlapping.
+CREATE INDEX traces_call_interval ON traces_call USING gist (
+    box(point(start_time, log_id), point(end_time, log_id))
+);
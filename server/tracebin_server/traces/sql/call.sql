@@ -0,0 +1,7 @@
+-- Window queries on the timeline, and same_function_calls().
+CREATE INDEX traces_call_log_id_start_time ON traces_call (log_id, start_time);
+CREATE INDEX traces_call_log_id_end_time ON traces_call (log_id, end_time);
+CREATE INDEX traces_call_log_id_function_id ON traces_call (log_id, function_id);
+CREATE INDEX traces_call_log_id_name ON traces_call (log_id, name);
+-- Sorting a log's calls by their own time.
+CREATE INDEX traces_call_log_id_exclusive_time ON traces_call (log_id, exclusive_time);
@@ -0,0 +1,3 @@
+CREATE INDEX traces_functionsummary_log_id_function_id ON traces_functionsummary (log_id, function_id);
+CREATE INDEX traces_functionsummary_log_id_name ON traces_functionsummary (log_id, name);
+CREATE INDEX traces_functionsummary_log_id_exclusive_time ON traces_functionsummary (log_id, exclusive_time);
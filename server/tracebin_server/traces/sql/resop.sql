@@ -0,0 +1,2 @@
+-- Counting a trace's ops by name, BaseTrace.op_counts().
+CREATE INDEX traces_resop_trace_id_name ON traces_resop (trace_id, name);
@@ -0,0 +1,4 @@
+-- See call.postgresql_psycopg2.sql, y is TimelineNode.INTERVAL_KEY.
+CREATE INDEX traces_timelinenode_interval ON traces_timelinenode USING gist (
+    box(point(start_time, log_id * 32 + level), point(end_time, log_id * 32 + level))
+);
@@ -0,0 +1 @@
+CREATE INDEX traces_timelinenode_log_id_level_start_time ON traces_timelinenode (log_id, level, start_time);
@@ -0,0 +1,48 @@
+import array
+from collections import namedtuple
+from itertools import izip
+
+
+FunctionTimes = namedtuple("FunctionTimes", [
+    "function_id", "name", "call_count", "total_time", "exclusive_time",
+    "min_time", "max_time", "median_time", "p90_time", "p99_time",
+])
+
+
+def percentile(sorted_times, percent):
+    # Nearest rank.
+    index = max(0, -(-len(sorted_times) * percent // 100) - 1)
+    return sorted_times[int(index)]
+
+
+class FunctionSummaryBuilder(object):
+    # Sums up the calls to each function as they're added. Calls without a
+    # function are grouped by name, like Call.same_function_calls. A
+    # function's exclusive time is the sum of its calls' exclusive times,
+    # which is its total time minus the time spent in its direct subcalls,
+    # as in the call data view.
+    def __init__(self):
+        self._indexes = {}
+        self._functions = []
+        self._times = []
+        self._exclusive_times = []
+
+    def add(self, function_id, name, start_time, end_time, exclusive_time):
+        key = function_id if function_id is not None else name
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = len(self._functions)
+            self._functions.append((function_id, name))
+            self._times.append(array.array("d"))
+            self._exclusive_times.append(0.0)
+        self._times[index].append(end_time - start_time)
+        self._exclusive_times[index] += exclusive_time
+
+    def finish(self):
+        for (function_id, name), times, exclusive_time in izip(self._functions, self._times, self._exclusive_times):
+            times = sorted(times)
+            yield FunctionTimes(
+                function_id, name, len(times), sum(times), exclusive_time,
+                times[0], times[-1], percentile(times, 50), percentile(times, 90),
+                percentile(times, 99),
+            )
@@ -1,19 +1,48 @@
+import base64
+import gzip
+import hashlib
+import imp
 import json
+import os
+import shutil
+import tempfile
+import time
 import zlib
+from cStringIO import StringIO
 from operator import attrgetter
 
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import override_settings
 
-from .models import (Log, RuntimeEnviroment, PythonTrace, RegexTrace,
-    NumPyPyTrace, TraceSection, ResOpChunk, PythonChunk, Call)
+from tracebin_server.cache import LRUMemoryCache, LRUFileBasedCache
+
+from . import ingest, workers
+from .ingest import ingest_log, enqueue_upload, process_upload
+from .models import (Log, UploadJob, RuntimeEnviroment, AssemblerBlob, BaseTrace, PythonTrace, RegexTrace,
+    NumPyPyTrace, TraceSection, TraceChunk, ResOpChunk, ResOpDescr, ResOpValue, ResOp, ResOpArg,
+    PythonChunk, Call)
+from .managers import InheritanceQuerySet
+from .views import CHUNKS_PER_PAGE
+
+
+CLIENT_UPLOAD_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, os.pardir, "client", "tracebin", "upload.py"
+)
 
 
 class BaseTraceTests(TestCase):
+    def setUp(self):
+        get_cache(settings.TRACE_CACHE).clear()
+
     def _request(self, method, url_name, **kwargs):
         status_code = kwargs.pop("status_code", 200)
         meth_kwargs = {}
-        for key in ["data", "content_type", "CONTENT_ENCODING"]:
+        for key in ["data", "content_type", "HTTP_CONTENT_ENCODING", "HTTP_TRANSFER_ENCODING", "wsgi.input", "wsgi.input_terminated", "HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE"]:
             if key in kwargs:
                 meth_kwargs[key] = kwargs.pop(key)
 
@@ -82,9 +111,41 @@ class InheritanceManagerTests(BaseTraceTests):
             (NumPyPyTrace, num_trace.id),
         ], attrgetter("__class__", "id"))
 
-        with self.assertNumQueries(1):
+        # The base table, then one query per subclass, without joins.
+        with self.assertNumQueries(4):
             list(log.traces.all())
 
+    def test_chunks(self):
+        log = self.create_log()
+        trace = self.create_trace(PythonTrace, log=log)
+        section = trace.sections.create(ordering=0, label=TraceSection.ENTRY)
+        for i in xrange(InheritanceQuerySet.CHUNK_SIZE + 2):
+            if i % 3:
+                section.chunks.add(ResOpChunk(ordering=i, raw_source="op{:d}".format(i)))
+            else:
+                section.chunks.add(PythonChunk(ordering=i, raw_source="x", start_line=i, end_line=i + 1))
+        self.assertEqual(
+            set(TraceChunk.objects.values_list("type", flat=True)),
+            {"resopchunk", "pythonchunk"},
+        )
+
+        # The base rows, then a query per subclass for each of the two chunks
+        # of them.
+        with self.assertNumQueries(5):
+            chunks = list(section.chunks.all())
+        self.assertEqual(
+            [(type(chunk), chunk.ordering) for chunk in chunks],
+            [(PythonChunk if i % 3 == 0 else ResOpChunk, i) for i in xrange(InheritanceQuerySet.CHUNK_SIZE + 2)],
+        )
+        self.assert_attributes(chunks[3], start_line=3, end_line=4, raw_source="x", section_id=section.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(chunks[3].tracechunk_ptr.id, chunks[3].id)
+
+        # Rows saved as the base model stay as they are.
+        chunk = TraceChunk.objects.create(section=section, ordering=-1, raw_source="")
+        self.assertEqual(type(section.chunks.get(ordering=-1)), TraceChunk)
+        self.assertEqual(chunk.type, "tracechunk")
+
 class LogTests(BaseTraceTests):
     def test_options(self):
         log = self.create_log()
@@ -214,6 +275,46 @@ class UploadLogTests(BaseTraceTests):
         self.assertEqual(subcall.name, "g")
         self.assertEqual(subcall.parent.name, "f")
 
+    def test_calls_symbols(self):
+        # main() calls f() from x.py, which calls append, and then f() from
+        # y.py.
+        self.post("trace_upload", data=json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 2.3,
+            "calls": {
+                "symbols": [
+                    {"name": "main", "filename": "x.py", "lineno": 1},
+                    {"name": "f", "filename": "x.py", "lineno": 5},
+                    {"name": "f", "filename": "y.py", "lineno": 5},
+                    {"name": "append", "filename": "__builtin__.list", "lineno": None},
+                ],
+                "symbol_ids": [0, 1, 3, 2],
+                "start_times": [0.0, .2, .25, 1.2],
+                "end_times": [2.0, .4, .35, 1.8],
+                "parents": [-1, 0, 1, 0],
+                "depths": [0, 1, 2, 1],
+            },
+        }), content_type="application/json", status_code=302)
+
+        log = Log.objects.get()
+        self.assertQuerysetEqual(log.functions.order_by("id"), [
+            ("main", "x.py", 1),
+            ("f", "x.py", 5),
+            ("f", "y.py", 5),
+            ("append", "__builtin__.list", None),
+        ], attrgetter("name", "filename", "lineno"))
+        self.assertQuerysetEqual(log.calls.order_by("start_time"), [
+            ("main", "x.py", 0),
+            ("f", "x.py", 1),
+            ("append", "__builtin__.list", 2),
+            ("f", "y.py", 1),
+        ], attrgetter("name", "function.filename", "call_depth"))
+        call = log.calls.get(name="append")
+        self.assertEqual(call.parent.function.filename, "x.py")
+        self.assertEqual(call.parent.parent.name, "main")
+
     def test_trace(self):
         response = self.post("trace_upload", data=json.dumps({
             "command": "pypy x.py",
@@ -271,6 +372,177 @@ class UploadLogTests(BaseTraceTests):
         chunk = section.chunks.get(ordering=1)
         self.assert_attributes(chunk, start_line=87, end_line=90)
 
+    def test_trace_resops(self):
+        trace = {
+            "type": "python",
+            "root_file": "x.py",
+            "root_function": "main",
+            "opnames": ["label", "int_lt", "guard_true", "jump"],
+            "descrs": ["TargetToken(700)", "<Guard3>"],
+            "values": ["i1", "i2", "i3", "p0"],
+            "sections": [
+                {
+                    "label": "Loop body",
+                    "chunks": [
+                        {
+                            "type": "resop",
+                            "ops": {
+                                "opcodes": [0, 1, 2, 3],
+                                "results": [None, 2, None, None],
+                                "args": [[0, 1], [0, 1], [2], [0, 1]],
+                                "descrs": [0, None, 1, 0],
+                                "fail_args": [None, None, [3, 0], None],
+                            },
+                        },
+                    ],
+                },
+            ],
+        }
+        self.post("trace_upload", data=json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 2.3,
+            "calls": None,
+            "traces": [trace, dict(trace, root_function="f")],
+        }), content_type="application/json", status_code=302)
+
+        log = Log.objects.get()
+        self.assertEqual(log.resop_descrs.count(), 2)
+        self.assertEqual(log.resop_values.count(), 4)
+        trace = log.traces.get(pythontrace__root_function="main")
+        chunk = ResOpChunk.objects.get(section__trace=trace)
+        self.assert_attributes(chunk, raw_source="", op_count=4)
+        self.assertQuerysetEqual(chunk.resops.select_related("descr"), [
+            "label(i1, i2, descr=TargetToken(700))",
+            "i3 = int_lt(i1, i2)",
+            "guard_true(i3, descr=<Guard3>) [p0, i1]",
+            "jump(i1, i2, descr=TargetToken(700))",
+        ], unicode)
+        self.assertEqual(trace.op_counts(), [
+            ("guard_true", 1), ("int_lt", 1), ("jump", 1), ("label", 1),
+        ])
+        # Args are stored by value, not as text.
+        i1 = log.resop_values.get(text="i1")
+        self.assertEqual(
+            sorted(ResOpArg.objects.filter(op__trace=trace, value=i1).values_list("op__name", "is_fail_arg")),
+            [("guard_true", True), ("int_lt", False), ("jump", False), ("label", False)],
+        )
+
+    def test_trace_asm(self):
+        asm = "\x55\x48\x89\xe5" * 100
+        asm_hash = hashlib.sha1(asm).hexdigest()
+        data = json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 2.3,
+            "calls": None,
+            "traces": [
+                {
+                    "type": "python",
+                    "root_file": "x.py",
+                    "root_function": name,
+                    "asm_hash": asm_hash,
+                    "asm_size": len(asm),
+                    "sections": [],
+                }
+                for name in ["f", "g"]
+            ],
+            "asm": [
+                {"hash": asm_hash, "size": len(asm), "data": base64.b64encode(zlib.compress(asm))},
+            ],
+        })
+        self.post("trace_upload", data=data, content_type="application/json", status_code=302)
+        self.post("trace_upload", data=data, content_type="application/json", status_code=302)
+
+        # Stored once, for both logs.
+        blob = AssemblerBlob.objects.get()
+        self.assert_attributes(blob, hash=asm_hash, size=len(asm))
+        self.assertEqual(blob.read(), asm)
+        self.assertQuerysetEqual(BaseTrace.objects.order_by("id"), [
+            (blob.id, len(asm)),
+        ] * 4, attrgetter("asm_id", "asm_size"))
+
+        log = Log.objects.order_by("-id")[0]
+        response = self.get("trace_compiled_list", id=log.id)
+        self.assertContains(response, '<span class="asm-size">400 bytes</span>', count=2)
+        self.assertContains(response, "800 bytes of machine code")
+
+    def test_trace_asm_bad_hash(self):
+        log = self.create_log()
+        with self.assertRaises(ValueError):
+            ingest_log(log, {
+                "runtime": 0,
+                "asm": [
+                    {"hash": "0" * 40, "size": 1, "data": base64.b64encode(zlib.compress("x"))},
+                ],
+            })
+
+    def test_trace_asm_concurrent(self):
+        # Another upload with the same new block stores it after this one's
+        # looked for it, but before it's stored it.
+        asm = "\x55\x48\x89\xe5" * 100
+        asm_hash = hashlib.sha1(asm).hexdigest()
+        other = AssemblerBlob(hash=asm_hash, size=len(asm))
+        old_write_file = ingest._write_file
+        def write_file(path, data):
+            old_write_file(path, data)
+            if other.pk is None:
+                other.save()
+        ingest._write_file = write_file
+        try:
+            for i in xrange(2):
+                log = self.create_log()
+                ingest_log(log, {
+                    "runtime": 0,
+                    "traces": [
+                        {
+                            "type": "python",
+                            "root_file": "x.py",
+                            "root_function": "f",
+                            "asm_hash": asm_hash,
+                            "asm_size": len(asm),
+                            "sections": [],
+                        },
+                    ],
+                    "asm": [
+                        {"hash": asm_hash, "size": len(asm), "data": base64.b64encode(zlib.compress(asm))},
+                    ],
+                })
+                self.assertEqual(log.traces.get().asm_id, other.id)
+        finally:
+            ingest._write_file = old_write_file
+        self.assertEqual(AssemblerBlob.objects.get(), other)
+
+    def test_jit_events(self):
+        self.post("trace_upload", data=json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 2.3,
+            "jit_events": {
+                "event_types": ["running", "jit-tracing", "gc-minor"],
+                "event_ids": [0, 1, 2, 1, 0],
+                "start_times": [10 ** 13, 10 ** 13 + 60, 10 ** 13 + 70, 10 ** 13 + 80, 10 ** 13 + 90],
+                "end_times": [10 ** 13 + 60, 10 ** 13 + 70, 10 ** 13 + 80, 10 ** 13 + 90, 10 ** 13 + 100],
+            },
+        }), content_type="application/json", status_code=302)
+
+        log = Log.objects.get()
+        self.assertQuerysetEqual(log.timeline_events.order_by("start_time"), [
+            ("running", 0, 60),
+            ("jit-tracing", 60, 70),
+            ("gc-minor", 70, 80),
+            ("jit-tracing", 80, 90),
+            ("running", 90, 100),
+        ], attrgetter("event_type", "start_time", "end_time"))
+        self.assertEqual(log.section_times, [
+            ("running", 70),
+            ("jit-tracing", 20),
+            ("gc-minor", 10),
+        ])
+
     def test_efficiency(self):
         subcalls = [
             {
@@ -282,7 +554,10 @@ class UploadLogTests(BaseTraceTests):
             }
             for i in xrange(1, 99)
         ]
-        with self.assertNumQueries(3):
+        # Saving the upload, and then claiming, processing and finishing the
+        # upload job takes 6 queries, the function summaries 2, and the calls
+        # 3, SQLite only takes 90 rows of them per INSERT.
+        with self.assertNumQueries(11):
             self.post("trace_upload", data=json.dumps({
                 "command": "pypy x.py",
                 "stdout": "",
@@ -300,6 +575,117 @@ class UploadLogTests(BaseTraceTests):
                 ],
             }), content_type="application/json", status_code=302)
 
+    def test_deep_calls(self):
+        depth = 20000
+        self.post("trace_upload", data=json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "calls": {
+                "symbols": [
+                    {"name": "f", "filename": "x.py", "lineno": 1},
+                ],
+                "symbol_ids": [0] * depth,
+                "start_times": range(depth),
+                "end_times": range(2 * depth, depth, -1),
+                "parents": range(-1, depth - 1),
+                "depths": range(depth),
+            },
+        }), content_type="application/json", status_code=302)
+
+        log = Log.objects.get()
+        self.assertEqual(log.calls.count(), depth)
+        call = log.calls.get(call_depth=depth - 1)
+        self.assert_attributes(call, start_time=depth - 1, end_time=depth + 1)
+        self.assert_attributes(call.parent, call_depth=depth - 2, start_time=depth - 2)
+        self.assertEqual(call.function.name, "f")
+        self.assert_attributes(call, exclusive_time=2, subtree_size=1, subtree_depth=0)
+        root = log.calls.get(parent=None)
+        self.assert_attributes(root, exclusive_time=2, subtree_size=depth, subtree_depth=depth - 1)
+
+    def test_deep_calls_nested(self):
+        depth = 20000
+        calls = []
+        subcalls = calls
+        for i in xrange(depth):
+            call = {
+                "type": "python",
+                "name": "f",
+                "start_time": i,
+                "end_time": 2 * depth - i,
+                "subcalls": [],
+            }
+            subcalls.append(call)
+            subcalls = call["subcalls"]
+        # The JSON decoder recurses, so this skips it.
+        log = self.create_log()
+        ingest_log(log, {
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "calls": calls,
+        })
+
+        self.assertEqual(log.calls.count(), depth)
+        call = log.calls.get(call_depth=depth - 1)
+        self.assert_attributes(call, start_time=depth - 1, end_time=depth + 1)
+        self.assert_attributes(call.parent, call_depth=depth - 2, start_time=depth - 2)
+        root = log.calls.get(parent=None)
+        self.assert_attributes(root, exclusive_time=2, subtree_size=depth, subtree_depth=depth - 1)
+
+    def test_trace_efficiency(self):
+        data = json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "options": {},
+            "traces": [
+                {
+                    "type": "python",
+                    "root_file": "x.py",
+                    "root_function": "f{:d}".format(i),
+                    "sections": [
+                        {
+                            "label": label,
+                            "chunks": [
+                                {
+                                    "type": "resop",
+                                    "ops": "jump(i1)",
+                                },
+                                {
+                                    "type": "python",
+                                    "linenos": [1, 2],
+                                    "source": "x\ny\n",
+                                },
+                            ],
+                        }
+                        for label in ["Entry", "Preamble", "Loop body"]
+                    ],
+                }
+                for i in xrange(200)
+            ],
+        })
+        self.post("trace_upload", data=data, content_type="application/json", status_code=302)
+        # Allocating ids for traces, sections and chunks is a query each, then
+        # each table is inserted into as many rows at a time as SQLite allows,
+        # on top of the 6 queries for the upload job.
+        with self.assertNumQueries(27):
+            self.post("trace_upload", data=data, content_type="application/json", status_code=302)
+
+        self.assertEqual(PythonTrace.objects.count(), 400)
+        self.assertEqual(TraceSection.objects.count(), 1200)
+        self.assertEqual(ResOpChunk.objects.count(), 1200)
+        log = Log.objects.order_by("-id")[0]
+        trace = log.traces.get(pythontrace__root_function="f199")
+        section = trace.sections.get(label=TraceSection.LOOP_BODY)
+        self.assertQuerysetEqual(section.chunks.all(), [
+            (ResOpChunk, 0, "jump(i1)"),
+            (PythonChunk, 1, "x\ny\n"),
+        ], attrgetter("__class__", "ordering", "raw_source"))
+
     def test_compressed_data(self):
         data = json.dumps({
             "command": "pypy x.py",
@@ -309,10 +695,424 @@ class UploadLogTests(BaseTraceTests):
             "options": {},
             "calls": [],
         })
-        self.post("trace_upload", data=zlib.compress(data), content_type="application/json", CONTENT_ENCODING="gzip", status_code=302)
+        self.post("trace_upload", data=zlib.compress(data), content_type="application/json", HTTP_CONTENT_ENCODING="gzip", status_code=302)
         log = Log.objects.get()
         self.assert_attributes(log, command="pypy x.py", stderr="", runtime=20)
 
+    def _compressed_upload_data(self):
+        return json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 20,
+            "options": {},
+            "calls": [],
+        })
+
+    def _gzip(self, data):
+        f = StringIO()
+        with gzip.GzipFile(fileobj=f, mode="wb") as g:
+            g.write(data)
+        return f.getvalue()
+
+    def test_gzip_data(self):
+        data = self._gzip(self._compressed_upload_data())
+        self.post("trace_upload", data=data, content_type="application/json", HTTP_CONTENT_ENCODING="gzip", status_code=302)
+        log = Log.objects.get()
+        self.assert_attributes(log, command="pypy x.py", runtime=20)
+
+    def test_deflate_data(self):
+        data = zlib.compress(self._compressed_upload_data())
+        self.post("trace_upload", data=data, content_type="application/json", HTTP_CONTENT_ENCODING="deflate", status_code=302)
+        log = Log.objects.get()
+        self.assert_attributes(log, command="pypy x.py", runtime=20)
+
+    def test_chunked_data(self):
+        data = self._gzip(self._compressed_upload_data())
+        body = "".join(
+            "{:x}\r\n{}\r\n".format(len(data[i:i + 10]), data[i:i + 10])
+            for i in xrange(0, len(data), 10)
+        ) + "0\r\n\r\n"
+        self.post("trace_upload",
+            content_type="application/json",
+            HTTP_CONTENT_ENCODING="gzip",
+            HTTP_TRANSFER_ENCODING="chunked",
+            status_code=302,
+            **{"wsgi.input": StringIO(body)}
+        )
+        log = Log.objects.get()
+        self.assert_attributes(log, command="pypy x.py", runtime=20)
+
+    def test_chunked_data_input_terminated(self):
+        data = self._gzip(self._compressed_upload_data())
+        self.post("trace_upload",
+            content_type="application/json",
+            HTTP_CONTENT_ENCODING="gzip",
+            HTTP_TRANSFER_ENCODING="chunked",
+            status_code=302,
+            **{"wsgi.input": StringIO(data), "wsgi.input_terminated": True}
+        )
+        log = Log.objects.get()
+        self.assert_attributes(log, command="pypy x.py", runtime=20)
+
+    def test_client_compressed_data(self):
+        # Compressed by the client's own code, and sent with the header it
+        # sends.
+        upload = imp.load_source("tracebin_upload", CLIENT_UPLOAD_PATH)
+        data = self._compressed_upload_data()
+        for codec, (content_encoding, wbits) in sorted(upload.CODECS.iteritems()):
+            body = "".join(upload.compress_chunks([data[i:i + 10] for i in xrange(0, len(data), 10)], codec))
+            self.post("trace_upload", data=body, content_type="application/json",
+                HTTP_CONTENT_ENCODING=content_encoding, status_code=302)
+        self.assertQuerysetEqual(Log.objects.order_by("id"), [
+            (Log.DONE, "pypy x.py"),
+        ] * 2, attrgetter("status", "command"))
+
+class UploadJobTests(BaseTraceTests):
+    def enqueue(self, data):
+        return enqueue_upload([zlib.compress(json.dumps(data))], "deflate")
+
+    def test_upload(self):
+        response = self.post("trace_upload", data=json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 2.3,
+        }), content_type="application/json", status_code=302)
+        log = Log.objects.get()
+        self.assertEqual(log.status, Log.DONE)
+        self.assertEqual(response["Location"], "http://testserver" + log.get_absolute_url())
+        job = log.upload_job
+        self.assertEqual(job.status, UploadJob.DONE)
+        self.assertFalse(os.path.exists(job.payload_path))
+
+    def test_process(self):
+        job = self.enqueue({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 2.3,
+        })
+        self.assert_attributes(job.log, status=Log.PROCESSING, command="")
+        response = self.get("trace_overview", id=job.log.id)
+        self.assertContains(response, "still being processed")
+
+        self.assertTrue(process_upload(job.id))
+        log = Log.objects.get()
+        self.assert_attributes(log, status=Log.DONE, command="pypy x.py", runtime=2.3)
+        response = self.get("trace_overview", id=log.id)
+        self.assertNotContains(response, "still being processed")
+
+        # It's already been processed.
+        self.assertFalse(process_upload(job.id))
+
+    def test_process_failure(self):
+        job = self.enqueue({
+            "command": "pypy x.py",
+            "runtime": 2.3,
+            "traces": [{}],
+        })
+        self.assertTrue(process_upload(job.id))
+
+        log = Log.objects.get()
+        self.assertEqual(log.status, Log.FAILED)
+        job = UploadJob.objects.get()
+        self.assertEqual(job.status, UploadJob.FAILED)
+        self.assertIn("KeyError", job.error)
+        response = self.get("trace_overview", id=log.id)
+        self.assertContains(response, "Processing this upload failed")
+
+    @override_settings(INGEST_ASYNC=True, INGEST_WORKERS=2)
+    def test_sqlite_ingests_one_at_a_time(self):
+        running = []
+        overlapped = []
+        def process_upload(job_id):
+            running.append(job_id)
+            overlapped.append(len(running) > 1)
+            time.sleep(.05)
+            running.remove(job_id)
+        old_process_upload = workers.process_upload
+        workers.process_upload = process_upload
+        workers._pool = None
+        try:
+            workers.submit_upload(1)
+            workers.submit_upload(2)
+            workers._pool.join()
+        finally:
+            workers.process_upload = old_process_upload
+            workers._pool = None
+        self.assertEqual(overlapped, [False, False])
+
+
+class CompiledDetailTests(BaseTraceTests):
+    def create_compiled(self, n_chunks):
+        log = self.create_log()
+        ingest_log(log, {
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "traces": [
+                {
+                    "type": "python",
+                    "root_file": "x.py",
+                    "root_function": "main",
+                    "sections": [
+                        {
+                            "label": "Entry",
+                            "chunks": [],
+                        },
+                        {
+                            "label": "Preamble",
+                            "chunks": [
+                                {
+                                    "type": "python",
+                                    "linenos": [1],
+                                    "source": "while i:\n",
+                                },
+                            ],
+                        },
+                        {
+                            "label": "Loop body",
+                            "chunks": [
+                                {
+                                    "type": "resop",
+                                    "ops": "op{:d}()".format(i),
+                                }
+                                for i in xrange(n_chunks - 1)
+                            ],
+                        },
+                    ],
+                },
+            ],
+        })
+        return log, log.traces.get()
+
+    def test_pages(self):
+        log, trace = self.create_compiled(CHUNKS_PER_PAGE * 2 + 10)
+        # The page cache, the log, the trace (and its subclass), the
+        # sections, the count, the chunks (and their two subclasses), and the
+        # sidebar's stats.
+        with self.assertNumQueries(11):
+            response = self.get("trace_compiled_detail", id=log.id, compiled_id=trace.id)
+        self.assertEqual(
+            [(section.get_label_display(), len(chunks)) for section, chunks in response.context["sections"]],
+            [("Entry", 0), ("Preamble", 1), ("Loop body", CHUNKS_PER_PAGE - 1)],
+        )
+        self.assertContains(response, "op0()")
+        self.assertNotContains(response, "op{:d}()".format(CHUNKS_PER_PAGE - 1))
+        self.assertContains(response, 'href="?page=2"')
+
+        response = self.get("trace_compiled_detail", id=log.id, compiled_id=trace.id, data={
+            "page": 3, "partial": 1,
+        })
+        self.assertEqual(
+            [(section.get_label_display(), len(chunks)) for section, chunks in response.context["sections"]],
+            [("Loop body", 10)],
+        )
+        self.assertNotContains(response, "<h1>")
+        self.assertNotContains(response, "<html")
+        self.assertContains(response, "op{:d}()".format(CHUNKS_PER_PAGE * 2 + 8))
+
+        self.get("trace_compiled_detail", id=log.id, compiled_id=trace.id, data={"page": 4}, status_code=404)
+
+    def test_resops(self):
+        log, trace = self.create_compiled(2)
+        chunk = ResOpChunk.objects.get()
+        chunk.op_count = 2
+        chunk.save()
+        descr = ResOpDescr.objects.create(log=log, text="<Guard3>")
+        i1, i2, i3, p0 = [ResOpValue.objects.create(log=log, text=text) for text in ["i1", "i2", "i3", "p0"]]
+        op = ResOp.objects.create(chunk=chunk, trace=trace, ordering=0, name="int_lt", result=i3)
+        op.args.create(ordering=0, value=i1)
+        op.args.create(ordering=1, value=i2)
+        op = ResOp.objects.create(chunk=chunk, trace=trace, ordering=1, name="guard_true", descr=descr, has_fail_args=True)
+        op.args.create(ordering=0, value=i3)
+        op.args.create(ordering=1, value=p0, is_fail_arg=True)
+        # The ResOps of the page's chunks, and their args, take two more
+        # queries.
+        with self.assertNumQueries(13):
+            response = self.get("trace_compiled_detail", id=log.id, compiled_id=trace.id)
+        self.assertContains(response, "i3 = int_lt(i1, i2)\nguard_true(i3, descr=&lt;Guard3&gt;) [p0]")
+        self.assertNotContains(response, "op0()")
+
+    def test_no_chunks_page_boundary(self):
+        # The Preamble has no chunks, and comes after the last chunk on the
+        # first page.
+        log = self.create_log()
+        ingest_log(log, {
+            "runtime": 0,
+            "traces": [
+                {
+                    "type": "python",
+                    "root_file": "x.py",
+                    "root_function": "main",
+                    "sections": [
+                        {
+                            "label": label,
+                            "chunks": [
+                                {"type": "resop", "ops": "op{:d}()".format(i)}
+                                for i in xrange(n_chunks)
+                            ],
+                        }
+                        for label, n_chunks in [("Entry", CHUNKS_PER_PAGE), ("Preamble", 0), ("Loop body", 1)]
+                    ],
+                },
+            ],
+        })
+        trace = log.traces.get()
+        pages = []
+        for page in [1, 2]:
+            response = self.get("trace_compiled_detail", id=log.id, compiled_id=trace.id, data={"page": page})
+            pages.append([
+                (section.get_label_display(), len(chunks)) for section, chunks in response.context["sections"]
+            ])
+        self.assertEqual(pages, [
+            [("Entry", CHUNKS_PER_PAGE), ("Preamble", 0)],
+            [("Loop body", 1)],
+        ])
+
+    def test_no_chunks(self):
+        log, trace = self.create_compiled(0)
+        TraceChunk.objects.all().delete()
+        response = self.get("trace_compiled_detail", id=log.id, compiled_id=trace.id)
+        self.assertEqual(
+            [(section.get_label_display(), chunks) for section, chunks in response.context["sections"]],
+            [("Entry", []), ("Preamble", []), ("Loop body", [])],
+        )
+        self.assertNotContains(response, 'id="more-chunks"')
+
+
+class PageCacheTests(BaseTraceTests):
+    def test_cached(self):
+        log = self.create_log()
+        response = self.get("trace_overview", id=log.id)
+        with self.assertNumQueries(0):
+            cached_response = self.get("trace_overview", id=log.id)
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response["ETag"], response["ETag"])
+        self.assertEqual(cached_response["Last-Modified"], response["Last-Modified"])
+
+        # Different parameters are cached separately.
+        self.create_call(log=log, name="a", start_time=0, end_time=1)
+        response = self.get("trace_timeline_call_data", id=log.id)
+        self.assertEqual(len(json.loads(response.content)), 1)
+        response = self.get("trace_timeline_call_data", id=log.id, data={"end_percent": .5})
+        self.assertNotEqual(response["ETag"], cached_response["ETag"])
+
+    def test_not_modified(self):
+        log = self.create_log()
+        response = self.get("trace_overview", id=log.id)
+        with self.assertNumQueries(0):
+            self.get("trace_overview", id=log.id, HTTP_IF_NONE_MATCH=response["ETag"], status_code=304)
+            self.get("trace_overview", id=log.id, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"], status_code=304)
+            self.get("trace_overview", id=log.id, HTTP_IF_NONE_MATCH='"nope"')
+
+    def test_not_modified_uncached(self):
+        log = self.create_log()
+        etag = self.get("trace_overview", id=log.id)["ETag"]
+        get_cache(settings.TRACE_CACHE).clear()
+        self.get("trace_overview", id=log.id, HTTP_IF_NONE_MATCH=etag, status_code=304)
+
+    def test_processing(self):
+        log = self.create_log()
+        log.status = Log.PROCESSING
+        log.save()
+        response = self.get("trace_overview", id=log.id)
+        self.assertFalse(response.has_header("ETag"))
+
+        log.status = Log.DONE
+        log.save()
+        response = self.get("trace_overview", id=log.id)
+        self.assertNotContains(response, "still being processed")
+        self.assertTrue(response.has_header("ETag"))
+
+    def test_not_found(self):
+        self.get("trace_overview", id=1, status_code=404)
+        log = self.create_log()
+        self.get("trace_compiled_detail", id=log.id, compiled_id=1, status_code=404)
+        self.get("trace_compiled_detail", id=log.id, compiled_id=1, status_code=404)
+
+
+class LRUCacheTests(TestCase):
+    def test_memory_max_entries(self):
+        cache = LRUMemoryCache("test-max-entries", {"OPTIONS": {"MAX_ENTRIES": 2}})
+        cache.clear()
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_memory_max_size(self):
+        cache = LRUMemoryCache("test-max-size", {"OPTIONS": {"MAX_SIZE": 2500}})
+        cache.clear()
+        cache.set("a", "a" * 1000)
+        cache.set("b", "b" * 1000)
+        cache.get("a")
+        cache.set("c", "c" * 1000)
+        self.assertTrue(cache.has_key("a"))
+        self.assertFalse(cache.has_key("b"))
+        self.assertTrue(cache.has_key("c"))
+        cache.delete("a")
+        cache.set("d", "d" * 1000)
+        self.assertTrue(cache.has_key("c"))
+
+    def test_memory_expires(self):
+        cache = LRUMemoryCache("test-expires", {})
+        cache.clear()
+        cache.set("a", 1, timeout=-1)
+        self.assertIsNone(cache.get("a"))
+        self.assertTrue(cache.add("a", 2))
+        self.assertFalse(cache.add("a", 3))
+        self.assertEqual(cache.get("a"), 2)
+
+    def test_file_based(self):
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        cache = LRUFileBasedCache(dir, {"OPTIONS": {"MAX_ENTRIES": 2}})
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # Make "b" the least recently used, mtimes can be coarse.
+        old = time.time() - 60
+        os.utime(cache._key_to_file(cache.make_key("b")), (old, old))
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_file_based_walks(self):
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        cache = LRUFileBasedCache(dir, {"OPTIONS": {"MAX_ENTRIES": 6, "CULL_FREQUENCY": 2}})
+        walks = []
+        old_walk = os.walk
+        def walk(top, *args):
+            # It calls itself for each subdirectory.
+            if top == dir:
+                walks.append(top)
+            return old_walk(top, *args)
+        os.walk = walk
+        try:
+            # Only the first set, and the one that goes over MAX_ENTRIES, have
+            # to look at the directory. That one culls it to half full,
+            # counting the entry it's making room for.
+            for key in "abcdefg":
+                cache.set(key, key)
+            cache.set("g", "g")
+            cache.delete("g")
+            cache.set("h", "h")
+            cache.set("i", "i")
+        finally:
+            os.walk = old_walk
+        self.assertEqual(len(walks), 2)
+        self.assertEqual(sum(len(names) for root, dirs, names in os.walk(dir)), 4)
+        self.assertEqual(cache._stats[0], 4)
+
+
 class CallDataTests(BaseTraceTests):
     def test_basic_timeline_data(self):
         log = self.create_log()
@@ -366,6 +1166,96 @@ class CallDataTests(BaseTraceTests):
             },
         ])
 
+    def test_timeline_levels(self):
+        n_calls = 3000
+        self.post("trace_upload", data=json.dumps({
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "calls": {
+                "symbols": [
+                    {"name": "f", "filename": "x.py", "lineno": 1},
+                    {"name": "g", "filename": "x.py", "lineno": 2},
+                ],
+                "symbol_ids": [i % 2 for i in xrange(n_calls)],
+                "start_times": range(n_calls),
+                "end_times": range(1, n_calls + 1),
+                "parents": [-1] * n_calls,
+                "depths": [0] * n_calls,
+            },
+        }), content_type="application/json", status_code=302)
+        log = Log.objects.get()
+        self.assertEqual(log.timeline_levels, 3)
+        # Nodes are at least 2 pixels wide, apart from the last one.
+        n_nodes = log.timeline_nodes.filter(level=0).count()
+        self.assertTrue(0 < n_nodes <= 675 // 2 + 1)
+
+        # One of them is the page cache checking the log's status.
+        with self.assertNumQueries(4):
+            response = self.get("trace_timeline_call_data", id=log.id)
+        nodes = json.loads(response.content)
+        self.assertEqual(len(nodes), n_nodes)
+        self.assertEqual(nodes[0]["start_time"], 0)
+        self.assertEqual(nodes[-1]["end_time"], n_calls)
+        self.assertEqual(nodes[0]["name"], "f, g")
+
+        with self.assertNumQueries(4):
+            response = self.get("trace_timeline_call_data", id=log.id, data={
+                "start_percent": .5,
+                "end_percent": .75,
+            })
+        nodes = json.loads(response.content)
+        self.assertTrue(all(
+            node["end_time"] >= 1500 and node["start_time"] <= 2250
+            for node in nodes
+        ))
+        self.assertTrue(all(
+            node["end_time"] - node["start_time"] >= 2 * 750. / 675
+            for node in nodes[:-1]
+        ))
+
+        # Past the most detailed level the calls are read.
+        with self.assertNumQueries(4):
+            response = self.get("trace_timeline_call_data", id=log.id, data={
+                "start_percent": .5,
+                "end_percent": .51,
+            })
+        nodes = json.loads(response.content)
+        self.assertEqual(nodes[0]["start_time"], 1499)
+        self.assertEqual(nodes[-1]["end_time"], 1531)
+
+    def test_overlapping(self):
+        log = self.create_log()
+        other_log = self.create_log()
+        call1 = self.create_call(log=log, start_time=0, end_time=3)
+        call2 = self.create_call(log=log, start_time=3, end_time=5)
+        self.create_call(log=log, start_time=6, end_time=7)
+        self.create_call(log=other_log, start_time=0, end_time=10)
+
+        self.assertQuerysetEqual(
+            log.calls.overlapping(log.id, 2, 4).order_by("start_time"),
+            [call1.id, call2.id],
+            attrgetter("id"),
+        )
+        self.assertQuerysetEqual(
+            Call.objects.filter(log=log).overlapping(log.id, 5, 5.5),
+            [call2.id],
+            attrgetter("id"),
+        )
+
+    def test_call_indexes(self):
+        # The test database is SQLite.
+        cursor = connection.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s", [Call._meta.db_table])
+        names = {name for name, in cursor.fetchall()}
+        self.assertTrue({
+            "traces_call_log_id_start_time",
+            "traces_call_log_id_end_time",
+            "traces_call_log_id_function_id",
+            "traces_call_log_id_name",
+        } <= names)
+
     def test_call_data(self):
         log = self.create_log()
         call1 = self.create_call(log=log, name="a", start_time=0, end_time=2)
@@ -392,6 +1282,27 @@ class CallDataTests(BaseTraceTests):
             "func_exclusive_time": 2,
         })
 
+    def test_call_data_functions(self):
+        log = self.create_log()
+        f1 = log.functions.create(name="f", filename="x.py", lineno=1)
+        f2 = log.functions.create(name="f", filename="y.py", lineno=1)
+        call1 = self.create_call(log=log, name="f", start_time=0, end_time=2)
+        call2 = self.create_call(log=log, name="f", start_time=2, end_time=3)
+        call1.function = f1
+        call1.save()
+        call2.function = f2
+        call2.save()
+
+        response = self.get("trace_call_data", id=log.id, data={
+            "call_id": call1.id,
+        })
+        self.assert_json_response(response, {
+            "call_time": 2,
+            "call_exclusive_time": 2,
+            "func_time": 2,
+            "func_exclusive_time": 2,
+        })
+
     def test_call_data_multiple_subcall(self):
         log = self.create_log()
         call = self.create_call(log=log, name="a", start_time=0, end_time=10)
@@ -406,4 +1317,154 @@ class CallDataTests(BaseTraceTests):
             "call_exclusive_time": 2,
             "func_time": 10,
             "func_exclusive_time": 2,
-        })
\ No newline at end of file
+        })
+    def test_function_summaries(self):
+        # main calls f 10 times, each f calls g, and f recurses once at the end.
+        n = 10
+        symbol_ids = [0]
+        start_times = [0]
+        end_times = [100]
+        parents = [-1]
+        depths = [0]
+        for i in xrange(n):
+            symbol_ids += [1, 2]
+            start_times += [i * 10, i * 10]
+            end_times += [i * 10 + i + 1, i * 10 + 1]
+            parents += [0, len(parents)]
+            depths += [1, 2]
+        symbol_ids.append(1)
+        start_times.append(95)
+        end_times.append(96)
+        parents.append(len(parents) - 2)
+        depths.append(2)
+        log = self.create_log()
+        ingest_log(log, {
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "calls": {
+                "symbols": [
+                    {"name": "main", "filename": "x.py", "lineno": 1},
+                    {"name": "f", "filename": "x.py", "lineno": 2},
+                    {"name": "g", "filename": "x.py", "lineno": 3},
+                ],
+                "symbol_ids": symbol_ids,
+                "start_times": start_times,
+                "end_times": end_times,
+                "parents": parents,
+                "depths": depths,
+            },
+        })
+
+        summaries = {
+            summary.name: summary
+            for summary in log.function_summaries.all()
+        }
+        self.assertEqual(len(summaries), 3)
+        self.assert_attributes(summaries["main"],
+            call_count=1, total_time=100, exclusive_time=100 - 55, min_time=100,
+            max_time=100, median_time=100,
+        )
+        self.assert_attributes(summaries["f"],
+            call_count=11, total_time=56, exclusive_time=56 - 10 - 1, min_time=1,
+            max_time=10, median_time=5, p90_time=9, p99_time=10,
+        )
+        self.assert_attributes(summaries["g"],
+            call_count=10, total_time=10, exclusive_time=10,
+        )
+        self.assertEqual(summaries["f"].function, log.functions.get(name="f"))
+
+        main = log.calls.get(name="main")
+        self.assert_attributes(main, exclusive_time=45, subtree_size=2 * n + 2, subtree_depth=2)
+        recursing = log.calls.filter(name="f", call_depth=1).order_by("-start_time")[0]
+        self.assert_attributes(recursing, exclusive_time=8, subtree_size=3, subtree_depth=1)
+
+        call = log.calls.filter(name="f").order_by("start_time")[0]
+        with self.assertNumQueries(4):
+            response = self.get("trace_call_data", id=log.id, data={
+                "call_id": call.id,
+            })
+        self.assert_json_response(response, {
+            "call_time": 1,
+            "call_exclusive_time": 0,
+            "func_time": 56,
+            "func_exclusive_time": 45,
+        })
+
+    def test_function_summaries_nested(self):
+        log = self.create_log()
+        ingest_log(log, {
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "calls": [
+                {
+                    "type": "python",
+                    "name": "a",
+                    "start_time": 0,
+                    "end_time": 2,
+                    "subcalls": [
+                        {
+                            "type": "python",
+                            "name": "b",
+                            "start_time": .5,
+                            "end_time": 1.5,
+                            "subcalls": [],
+                        },
+                    ],
+                },
+                {
+                    "type": "python",
+                    "name": "a",
+                    "start_time": 2,
+                    "end_time": 3,
+                    "subcalls": [],
+                },
+            ],
+        })
+
+        summary = log.function_summaries.get(name="a")
+        self.assert_attributes(summary,
+            function=None, call_count=2, total_time=3, exclusive_time=2,
+        )
+        call = log.calls.get(name="b")
+        self.assertEqual(call.function_summary(), log.function_summaries.get(name="b"))
+
+    def test_top_functions(self):
+        log = self.create_log()
+        ingest_log(log, {
+            "command": "pypy x.py",
+            "stdout": "",
+            "stderr": "",
+            "runtime": 0,
+            "calls": [
+                {
+                    "type": "python",
+                    "name": name,
+                    "start_time": i,
+                    "end_time": i + i,
+                    "subcalls": [],
+                }
+                for i, name in enumerate(["a", "b", "c"], 1)
+            ],
+        })
+
+        response = self.get("trace_functions", id=log.id)
+        self.assertEqual(
+            [summary.name for summary in response.context["summaries"]],
+            ["c", "b", "a"],
+        )
+        response = self.get("trace_functions", id=log.id, data={"order_by": "call_count; DROP TABLE"})
+        self.assertEqual(response.context["order_by"], "exclusive_time")
+
+    def test_benchmark_views(self):
+        # Run twice, so the views' pages are already cached the second time.
+        for i in xrange(2):
+            output = StringIO()
+            call_command("benchmark_views", calls=50, repeat=2, stdout=output)
+            lines = output.getvalue().splitlines()[1:]
+            self.assertEqual(len(lines), 8)
+            for line in lines:
+                self.assertNotIn(" 0 queries", line)
@@ -0,0 +1,133 @@
+import colorsys
+import itertools
+import math
+from collections import namedtuple
+
+
+# The width of the timeline, in pixels.
+TIMELINE_WIDTH = 675
+# Nodes narrower than this many pixels are merged with the ones after them.
+MIN_NODE_WIDTH = 2
+MAX_LEVELS = 16
+# Merged nodes only list this many of the names in them.
+MAX_NAMES = 10
+
+CallNode = namedtuple("CallNode", ["name", "start_time", "end_time", "depth", "color", "call_id"])
+
+
+def generate_colors():
+    # Code from Marty Alchin
+    for i in itertools.count():
+        h = i * .15
+        s = .3 + ((i * .15) % .7)
+        v = .3 + (((i + 3) * .15) % .7)
+        r, g, b = colorsys.hsv_to_rgb(h, s, v)
+        yield int(r * 255), int(g * 255), int(b * 255)
+
+def format_color(color):
+    return "#%02X%02X%02X" % color
+
+def merge_nodes(node1, node2):
+    assert node1.depth == node2.depth
+    names = node1.name | node2.name
+    if len(names) > MAX_NAMES:
+        names = frozenset(sorted(names)[:MAX_NAMES])
+    start_time = min(node1.start_time, node2.start_time)
+    end_time = max(node1.end_time, node2.end_time)
+
+    node1_time = node1.end_time - node1.start_time
+    node2_time = node2.end_time - node2.start_time
+    if node1_time + node2_time:
+        node1_weight = float(node1_time) / (node1_time + node2_time)
+    else:
+        node1_weight = .5
+    node2_weight = 1 - node1_weight
+    r = node1.color[0] * node1_weight + node2.color[0] * node2_weight
+    g = node1.color[1] * node1_weight + node2.color[1] * node2_weight
+    b = node1.color[2] * node1_weight + node2.color[2] * node2_weight
+    return CallNode(names, start_time, end_time, node1.depth, (int(r), int(g), int(b)), None)
+
+
+class NodeMerger(object):
+    # Merges the nodes at each depth which are narrower than MIN_NODE_WIDTH
+    # pixels (of ``pixel_time``) into the ones after them. Nodes are added in
+    # order of start time for each depth, but depths can be interleaved, as
+    # calls are.
+    def __init__(self, pixel_time):
+        self.min_time = MIN_NODE_WIDTH * pixel_time
+        self.depths = {}
+        self._pending = {}
+
+    def add(self, node):
+        pending = self._pending.get(node.depth)
+        if pending is None:
+            self._pending[node.depth] = node
+        elif pending.end_time - pending.start_time < self.min_time:
+            self._pending[node.depth] = merge_nodes(pending, node)
+        else:
+            self.depths.setdefault(node.depth, []).append(pending)
+            self._pending[node.depth] = node
+
+    def finish(self):
+        for depth, node in self._pending.iteritems():
+            self.depths.setdefault(depth, []).append(node)
+        self._pending = {}
+        return self.depths
+
+
+def level_for_window(fraction):
+    # The coarsest level which is at least as detailed as showing
+    # ``fraction`` of the whole timeline.
+    if fraction <= 0:
+        return MAX_LEVELS
+    return max(0, int(math.ceil(math.log(1 / fraction, 2) - 1e-9)))
+
+def level_pixel_time(level, start_time, end_time):
+    return float(end_time - start_time) / (TIMELINE_WIDTH * 2 ** level)
+
+
+class TimelineBuilder(object):
+    # Builds the timeline pyramid for a log as its calls are added: level 0 is
+    # the whole timeline at TIMELINE_WIDTH pixels, each level after that is
+    # twice as detailed. At level L merged nodes are at least MIN_NODE_WIDTH
+    # pixels wide, so there are at most about TIMELINE_WIDTH * 2 ** L / 2 per
+    # depth. Only levels with at most half as many nodes as there are calls
+    # are built, past that the calls are read instead.
+    def __init__(self, n_calls, n_depths, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.levels = 0
+        if n_calls and end_time > start_time:
+            while (self.levels < MAX_LEVELS and
+                n_depths * (TIMELINE_WIDTH * 2 ** self.levels // MIN_NODE_WIDTH + 1) <= n_calls // 2):
+                self.levels += 1
+        self._merger = None
+        if self.levels:
+            self._merger = NodeMerger(level_pixel_time(self.levels - 1, start_time, end_time))
+        self._colors = {}
+        self._color_generator = generate_colors()
+
+    def add(self, depth, start_time, end_time, name, call_id):
+        if self._merger is None:
+            return
+        if name not in self._colors:
+            self._colors[name] = next(self._color_generator)
+        self._merger.add(CallNode(
+            frozenset([name]), start_time, end_time, depth, self._colors[name], call_id
+        ))
+
+    def finish(self):
+        # Yields (level, depth, node) for each level, most detailed first.
+        if self._merger is None:
+            return
+        depths = self._merger.finish()
+        for level in reversed(xrange(self.levels)):
+            if level != self.levels - 1:
+                merger = NodeMerger(level_pixel_time(level, self.start_time, self.end_time))
+                for depth, nodes in sorted(depths.iteritems()):
+                    for node in nodes:
+                        merger.add(node)
+                depths = merger.finish()
+            for depth, nodes in depths.iteritems():
+                for node in nodes:
+                    yield level, depth, node
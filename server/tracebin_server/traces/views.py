@@ -1,21 +1,54 @@
-import colorsys
-import itertools
-import json
-import zlib
-from collections import defaultdict, namedtuple
+from collections import defaultdict
 from operator import attrgetter
 
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import transaction
 from django.db.models import Sum, Min, Max
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.csrf import csrf_exempt
 
 from tracebin_server.utils import JSONResponse
 
-from .models import (Log, RuntimeEnviroment, PythonTrace, TraceSection,
-    ResOpChunk, PythonChunk, Call)
-
-
+from .caching import cache_log_page
+from .ingest import enqueue_upload, UPLOAD_ENCODINGS, UPLOAD_READ_SIZE
+from .models import Log, TraceChunk, ResOp, ResOpArg, FunctionSummary, TimelineNode
+from .timeline import (CallNode, NodeMerger, TIMELINE_WIDTH, generate_colors,
+    format_color, level_for_window)
+from .workers import submit_upload
+
+
+def _iter_chunked(stream):
+    # For WSGI servers which hand us the raw chunked body, like the
+    # development server.
+    while True:
+        size = int(stream.readline().split(";", 1)[0], 16)
+        if size == 0:
+            break
+        yield stream.read(size)
+        stream.readline()
+    # Trailers, up to the blank line.
+    while stream.readline().strip():
+        pass
+
+def _iter_stream(stream):
+    while True:
+        chunk = stream.read(UPLOAD_READ_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+def _iter_upload(request):
+    if request.META.get("HTTP_TRANSFER_ENCODING") == "chunked":
+        # There's no Content-length, which Django needs to limit reads from
+        # the body, so read from the WSGI server directly.
+        stream = request.environ["wsgi.input"]
+        if request.environ.get("wsgi.input_terminated"):
+            return _iter_stream(stream)
+        return _iter_chunked(stream)
+    return _iter_stream(request)
+
+@cache_log_page
 def trace_overview(request, id):
     log = get_object_or_404(Log, id=id)
     return render(request, "traces/trace/overview.html", {
@@ -24,111 +57,31 @@ def trace_overview(request, id):
     })
 
 @csrf_exempt
-@transaction.commit_on_success
 def trace_upload(request):
     if request.method == "GET":
         return render(request, "traces/trace/new.html")
     assert request.method == "POST"
     assert request.META["CONTENT_TYPE"] == "application/json"
-    encoding = request.META.get("CONTENT_ENCODING")
-    if encoding == "gzip":
-        raw_data = zlib.decompress(request.raw_post_data)
-    elif encoding is None:
-        raw_data = request.raw_post_data
-    else:
+    encoding = request.META.get("HTTP_CONTENT_ENCODING")
+    if encoding is not None and encoding not in UPLOAD_ENCODINGS:
         raise NotImplementedError(encoding)
-    data = json.loads(raw_data)
-    # They're all public=True until we have authentication for the client.
-    log = Log.objects.create(
-        public=True,
-        command=data.get("command", u""),
-        stdout=data.get("stdout", u""),
-        stderr=data.get("stderr", u""),
-        runtime=data.get("runtime"),
-    )
-    for key, value in data.get("options", {}).iteritems():
-        if key == "jit":
-            kind = RuntimeEnviroment.JIT_OPTION
-        elif key == "gc":
-            kind = RuntimeEnviroment.GC_OPTION
-        elif key == "build":
-            kind = RuntimeEnviroment.BUILD_OPTION
-
-        for key, value in value.iteritems():
-            log.enviroment_options.create(kind=kind, key=key, value=value)
-
-    for trace in data.get("traces", []):
-        kwargs = {"log": log}
-        if trace["type"] == "python":
-            kwargs["root_file"] = trace["root_file"]
-            kwargs["root_function"] = trace["root_function"]
-            cls = PythonTrace
-
-        trace_obj = cls.objects.create(**kwargs)
-        for i, section in enumerate(trace["sections"]):
-            if section["label"] == "Entry":
-                label = TraceSection.ENTRY
-            elif section["label"] == "Preamble":
-                label = TraceSection.PREAMBLE
-            elif section["label"] == "Loop body":
-                label = TraceSection.LOOP_BODY
-
-            section_obj = trace_obj.sections.create(ordering=i, label=label)
-            for i, chunk in enumerate(section["chunks"]):
-                kwargs = {
-                    "section": section_obj,
-                    "ordering": i,
-                }
-                if chunk["type"] == "resop":
-                    cls = ResOpChunk
-                    kwargs["raw_source"] = chunk["ops"]
-                elif chunk["type"] == "python":
-                    cls = PythonChunk
-                    kwargs["raw_source"] = chunk["source"]
-                    assert sorted(chunk["linenos"]) == chunk["linenos"]
-                    kwargs["start_line"] = chunk["linenos"][0]
-                    kwargs["end_line"] = chunk["linenos"][-1] + 1
-                cls.objects.create(**kwargs)
-
-
-    _add_calls(log, data.get("calls"))
-    return redirect(log)
-
-def _add_calls(log, calls, parent=None):
-    if calls is None:
-        return
-    if parent is None:
-        depth = 0
-    else:
-        depth = parent.call_depth + 1
-    # These are calls which can be grouped together into a single insert.
-    no_children_calls = []
-    for call in calls:
-        kwargs = {
-            "start_time": call["start_time"],
-            "end_time": call["end_time"],
-            "call_depth": depth,
-            "name": call["name"],
-            "parent": parent,
-            "log": log,
-        }
-        if call["subcalls"]:
-            inst = Call.objects.create(**kwargs)
-            _add_calls(log, call["subcalls"], parent=inst)
-        else:
-            no_children_calls.append(Call(**kwargs))
-    if no_children_calls:
-        Call.objects.bulk_create(no_children_calls)
-
-
-
+    # The upload is only saved here, it's processed once it's been committed,
+    # in the background unless INGEST_ASYNC is off.
+    with transaction.commit_on_success():
+        job = enqueue_upload(_iter_upload(request), encoding)
+    submit_upload(job.id)
+    return redirect(job.log)
+
+@cache_log_page
 def trace_compiled_list(request, id):
     log = get_object_or_404(Log, id=id)
     return render(request, "traces/trace/compiled_list.html", {
         "page": "compiled",
         "log": log,
+        "asm_size": log.traces.aggregate(asm_size=Sum("asm_size"))["asm_size"],
     })
 
+@cache_log_page
 def trace_timeline(request, id):
     log = get_object_or_404(Log, id=id)
     return render(request, "traces/trace/timeline.html", {
@@ -136,71 +89,160 @@ def trace_timeline(request, id):
         "log": log,
     })
 
+FUNCTION_ORDERINGS = ["exclusive_time", "total_time", "call_count", "max_time"]
+TOP_FUNCTIONS = 50
+
+@cache_log_page
+def trace_functions(request, id):
+    log = get_object_or_404(Log, id=id)
+    order_by = request.GET.get("order_by")
+    if order_by not in FUNCTION_ORDERINGS:
+        order_by = FUNCTION_ORDERINGS[0]
+    summaries = log.function_summaries.select_related("function").order_by("-" + order_by)
+    return render(request, "traces/trace/functions.html", {
+        "page": "functions",
+        "log": log,
+        "order_by": order_by,
+        "summaries": summaries[:TOP_FUNCTIONS],
+    })
+
+CHUNKS_PER_PAGE = 100
+
+@cache_log_page
 def trace_compiled_detail(request, id, compiled_id):
     log = get_object_or_404(Log, id=id)
     trace = get_object_or_404(log.traces.all(), id=compiled_id)
-    return render(request, "traces/trace/compiled_detail.html", {
+    trace.log = log
+    # Big traces are shown a page of chunks at a time, the rest are loaded as
+    # they're asked for, see traces/trace/compiled_detail.html.
+    sections = trace.sections.annotate(first_chunk=Min("chunks__ordering"), last_chunk=Max("chunks__ordering"))
+    sections = dict((section.id, section) for section in sections)
+    chunks = TraceChunk.objects.filter(section__trace=trace).order_by("section__ordering", "ordering")
+    try:
+        chunk_page = Paginator(chunks, CHUNKS_PER_PAGE).page(request.GET.get("page", 1))
+    except (EmptyPage, PageNotAnInteger):
+        raise Http404
+    page_chunks = list(chunk_page.object_list)
+    page_sections = []
+    for chunk in page_chunks:
+        section = sections[chunk.section_id]
+        if not page_sections or page_sections[-1][0] is not section:
+            page_sections.append((section, []))
+        page_sections[-1][1].append(chunk)
+    # The ops of the chunks which have them as ResOps, and then their args,
+    # for all of the page at once.
+    op_chunks = dict(
+        (chunk.id, chunk) for chunk in page_chunks
+        if getattr(chunk, "op_count", 0)
+    )
+    for chunk in op_chunks.itervalues():
+        chunk.ops = []
+    if op_chunks:
+        resops = {}
+        for resop in (ResOp.objects.filter(chunk__in=op_chunks.keys())
+            .select_related("descr", "result").order_by("chunk", "ordering")):
+            resop._args = ([], [])
+            resops[resop.id] = resop
+            op_chunks[resop.chunk_id].ops.append(resop)
+        args = ResOpArg.objects.filter(op__chunk__in=op_chunks.keys()).select_related("value")
+        for arg in args.order_by("op", "ordering"):
+            resops[arg.op_id]._args[arg.is_fail_arg].append(arg.value.text)
+    # Sections without any chunks go on the page they'd have been on: from
+    # the section of the page's first chunk, up to the section of the next
+    # page's first chunk.
+    start = page_sections[0][0].ordering if chunk_page.has_previous() else float("-inf")
+    end = float("inf")
+    if chunk_page.has_next():
+        last_section = page_sections[-1][0]
+        if page_chunks[-1].ordering < last_section.last_chunk:
+            end = last_section.ordering
+        else:
+            end = min(
+                section.ordering for section in sections.itervalues()
+                if section.first_chunk is not None and section.ordering > last_section.ordering
+            )
+    page_sections.extend(
+        (section, [])
+        for section in sections.itervalues()
+        if section.first_chunk is None and start <= section.ordering < end
+    )
+    page_sections.sort(key=lambda (section, chunks): section.ordering)
+
+    if request.GET.get("partial"):
+        template = "traces/partials/compiled_chunks.html"
+    else:
+        template = "traces/trace/compiled_detail.html"
+    return render(request, template, {
         "page": "compiled",
         "log": log,
         "trace": trace,
+        "chunk_page": chunk_page,
+        "sections": page_sections,
     })
 
-CallNode = namedtuple("CallNode", ["name", "start_time", "end_time", "depth", "color"])
-
-SATURATION = .8
-VALUE = .8
-
-def generate_colors():
-    # Code from Marty Alchin
-    for i in itertools.count():
-        h = i * .15
-        s = .3 + ((i * .15) % .7)
-        v = .3 + (((i + 3) * .15) % .7)
-        r, g, b = colorsys.hsv_to_rgb(h, s, v)
-        yield int(r * 255), int(g * 255), int(b * 255)
-
-def compute_pixels(node, slice_start, slice_end):
-    slice_width = slice_end - slice_start
-    return 675 * ((node.end_time - node.start_time) / slice_width)
-
-def merge_nodes(node1, node2):
-    names = node1.name | node2.name
-    start_time = min(node1.start_time, node2.start_time)
-    end_time = max(node1.start_time, node2.start_time)
-    assert node1.depth == node2.depth
-
-    node1_weight = (node1.end_time - node1.start_time) / (end_time - start_time)
-    node2_weight = (node2.end_time - node2.start_time) / (end_time - start_time)
-    r = node1.color[0] * node1_weight + node2.color[0] * node2_weight
-    g = node1.color[1] * node1_weight + node2.color[1] * node2_weight
-    b = node1.color[2] * node1_weight + node2.color[2] * node2_weight
-    return CallNode(names, start_time, end_time, node1.depth, (int(r), int(g), int(b)))
-
+@cache_log_page
 def trace_timeline_call_data(request, id):
     log = get_object_or_404(Log, id=id)
 
     start_percent = float(request.GET.get("start_percent", 0))
     end_percent = float(request.GET.get("end_percent", 1))
 
-    absolute_start_end = log.calls.aggregate(Min("start_time"), Max("end_time"))
-    absolute_start = absolute_start_end["start_time__min"]
-    absolute_end = absolute_start_end["end_time__max"]
+    level = level_for_window(end_percent - start_percent)
+    if level < log.timeline_levels:
+        nodes = _timeline_level_nodes(log, level, start_percent, end_percent)
+    else:
+        nodes = _timeline_call_nodes(log, start_percent, end_percent)
+    return JSONResponse(nodes)
 
-    filters = {
-        "end_time__gte": absolute_start + (start_percent * (absolute_end - absolute_start)),
-        "start_time__lte": absolute_start + (end_percent * (absolute_end - absolute_start)),
-    }
+def _timeline_start_end(log):
+    if log.timeline_levels:
+        # Level 0 covers everything, and is only a few thousand nodes at most.
+        qs = log.timeline_nodes.filter(level=0)
+    else:
+        qs = log.calls.all()
+    absolute_start_end = qs.aggregate(Min("start_time"), Max("end_time"))
+    return absolute_start_end["start_time__min"], absolute_start_end["end_time__max"]
+
+def _timeline_level_nodes(log, level, start_percent, end_percent):
+    absolute_start, absolute_end = _timeline_start_end(log)
+
+    nodes = log.timeline_nodes.filter(level=level).overlapping(
+        TimelineNode.interval_key(log.id, level),
+        absolute_start + (start_percent * (absolute_end - absolute_start)),
+        absolute_start + (end_percent * (absolute_end - absolute_start)),
+    ).order_by("depth", "start_time")
+    return [
+        {
+            "name": node.names,
+            "start_time": node.start_time,
+            "end_time": node.end_time,
+            "depth": node.depth,
+            "color": node.color,
+        }
+        for node in nodes.iterator()
+    ]
+
+def _timeline_call_nodes(log, start_percent, end_percent):
+    # Logs with too few calls to have timeline levels, or zoomed in past the
+    # most detailed one, the calls are merged here.
+    absolute_start, absolute_end = _timeline_start_end(log)
+    if absolute_start is None:
+        return []
 
     data = defaultdict(list)
-    calls = log.calls.filter(**filters)
+    calls = log.calls.overlapping(
+        log.id,
+        absolute_start + (start_percent * (absolute_end - absolute_start)),
+        absolute_start + (end_percent * (absolute_end - absolute_start)),
+    )
     color_generator = generate_colors()
     known_colors = {}
     for call in calls.iterator():
         if call.name not in known_colors:
             known_colors[call.name] = color_generator.next()
         data[call.call_depth].append(CallNode(
-            {call.name}, call.start_time, call.end_time, call.call_depth,
-            known_colors[call.name]
+            frozenset([call.name]), call.start_time, call.end_time, call.call_depth,
+            known_colors[call.name], call.id
         ))
 
     slice_start = float("inf")
@@ -209,37 +251,52 @@ def trace_timeline_call_data(request, id):
         slice_start = min(slice_start, min(map(attrgetter("start_time"), calls)))
         slice_end = max(slice_end, max(map(attrgetter("end_time"), calls)))
 
-    for depth, calls in data.items():
-        new_calls = []
-        iterator = iter(sorted(calls, key=attrgetter("start_time")))
-        for node in iterator:
-            while compute_pixels(node, slice_start, slice_end) < 2:
-                try:
-                    next_node = iterator.next()
-                except StopIteration:
-                    break
-                node = merge_nodes(node, next_node)
-            new_calls.append(node)
-        data[depth] = new_calls
-
-
-    return JSONResponse([
+    merger = NodeMerger((slice_end - slice_start) / TIMELINE_WIDTH)
+    for depth, calls in sorted(data.iteritems()):
+        for node in sorted(calls, key=attrgetter("start_time")):
+            merger.add(node)
+
+    return [
         {
             "name": ", ".join(node.name),
             "start_time": node.start_time,
             "end_time": node.end_time,
             "depth": node.depth,
-            "color": "#%02X%02X%02X" % node.color,
+            "color": format_color(node.color),
         }
-        for depth in data.itervalues() for node in depth
-    ])
+        for depth, nodes in sorted(merger.finish().iteritems()) for node in nodes
+    ]
 
+@cache_log_page
 def trace_call_data(request, id):
     log = get_object_or_404(Log, id=id)
     call = get_object_or_404(log.calls.all(), id=request.GET["call_id"])
 
     call_time = call.end_time - call.start_time
+    if call.exclusive_time is not None:
+        call_exclusive_time = call.exclusive_time
+    else:
+        call_exclusive_time = _call_exclusive_time(call)
+
+    try:
+        summary = call.function_summary()
+    except FunctionSummary.DoesNotExist:
+        func_time, func_exclusive_time = _function_times(call)
+    else:
+        func_time = summary.total_time
+        func_exclusive_time = summary.exclusive_time
 
+    data = {
+        "call_time": call_time,
+        "call_exclusive_time": call_exclusive_time,
+        "func_time": func_time,
+        "func_exclusive_time": func_exclusive_time,
+    }
+    return JSONResponse(data)
+
+# For calls which weren't added by ingest_log, which have no exclusive time or
+# FunctionSummary.
+def _call_exclusive_time(call):
     subcall_times = call.subcalls.aggregate(
         total_start_time=Sum("start_time"),
         total_end_time=Sum("end_time")
@@ -248,9 +305,10 @@ def trace_call_data(request, id):
     call_total_subcall_end_time = subcall_times["total_end_time"] or 0
     call_subcall_time = call_total_subcall_end_time - call_total_subcall_start_time
 
-    call_exclusive_time = call_time - call_subcall_time
+    return call.end_time - call.start_time - call_subcall_time
 
-    func_times = log.calls.filter(name=call.name).aggregate(
+def _function_times(call):
+    func_times = call.same_function_calls().aggregate(
         total_start_time=Sum("start_time"),
         total_end_time=Sum("end_time"),
     )
@@ -259,7 +317,7 @@ def trace_call_data(request, id):
 
     func_time = func_total_end_time - func_total_start_time
 
-    func_subcall_times = log.calls.filter(name=call.name).aggregate(
+    func_subcall_times = call.same_function_calls().aggregate(
         total_subcalls_start_time=Sum("subcalls__start_time"),
         total_subcalls_end_time=Sum("subcalls__end_time"),
     )
@@ -268,11 +326,4 @@ def trace_call_data(request, id):
     func_subcalls_time = func_total_subcall_end_time - func_total_subcall_start_time
 
     func_exclusive_time = func_time - func_subcalls_time
-
-    data = {
-        "call_time": call_time,
-        "call_exclusive_time": call_exclusive_time,
-        "func_time": func_time,
-        "func_exclusive_time": func_exclusive_time,
-    }
-    return JSONResponse(data)
\ No newline at end of file
+    return func_time, func_exclusive_time
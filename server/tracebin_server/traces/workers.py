@@ -0,0 +1,57 @@
+import Queue
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from .ingest import process_upload
+
+
+class IngestPool(object):
+    # Processes uploads in a pool of threads, each with its own database
+    # connection.
+    def __init__(self, n_workers):
+        self.queue = Queue.Queue()
+        self.threads = [
+            threading.Thread(target=self._run, name="tracebin-ingest-{:d}".format(i))
+            for i in xrange(n_workers)
+        ]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, job_id):
+        self.queue.put(job_id)
+
+    def join(self):
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            job_id = self.queue.get()
+            try:
+                process_upload(job_id)
+            finally:
+                connection.close()
+                self.queue.task_done()
+
+
+def _worker_count():
+    # On SQLite ids are allocated from MAX(id), see ingest.BulkInserter, so
+    # two uploads processed at once could both be given the same ones.
+    if connection.vendor == "sqlite":
+        return 1
+    return settings.INGEST_WORKERS
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def submit_upload(job_id):
+    global _pool
+    if not settings.INGEST_ASYNC:
+        process_upload(job_id)
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = IngestPool(_worker_count())
+    _pool.submit(job_id)